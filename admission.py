@@ -0,0 +1,179 @@
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterator, Optional, Tuple
+
+from ai_executor import RequestCancelled, cooperative_sleep
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request is not admitted. ``status`` is 'rate_limited' (the
+    client is over its rate) or 'overloaded' (the wait queue is full or the
+    wait timed out); ``retry_after`` is a whole number of seconds.
+    """
+
+    def __init__(self, status: str, message: str, retry_after: int):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class TokenBuckets:
+    """
+    One token bucket per client: ``rate`` tokens per second, at most ``burst``
+    saved up. Only the ``max_clients`` most recently seen clients are kept; a
+    forgotten client starts again with a full bucket.
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_clients = max(1, max_clients)
+        self._buckets: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()  # client -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, client: str) -> float:
+        """Takes one token; returns 0 when one was available, else the seconds until there is one."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class _Waiter:
+    __slots__ = ('granted',)
+
+    def __init__(self):
+        self.granted = False
+
+
+class AdmissionController:
+    """
+    Decides whether a request may start: first the client's token bucket
+    (``rate`` per second, ``burst``; 0 disables it), then a cap of
+    ``max_concurrent`` admitted requests (0 disables it). Requests over the
+    cap wait first-in first-out, at most ``max_queue`` of them and for at most
+    ``queue_timeout`` seconds; anything else is rejected at once, so a spike
+    turns into fast 429/503 responses instead of every request slowing down.
+    Waiting polls cooperatively, like ``ai_executor.wait_for_future``.
+    """
+
+    def __init__(self, rate: float = 0.0, burst: float = 1.0, max_concurrent: int = 0, max_queue: int = 0,
+                 queue_timeout: float = 2.0, max_clients: int = 10000):
+        self.buckets = TokenBuckets(rate, burst, max_clients) if rate > 0 else None
+        self.max_concurrent = max(0, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._waiters: Deque[_Waiter] = deque()
+        self._hold_seconds = 1.0  # Moving average of how long an admitted request holds its slot.
+        self.active = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rate_limited = 0
+        self.shed = 0
+        self.timed_out = 0
+        self.cancelled = 0
+
+    def _retry_after(self) -> int:
+        """Seconds until a slot is likely free for a newcomer; must be called with ``_lock`` held."""
+        ahead = len(self._waiters) + 1
+        return max(1, math.ceil(self._hold_seconds * ahead / max(1, self.max_concurrent)))
+
+    def _reject_overloaded(self, reason: str) -> AdmissionRejected:
+        return AdmissionRejected('overloaded', f"The AI service is busy ({reason}); please retry later.",
+                                 self._retry_after())
+
+    def acquire(self, client: Optional[str] = None, is_cancelled: Optional[Callable[[], bool]] = None,
+                poll_interval: float = 0.002, max_poll_interval: float = 0.02):
+        """
+        Returns once the request holds a slot (pair it with ``release``).
+        Raises AdmissionRejected, or RequestCancelled when ``is_cancelled``
+        turns True while waiting. ``client`` None skips the rate limit.
+        """
+        if self.buckets is not None and client is not None:
+            wait = self.buckets.take(client)
+            if wait:
+                with self._lock:
+                    self.rate_limited += 1
+                raise AdmissionRejected('rate_limited', "Too many AI requests; please slow down.", math.ceil(wait))
+        with self._lock:
+            if not self.max_concurrent or (self.active < self.max_concurrent and not self._waiters):
+                self.active += 1
+                self.admitted += 1
+                return
+            if len(self._waiters) >= self.max_queue:
+                self.shed += 1
+                raise self._reject_overloaded("queue full")
+            waiter = _Waiter()
+            self._waiters.append(waiter)
+            self.queued += 1
+
+        deadline = time.monotonic() + self.queue_timeout
+        interval = poll_interval
+        while not waiter.granted:
+            cancelled = is_cancelled is not None and is_cancelled()
+            if cancelled or time.monotonic() >= deadline:
+                with self._lock:
+                    if waiter.granted:
+                        break  # The slot arrived just now; use it.
+                    self._waiters.remove(waiter)
+                    if cancelled:
+                        self.cancelled += 1
+                        raise RequestCancelled()
+                    self.timed_out += 1
+                    raise self._reject_overloaded("queue wait timed out")
+            cooperative_sleep(interval)
+            interval = min(interval * 2, max_poll_interval)
+        with self._lock:
+            self.admitted += 1
+
+    def release(self, held_seconds: float = 0.0):
+        """Frees a slot, handing it straight to the longest waiter if there is one."""
+        with self._lock:
+            self._hold_seconds += 0.1 * (held_seconds - self._hold_seconds)
+            if self._waiters:
+                self._waiters.popleft().granted = True  # The slot changes hands; ``active`` stays the same.
+            else:
+                self.active -= 1
+
+    @contextmanager
+    def admit(self, client: Optional[str] = None, is_cancelled: Optional[Callable[[], bool]] = None) -> Iterator[None]:
+        """Holds a slot for the duration of the block; see ``acquire``."""
+        self.acquire(client, is_cancelled)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "active": self.active,
+                "waiting": len(self._waiters),
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "rate_limited": self.rate_limited,
+                "shed": self.shed,
+                "timed_out": self.timed_out,
+                "cancelled": self.cancelled,
+                "tracked_clients": len(self.buckets) if self.buckets is not None else 0,
+            }
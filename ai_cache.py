@@ -0,0 +1,190 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Handed to followers when the leader's result was not shareable; they retry instead of returning it.
+_RECOMPUTE = object()
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache for AI answers with single-flight deduplication: while one
+    caller computes a key, concurrent callers for the same key wait for that
+    result instead of starting their own LLM call. With ``path`` set, entries
+    are also written to a SQLite file so they survive restarts.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600.0, path: Optional[str] = None,
+                 max_disk_entries: int = 100000):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self._entries: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._writes_since_prune = 0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS ai_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    # --- Disk backend ---
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[float, Any]]:
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute("SELECT value, expires_at FROM ai_cache WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] <= now:
+            return None
+        return row[1], json.loads(row[0])
+
+    def _disk_set(self, key: str, value: Any, expires_at: float):
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._db.execute("INSERT OR REPLACE INTO ai_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                             (key, json.dumps(value), expires_at))
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= 100:
+                self._writes_since_prune = 0
+                self._db.execute("DELETE FROM ai_cache WHERE expires_at <= ?", (time.time(),))
+                self._db.execute(
+                    "DELETE FROM ai_cache WHERE key IN (SELECT key FROM ai_cache ORDER BY expires_at DESC"
+                    " LIMIT -1 OFFSET ?)", (self.max_disk_entries,))
+
+    # --- Memory tier ---
+
+    def _memory_set(self, key: str, value: Any, expires_at: float):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _lookup(self, key: str, now: float) -> Tuple[bool, Any]:
+        """Must be called with ``_lock`` held."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._entries.move_to_end(key)
+                return True, entry[1]
+            del self._entries[key]
+            self.evictions += 1
+        return False, None
+
+    def get(self, key: str) -> Optional[Any]:
+        """Returns a cached value or None; counts a hit or a miss."""
+        now = time.time()
+        with self._lock:
+            found, value = self._lookup(key, now)
+            if found:
+                self.hits += 1
+                return value
+        entry = self._disk_get(key, now)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._memory_set(key, entry[1], entry[0])
+            return entry[1]
+
+    def set(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._memory_set(key, value, expires_at)
+        self._disk_set(key, value, expires_at)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any],
+                       cacheable: Callable[[Any], bool] = lambda value: True,
+                       wait: Callable[[Future], Any] = Future.result,
+                       shareable: Callable[[Any], bool] = lambda value: True) -> Any:
+        """
+        Returns the cached value for ``key`` or computes it once. Concurrent
+        callers for a key that is being computed share the leader's result,
+        whether or not it turns out to be cacheable, unless ``shareable`` says
+        it only concerns the leader (e.g. its client went away): then one of
+        the waiting callers computes it again with its own ``compute``.
+        ``wait`` is how followers block on the leader's Future (e.g. a
+        hub-friendly wait under eventlet).
+        """
+        while True:
+            now = time.time()
+            leader = False
+            with self._lock:
+                found, value = self._lookup(key, now)
+                if found:
+                    self.hits += 1
+                    return value
+                pending = self._inflight.get(key)
+                if pending is None:
+                    pending = Future()
+                    self._inflight[key] = pending
+                    leader = True
+                else:
+                    self.coalesced += 1
+            if not leader:
+                value = wait(pending)
+                if value is _RECOMPUTE:
+                    continue
+                return value
+
+            try:
+                entry = self._disk_get(key, now)
+                if entry is not None:
+                    with self._lock:
+                        self.hits += 1
+                        self._memory_set(key, entry[1], entry[0])
+                    value = entry[1]
+                else:
+                    with self._lock:
+                        self.misses += 1
+                    value = compute()
+                    if cacheable(value):
+                        self.set(key, value)
+            except BaseException as e:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                pending.set_exception(e)
+                raise
+            # Unregistered before followers wake, so one that must recompute becomes the next leader.
+            with self._lock:
+                self._inflight.pop(key, None)
+            pending.set_result(value if shareable(value) else _RECOMPUTE)
+            return value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "inflight": len(self._inflight),
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "persistent": self._db is not None,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM ai_cache")
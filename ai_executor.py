@@ -0,0 +1,210 @@
+import asyncio
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import CancelledError, Future
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional
+
+try:
+    import greenlet
+except ImportError:  # eventlet (and greenlet) are optional outside the API server
+    greenlet = None
+
+
+class RequestCancelled(Exception):
+    """Raised when the caller gave up on a request (e.g. the client disconnected)."""
+
+
+def in_green_thread() -> bool:
+    """True when running inside an eventlet green thread (i.e. on the API server's hub)."""
+    # Decision: eventlet is looked up, not imported (~0.2s); a process that never loaded it has no green threads.
+    greenthread = sys.modules.get('eventlet.greenthread')
+    return greenthread is not None and greenlet is not None and isinstance(greenlet.getcurrent(), greenthread.GreenThread)
+
+
+def cooperative_sleep(seconds: float):
+    """Sleeps without blocking the eventlet hub when called from a green thread."""
+    if in_green_thread():
+        sys.modules['eventlet'].sleep(seconds)
+    else:
+        time.sleep(seconds)
+
+
+def wait_for_future(future: Future, timeout: Optional[float] = None,
+                    is_cancelled: Optional[Callable[[], bool]] = None, cancel_future: bool = True,
+                    poll_interval: float = 0.005, max_poll_interval: float = 0.05) -> Any:
+    """
+    Waits for a concurrent Future that completes on another OS thread.
+    In a green thread it polls with ``eventlet.sleep`` so other requests keep
+    running; elsewhere it simply blocks. ``is_cancelled`` is checked on every
+    poll; when it returns True the future is cancelled (if ``cancel_future``)
+    and RequestCancelled is raised.
+    """
+    if not in_green_thread() and is_cancelled is None:
+        return future.result(timeout)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    interval = poll_interval
+    while not future.done():
+        if is_cancelled is not None and is_cancelled():
+            if cancel_future:
+                future.cancel()
+            raise RequestCancelled()
+        if deadline is not None and time.monotonic() >= deadline:
+            raise TimeoutError()
+        cooperative_sleep(interval)
+        interval = min(interval * 2, max_poll_interval)
+    return future.result()
+
+
+class StreamHandle:
+    """
+    Receiving end of a streamed call. Chunks produced on the executor loop are
+    handed over through a thread-safe queue; ``chunks`` yields them to the
+    caller, waiting cooperatively between them.
+    """
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self.future: Optional[Future] = None
+
+    def _put(self, kind: str, value: Any = None):
+        self._queue.put((kind, value))
+
+    def _finish(self, future: Future):
+        if future.cancelled():
+            self._put('error', RequestCancelled())
+        elif future.exception() is not None:
+            self._put('error', future.exception())
+        else:
+            self._put('done')
+
+    def cancel(self):
+        if self.future is not None:
+            self.future.cancel()
+
+    def chunks(self, is_cancelled: Optional[Callable[[], bool]] = None,
+               poll_interval: float = 0.005, max_poll_interval: float = 0.05) -> Iterator[Any]:
+        """Yields chunks until the stream ends; re-raises the stream's error (TimeoutError, RequestCancelled...)."""
+        interval = poll_interval
+        while True:
+            try:
+                kind, value = self._queue.get_nowait()
+            except queue.Empty:
+                if is_cancelled is not None and is_cancelled():
+                    self.cancel()
+                    raise RequestCancelled()
+                cooperative_sleep(interval)
+                interval = min(interval * 2, max_poll_interval)
+                continue
+            interval = poll_interval
+            if kind == 'chunk':
+                yield value
+            elif kind == 'done':
+                return
+            else:
+                raise value
+
+
+class AIExecutor:
+    """
+    Runs agent coroutines on one asyncio event loop in a dedicated OS thread,
+    so model calls never block the eventlet hub serving HTTP and SocketIO.
+    At most ``max_concurrency`` calls run at once (others wait in the loop),
+    each call gets a timeout, and cancelling the returned Future cancels the
+    underlying task.
+    """
+
+    def __init__(self, max_concurrency: int = 8, default_timeout: float = 30.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.default_timeout = default_timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.cancelled = 0
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is not None:
+            return self._loop
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                    ready.set()
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=run, name='ai-executor-loop', daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+        return self._loop
+
+    async def _run(self, coro_factory: Callable[[], Awaitable[Any]], timeout: Optional[float]) -> Any:
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            return await asyncio.wait_for(coro_factory(), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise TimeoutError()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.active -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    def submit(self, coro_factory: Callable[[], Awaitable[Any]], timeout: Optional[float] = None) -> Future:
+        """Schedules ``coro_factory()`` on the loop thread and returns a concurrent Future."""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(
+            self._run(coro_factory, self.default_timeout if timeout is None else timeout), loop)
+
+    def run(self, coro_factory: Callable[[], Awaitable[Any]], timeout: Optional[float] = None,
+            is_cancelled: Optional[Callable[[], bool]] = None) -> Any:
+        """Submits a call and waits for it without blocking the hub; see ``wait_for_future``."""
+        future = self.submit(coro_factory, timeout)
+        try:
+            return wait_for_future(future, is_cancelled=is_cancelled)
+        except CancelledError:
+            raise RequestCancelled()
+
+    def stream(self, agen_factory: Callable[[], AsyncIterator[Any]], timeout: Optional[float] = None) -> StreamHandle:
+        """
+        Runs the async generator ``agen_factory()`` on the loop thread under the
+        same concurrency limit and timeout as ``submit`` and returns a handle
+        whose ``chunks()`` yields its items as they are produced.
+        """
+        handle = StreamHandle()
+
+        async def pump():
+            async for chunk in agen_factory():
+                handle._put('chunk', chunk)
+
+        handle.future = self.submit(pump, timeout)
+        handle.future.add_done_callback(handle._finish)
+        return handle
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+        }
@@ -1,130 +1,456 @@
 import os
 import re
+import threading
+import time
+from collections.abc import Mapping
+from functools import lru_cache
 from dotenv import load_dotenv
-from typing import List, Dict, Optional, Any # Added Any
-from pydantic_ai import Agent
-from pydantic_ai.models.gemini import GeminiModel
+from typing import TYPE_CHECKING, List, Dict, Optional, Any, Callable, Iterator, Tuple # Added Any
+import data_store
+from admission import AdmissionController, AdmissionRejected
+from ai_cache import ResponseCache
+from ai_executor import AIExecutor, RequestCancelled, wait_for_future
+from catalog_answers import CatalogAnswerEngine
+from instrumentation import REGISTRY, STAGE_SECONDS, get_logger, timed
+from title_matcher import TitleIndex, normalize_text
 
+if TYPE_CHECKING:
+    from pydantic_ai import Agent
+
+log = get_logger('AI')
 
 # Let's proceed assuming books_data is accessible for now (fix import later)
 try:
     from data_store import books_data, inventory, orders
 except ImportError:
-    print("ERROR in ai_service: Failed to import books_data from app. Using empty data.")
+    log.error("Failed to import books_data from app. Using empty data.")
     books_data = {}
 
 # --- Load Environment Variables ---
 load_dotenv()
-model = GeminiModel('gemini-1.5-flash', provider='google-gla') # Ensure google-gla provider works or remove
+AI_MODEL_NAME = os.getenv('AI_MODEL_NAME', 'gemini-1.5-flash')
 api_key_loaded = os.getenv('GEMINI_API_KEY') or os.getenv('GOOGLE_API_KEY')
 
+# --- Model: pydantic-ai and the Gemini client are imported and built on first use (or by warm_up) ---
+model = None # Set by get_model(); tests and benchmarks may assign their own model instead
+_model_lock = threading.Lock()
+
+def get_model():
+    """Returns the shared model, building it on first use. Raises if it cannot be built."""
+    global model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                started = time.perf_counter()
+                from pydantic_ai.models.gemini import GeminiModel
+                model = GeminiModel(AI_MODEL_NAME, provider='google-gla')
+                log.info("Model %s ready in %.2fs.", AI_MODEL_NAME, time.perf_counter() - started)
+    return model
+
+def _model_unavailable() -> Optional[Dict[str, Any]]:
+    """The error result when there is no usable model, else None."""
+    if not api_key_loaded and model is None:
+        return {"error": "AI model not initialized or API key missing."}
+    try:
+        get_model()
+    except Exception as e:
+        log.error("Could not initialize the AI model: %s", e)
+        return {"error": "AI model not initialized or API key missing."}
+    return None
+
+# --- Agent calls run on a dedicated asyncio loop thread so they never block the eventlet hub ---
+ai_executor = AIExecutor(
+    max_concurrency=int(os.getenv('AI_MAX_CONCURRENCY', '8')),
+    default_timeout=float(os.getenv('AI_REQUEST_TIMEOUT', '30'))
+)
+
+# --- Admission: per-client rate limits and a bounded queue in front of the model (cached answers skip it) ---
+AI_ADMISSION_MAX_CONCURRENT = int(os.getenv('AI_ADMISSION_MAX_CONCURRENT', str(ai_executor.max_concurrency)))
+ai_admission = AdmissionController(
+    rate=float(os.getenv('AI_RATE_LIMIT_PER_SECOND', '2')),
+    burst=float(os.getenv('AI_RATE_LIMIT_BURST', '20')),
+    max_concurrent=AI_ADMISSION_MAX_CONCURRENT,
+    max_queue=int(os.getenv('AI_ADMISSION_QUEUE_SIZE', str(2 * AI_ADMISSION_MAX_CONCURRENT))),
+    queue_timeout=float(os.getenv('AI_ADMISSION_QUEUE_TIMEOUT', '2'))
+)
+
+def get_admission_stats() -> Dict[str, Any]:
+    return ai_admission.stats()
+
+REGISTRY.gauge_callback('library_ai_admission_requests', 'LLM-bound AI requests by admission state.',
+                        lambda: {(key,): value for key, value in ai_admission.stats().items()
+                                 if key in ('active', 'waiting', 'admitted', 'rate_limited', 'shed', 'timed_out')},
+                        ('state',))
+
+def _rejected(rejection: AdmissionRejected, requested_title: Optional[str]) -> Dict[str, Any]:
+    return {"error": str(rejection), "status": rejection.status, "retry_after": rejection.retry_after,
+            "title_match": requested_title}
+
+# --- Answer cache: keyed by matched title + normalized query ---
+response_cache = ResponseCache(
+    max_entries=int(os.getenv('AI_CACHE_MAX_ENTRIES', '1024')),
+    ttl_seconds=float(os.getenv('AI_CACHE_TTL_SECONDS', '3600')),
+    path=os.getenv('AI_CACHE_PATH') or None # Set to a file path to keep answers across restarts
+)
+
+def _cache_key(title: str, user_query: str) -> str:
+    return f"{title}\x1f{normalize_text(user_query).strip(' ?!.')}"
+
+def get_cache_stats() -> Dict[str, Any]:
+    return response_cache.stats()
+
+def get_executor_stats() -> Dict[str, Any]:
+    return ai_executor.stats()
+
+REGISTRY.gauge_callback('library_ai_cache_lookups', 'AI answer cache lookups by result (since start).',
+                        lambda: {(key,): response_cache.stats()[key] for key in ('hits', 'misses', 'coalesced')},
+                        ('result',))
+
+# --- Title index: rebuilt only when data_store.catalog_version changes ---
+_title_index = TitleIndex()
+_available_titles_cache: Optional[List[str]] = None
+_available_titles_version: Optional[int] = None
+# Decision: Both indexes are synced in place, and warm_up does it from an OS thread; one lock covers syncs and lookups.
+_catalog_index_lock = threading.RLock()
+
+def _sync_title_index():
+    with _catalog_index_lock:
+        if _title_index.version != data_store.catalog_version:
+            _title_index.sync(books_data, data_store.catalog_version)
+
+def _match_catalog_title(query: str) -> Optional[str]:
+    with _catalog_index_lock:
+        _sync_title_index()
+        return _title_index.match(query)
+
+# --- Catalog answers: structured questions are answered from books_data/inventory without the LLM ---
+catalog_answers = CatalogAnswerEngine(match_title=_match_catalog_title)
+
+def _sync_catalog_answers():
+    with _catalog_index_lock:
+        if catalog_answers.version != data_store.catalog_version:
+            catalog_answers.sync(books_data, data_store.catalog_version)
+
+def answer_from_catalog(user_query: str) -> Optional[Dict[str, Any]]:
+    """Returns a structured catalog answer, or None when the query needs the LLM."""
+    try:
+        with _catalog_index_lock:
+            _sync_catalog_answers()
+            return catalog_answers.answer(user_query, inventory)
+    except Exception as e:
+        # The LLM path still works; never let the fast path break a request.
+        log.error("Error in catalog answer stage: %s", e)
+        return None
+
+def get_catalog_answer_stats() -> Dict[str, Any]:
+    return catalog_answers.stats()
+
 # --- NEW FUNCTION: get_available_titles ---
 def get_available_book_titles() -> List[str]:
 
     #Retrieves a list of book titles from the books_data.
     #Handles potential errors and ensures a list is always returned.
+    #The list is cached per catalog version; callers must not mutate it.
+    global _available_titles_cache, _available_titles_version
 
     try:
-        # Make sure books_data is the dictionary {id: {details}}
-        if not isinstance(books_data, dict):
-             print("ERROR in get_available_titles: books_data is not a dictionary.")
+        # Make sure books_data is a mapping {id: {details}} (the catalog store's view)
+        if not isinstance(books_data, Mapping):
+             log.error("get_available_titles: books_data is not a mapping.")
              return [] # Return empty list on structure error
 
+        if _available_titles_cache is not None and _available_titles_version == data_store.catalog_version:
+            return _available_titles_cache
+
         titles = [
             details['title']
             for details in books_data.values()
             if isinstance(details, dict) and 'title' in details and isinstance(details['title'], str)
         ]
-        print(f"DEBUG: get_available_titles returning: {titles}") # Debug print
+        _available_titles_cache, _available_titles_version = titles, data_store.catalog_version
         return titles
     except Exception as e:
-        print(f"ERROR retrieving available titles: {e}")
+        log.error("Error retrieving available titles: %s", e)
         return [] # Return empty list on any error
 
+def _extract_title_scan(query: str, known_titles: List[str]) -> Optional[str]:
+    """Linear scan for titles that are not the catalog list (and the benchmark baseline)."""
+    normalized_query = normalize_text(query)
+    best = None
+    best_length = 0
+    for title in known_titles:
+        # Ensure title is a string before normalizing it
+        if isinstance(title, str):
+            normalized_title = normalize_text(title)
+            if normalized_title and len(normalized_title) > best_length and normalized_title in normalized_query:
+                best, best_length = title, len(normalized_title)
+        else:
+            log.warning("Skipping non-string item during title extraction: %r", title)
+    return best
+
 # --- EXISTING FUNCTION: extract_title ---
 # Note: Corrected type hint for known_titles from Dict to List[str]
-def extract_title(query: str, known_titles: List[str]) -> Optional[str]:
-    """Attempts to extract a known book title from the user query."""
+def extract_title(query: str, known_titles: Optional[List[str]] = None) -> Optional[str]:
+    """
+    Attempts to extract a known book title from the user query. Matching ignores
+    case and diacritics and prefers the longest title mentioned. With
+    ``known_titles`` None the titles are the whole catalog, matched through the
+    precomputed index, which also recognises an author with a single book in
+    the catalog; an explicit list is scanned title by title.
+    """
+    if known_titles is None:
+        # Decision: The catalog goes through the precomputed automaton instead of a per-title scan.
+        return _match_catalog_title(query)
     if not isinstance(known_titles, list):
-        print(f"ERROR in extract_title: known_titles is not a list ({type(known_titles)})")
+        log.error("extract_title: known_titles is not a list (%s)", type(known_titles))
         return None # Cannot process if titles aren't a list
+    return _extract_title_scan(query, known_titles)
 
-    lower_query = query.lower()
-    for title in known_titles:
-        # Ensure title is a string before calling .lower()
-        if isinstance(title, str):
-            # print(f"DEBUG: Checking title={repr(title)}, type={type(title)}") # Optional debug
-            if title.lower() in lower_query:
-                return title # Return the correctly capitalized version
-        else:
-            print(f"WARNING: Skipping non-string item during title extraction: {repr(title)}")
-    print("DEBUG: No known title directly mentioned in query.")
-    return None # Return None if no title found
+# --- Per-title answering agents: built once per title and reused from a bounded LRU ---
+ANSWER_SYSTEM_PROMPT = """
+    You are a helpful and knowledgeable literary assistant providing information ONLY about the book "{title}".
+    Do not discuss other books. If the user asks about other books or topics not directly related to "{title}", politely refuse.
+    Answer the user's query comprehensively using your general knowledge about "{title}".
+    """
+
+@lru_cache(maxsize=int(os.getenv('AI_AGENT_CACHE_SIZE', '256')))
+def get_answering_agent(requested_title: str) -> 'Agent':
+    """Returns the (shared) answering agent for a title. The model is supplied per run."""
+    from pydantic_ai import Agent
+    return Agent(
+        output_type=str, # Expecting a string response
+        system_prompt=ANSWER_SYSTEM_PROMPT.format(title=requested_title)
+    )
+
+async def _run_agent(requested_title: str, user_query: str) -> str:
+    """Runs the answering agent for one title natively async on the executor loop."""
+    # Pass the original user query to the agent
+    result = await get_answering_agent(requested_title).run(user_prompt=user_query, model=get_model())
+    return result.output
+
+# Deltas arriving within this window are sent as one chunk; pydantic-ai's default (0.1s) delays the first token.
+STREAM_DEBOUNCE_SECONDS = 0.02
+
+async def _stream_agent(requested_title: str, user_query: str):
+    """Yields the answer as incremental text deltas while the model generates it."""
+    async with get_answering_agent(requested_title).run_stream(user_prompt=user_query, model=get_model()) as result:
+        async for delta in result.stream_text(delta=True, debounce_by=STREAM_DEBOUNCE_SECONDS):
+            yield delta
+
+def _ask_llm(requested_title: str, user_query: str,
+             is_cancelled: Optional[Callable[[], bool]] = None) -> Dict[str, Any]:
+    """Runs the answering agent for one title; returns the service's result dict."""
+    try:
+        with timed('ai', 'llm'):
+            output = ai_executor.run(lambda: _run_agent(requested_title, user_query), is_cancelled=is_cancelled)
+        log.debug("LLM answered for '%s'.", requested_title)
+        return {"data": {"response": output, "title_match": requested_title}, "status": "success"}
+    except TimeoutError:
+        log.error("Agent run for '%s' timed out after %ss", requested_title, ai_executor.default_timeout)
+        return {"error": f"AI agent timed out processing the query for '{requested_title}'.", "status": "timeout", "title_match": requested_title}
+    except RequestCancelled:
+        log.info("Agent run for '%s' cancelled; client went away.", requested_title)
+        return {"error": "AI request cancelled.", "status": "cancelled", "title_match": requested_title}
+    except Exception as e:
+        log.error("Error during agent run for '%s': %s", requested_title, e)
+        return {"error": f"AI agent failed to process the query for '{requested_title}'.", "title_match": requested_title}
+
+# Results that concern only the request that got them; coalesced followers compute their own instead.
+UNSHARED_STATUSES = ('cancelled', 'rate_limited', 'overloaded')
+
+def _admitted_llm_call(requested_title: str, user_query: str, is_cancelled: Optional[Callable[[], bool]],
+                       client_id: Optional[str]) -> Dict[str, Any]:
+    """_ask_llm behind admission; a rejection or a cancellation while queued comes back as a result dict."""
+    # Decision: Admission happens inside the single-flight leader, so cache hits and followers never take a slot.
+    try:
+        with ai_admission.admit(client_id, is_cancelled):
+            return _ask_llm(requested_title, user_query, is_cancelled)
+    except AdmissionRejected as e:
+        log.info("AI request for '%s' not admitted: %s", requested_title, e.status)
+        return _rejected(e, requested_title)
+    except RequestCancelled:
+        return {"error": "AI request cancelled.", "status": "cancelled", "title_match": requested_title}
 
 # --- NEW FUNCTION: get_ai_response (Handles Gemini Call) ---
 # Moved the agent logic into a function to be called by app.py
-def get_ai_response(user_query: str, available_book_titles: List[str]) -> Dict[str, Any]:
+def get_ai_response(user_query: str, available_book_titles: Optional[List[str]] = None,
+                    is_cancelled: Optional[Callable[[], bool]] = None,
+                    client_id: Optional[str] = None) -> Dict[str, Any]:
     """
     Processes user query using AI. Extracts title, validates,
     calls Gemini if appropriate, or returns refusal/error message.
+    The model call runs on the AI executor; from an eventlet green thread this
+    waits cooperatively, and ``is_cancelled`` (e.g. client disconnected) aborts it.
+    Structured catalog questions are answered locally before any of that.
+    A request that needs the model must pass admission first (rate limit of
+    ``client_id``, concurrency cap); a rejection comes back as status
+    'rate_limited' or 'overloaded' with ``retry_after`` seconds.
+    ``available_book_titles`` None means every catalog title (see extract_title).
     """
-    if not model or not api_key_loaded:
-         return {"error": "AI model not initialized or API key missing."}
+    # Decision: Year/author/stock/ISBN questions are answered exactly from the catalog; only the rest reaches Gemini.
+    with timed('ai', 'catalog'):
+        catalog_result = answer_from_catalog(user_query)
+    if catalog_result is not None:
+        log.debug("Answered '%s' from the catalog (%s).", user_query[:60], catalog_result['data']['intent'])
+        return catalog_result
+
+    unavailable = _model_unavailable()
+    if unavailable is not None:
+        return unavailable
 
-    requested_title = extract_title(user_query, available_book_titles)
+    with timed('ai', 'title_extraction'):
+        requested_title = extract_title(user_query, available_book_titles)
 
     if requested_title:
         # Title is in our allowed list
-        print(f"\n--- Title '{requested_title}' Found in List ---")
-        print("Proceeding to ask LLM to answer the query about this book...")
-
-        system_prompt_answer = f"""
-            You are a helpful and knowledgeable literary assistant providing information ONLY about the book "{requested_title}".
-            Do not discuss other books. If the user asks about other books or topics not directly related to "{requested_title}", politely refuse.
-            Answer the user's query comprehensively using your general knowledge about "{requested_title}".
-            """
-        answering_agent = Agent(
-            model=model,
-            output_type=str, # Expecting a string response
-            system_prompt=system_prompt_answer
-        )
-        try:
-            # Pass the original user query to the agent
-            result = answering_agent.run_sync(user_prompt=user_query)
-            print(f"--- LLM Answer for '{requested_title}' ---")
-            print(result)
-            return {"data": {"response": result, "title_match": requested_title}, "status": "success"}
-        except Exception as e:
-            print(f"ERROR during agent run for '{requested_title}': {e}")
-            return {"error": f"AI agent failed to process the query for '{requested_title}'.", "title_match": requested_title}
-
-    else:
-        # Title not found in the list or couldn't be extracted
-        print("\n--- Title Not Found in Allowed List or Not Extracted ---")
-        potential_title_match = re.search(r'(?:book|about|titled|of)\s+([\'"]?)(.+?)\1(?:$|\?|\.)', user_query, re.IGNORECASE)
-        title_mentioned = potential_title_match.group(2).strip() if potential_title_match else "the requested book"
-
-        refusal_message = f"I am sorry, I cannot provide information about '{title_mentioned}' as it is not in my allowed list of books ({', '.join(available_book_titles)})."
-        print(refusal_message)
-        return {"error": refusal_message, "title_match": None}
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+        log.debug("Title '%s' found in list; asking the LLM.", requested_title)
 
+        # Decision: Identical questions about the same title share one cached answer and one in-flight LLM call.
+        # A follower that gives up only stops waiting; it never cancels the leader's call.
+        cache_key = _cache_key(requested_title, user_query)
+        computing = [0.0]
 
+        def compute():
+            started = time.perf_counter()
+            try:
+                return _admitted_llm_call(requested_title, user_query, is_cancelled, client_id)
+            finally:
+                computing[0] += time.perf_counter() - started
 
+        started = time.perf_counter()
+        try:
+            return response_cache.get_or_compute(
+                cache_key,
+                compute,
+                cacheable=lambda result: 'data' in result,
+                wait=lambda pending: wait_for_future(pending, is_cancelled=is_cancelled, cancel_future=False),
+                # A leader whose own client went away, or who was not admitted, must not hand that to followers.
+                shareable=lambda result: result.get('status') not in UNSHARED_STATUSES
+            )
+        except RequestCancelled:
+            return {"error": "AI request cancelled.", "status": "cancelled", "title_match": requested_title}
+        finally:
+            # Decision: 'cache' is the lookup plus any wait on another request's call, as on the streaming path;
+            # this request's own model call is timed by 'llm'.
+            STAGE_SECONDS.observe(time.perf_counter() - started - computing[0], 'ai', 'cache')
 
+    else:
+        return _refusal(user_query, available_book_titles)
+
+# Pulls the title the user asked about out of queries like "tell me about 'X'" for the refusal message.
+TITLE_MENTION_RE = re.compile(r'(?:book|about|titled|of)\s+([\'"]?)(.+?)\1(?:$|\?|\.)', re.IGNORECASE)
+# Refusals suggest at most this many titles instead of listing the whole catalog.
+REFUSAL_SUGGESTION_LIMIT = int(os.getenv('AI_REFUSAL_SUGGESTIONS', '5'))
+
+def _refusal(user_query: str, available_book_titles: Optional[List[str]]) -> Dict[str, Any]:
+    if available_book_titles is None:
+        available_book_titles = get_available_book_titles()
+    # Title not found in the list or couldn't be extracted
+    potential_title_match = TITLE_MENTION_RE.search(user_query)
+    title_mentioned = potential_title_match.group(2).strip() if potential_title_match else "the requested book"
+
+    suggestions = available_book_titles[:REFUSAL_SUGGESTION_LIMIT]
+    remaining = len(available_book_titles) - len(suggestions)
+    suggestion_text = ', '.join(suggestions) + (f", and {remaining} more" if remaining > 0 else "")
+    refusal_message = f"I am sorry, I cannot provide information about '{title_mentioned}' as it is not in my allowed list of books (for example: {suggestion_text})."
+    log.debug("Title not found in allowed list or not extracted: '%s'", title_mentioned)
+    return {"error": refusal_message, "status": "refused", "title_match": None,
+            "suggestions": suggestions, "total_titles": len(available_book_titles)}
+
+def stream_ai_response(user_query: str, available_book_titles: Optional[List[str]] = None,
+                       is_cancelled: Optional[Callable[[], bool]] = None,
+                       client_id: Optional[str] = None) -> Iterator[Tuple[str, Any]]:
+    """
+    Streaming variant of get_ai_response with the same title gating, refusal
+    and admission. Yields ('chunk', text) events as the model produces them,
+    then one final ('done', {'title_match': ..., 'cached': bool}) or
+    ('error', result_dict). A cached answer or a catalog answer is yielded as
+    a single chunk; a completed stream is cached.
+    """
+    with timed('ai', 'catalog'):
+        catalog_result = answer_from_catalog(user_query)
+    if catalog_result is not None:
+        yield 'chunk', catalog_result['data']['response']
+        yield 'done', {"title_match": catalog_result['data']['title_match'], "cached": False, "source": "catalog"}
+        return
+
+    unavailable = _model_unavailable()
+    if unavailable is not None:
+        yield 'error', unavailable
+        return
+
+    with timed('ai', 'title_extraction'):
+        requested_title = extract_title(user_query, available_book_titles)
+    if not requested_title:
+        yield 'error', _refusal(user_query, available_book_titles)
+        return
+
+    cache_key = _cache_key(requested_title, user_query)
+    with timed('ai', 'cache'):
+        cached = response_cache.get(cache_key)
+    if cached is not None:
+        yield 'chunk', cached['data']['response']
+        yield 'done', {"title_match": requested_title, "cached": True}
+        return
 
+    try:
+        with ai_admission.admit(client_id, is_cancelled):
+            yield from _stream_llm(requested_title, user_query, cache_key, is_cancelled)
+    except AdmissionRejected as e:
+        log.info("Streamed AI request for '%s' not admitted: %s", requested_title, e.status)
+        yield 'error', _rejected(e, requested_title)
+    except RequestCancelled:
+        log.info("Queued AI request for '%s' cancelled; client went away.", requested_title)
+
+def _stream_llm(requested_title: str, user_query: str, cache_key: str,
+                is_cancelled: Optional[Callable[[], bool]]) -> Iterator[Tuple[str, Any]]:
+    """The model part of stream_ai_response: streams, then caches the completed answer."""
+    log.debug("Streaming LLM answer for '%s'.", requested_title)
+    parts = []
+    started = time.perf_counter()
+    handle = ai_executor.stream(lambda: _stream_agent(requested_title, user_query))
+    try:
+        for chunk in handle.chunks(is_cancelled=is_cancelled):
+            if not parts:
+                STAGE_SECONDS.observe(time.perf_counter() - started, 'ai', 'llm_first_chunk')
+            parts.append(chunk)
+            yield 'chunk', chunk
+    except TimeoutError:
+        yield 'error', {"error": f"AI agent timed out processing the query for '{requested_title}'.", "status": "timeout", "title_match": requested_title}
+        return
+    except RequestCancelled:
+        log.info("Streamed agent run for '%s' cancelled; client went away.", requested_title)
+        return
+    except Exception as e:
+        log.error("Error during streamed agent run for '%s': %s", requested_title, e)
+        yield 'error', {"error": f"AI agent failed to process the query for '{requested_title}'.", "title_match": requested_title}
+        return
+    finally:
+        # Also stops the model call if the consumer of this generator stops early.
+        handle.cancel()
+
+    STAGE_SECONDS.observe(time.perf_counter() - started, 'ai', 'llm_stream')
+    response_cache.set(cache_key, {"data": {"response": ''.join(parts), "title_match": requested_title}, "status": "success"})
+    yield 'done', {"title_match": requested_title, "cached": False}
+
+# --- Warm-up: the first-use work, done before the first AI request instead of during it ---
+def warm_up():
+    """
+    Imports pydantic-ai, builds the model and an answering agent, and indexes
+    the catalog titles. Meant to run once the server accepts traffic (see
+    app.start_ai_warm_up); safe to call more than once.
+    """
+    started = time.perf_counter()
+    try:
+        _sync_title_index()
+        _sync_catalog_answers()
+        titles = get_available_book_titles()
+        if api_key_loaded or model is not None:
+            get_model()
+            if titles:
+                get_answering_agent(titles[0])
+    except Exception as e:
+        # Warm-up is an optimisation; the first request redoes whatever failed here.
+        log.warning("AI warm-up failed: %s", e)
+        return
+    log.info("AI warm-up finished in %.2fs.", time.perf_counter() - started)
@@ -1,13 +1,26 @@
 import json
 import os
 import re
+import socket
+import sqlite3
+import threading
+import time
 import uuid
-import pika
 from dotenv import load_dotenv
-from flask import Flask, jsonify, abort, request
-from flask_socketio import SocketIO
+from flask import Flask, Response, g, jsonify, abort, request, stream_with_context, url_for
+from flask_socketio import SocketIO, emit, join_room, leave_room
 import ai_service
-from data_store import books_data, orders, inventory
+from catalog_store import BOOK_FIELDS, SQLITE_MAX_INT, InvalidCursor, encode_cursor, fits_sqlite
+from catalog_responses import EncodedResponse, EncodedResponseCache, serve
+from instrumentation import INSTRUMENTATION_ENABLED, PROMETHEUS_CONTENT_TYPE, REGISTRY, get_logger, timed
+import data_store
+from data_store import books_data, catalog, orders, inventory, reservations
+from order_store import OrderRecord
+from outbox import OrderOutbox
+from publisher import OrderPublisher
+from reservations import IdempotencyConflict, InsufficientStock, ReservationError
+from status_events import StatusRelay, order_room, user_room
+from worker_relay import WorkerRelayManager
 
 load_dotenv()
 
@@ -16,9 +29,36 @@ app = Flask(__name__)
 
 ORDER_QUEUE_NAME = 'order_processing_queue'
 RABBITMQ_URL = os.environ.get('RABBITMQ_URL')
-socketio = SocketIO(app, async_mode='eventlet')
-
-print(f"DEBUG: Initial RABBITMQ_URL value = {repr(RABBITMQ_URL)}")
+# Decision: Under serve.py each worker relays its SocketIO emits to the others, so any worker can reach any client.
+SOCKETIO_RELAY_DIR = os.environ.get('SOCKETIO_RELAY_DIR')
+socketio = SocketIO(app, async_mode='eventlet',
+                    client_manager=WorkerRelayManager(SOCKETIO_RELAY_DIR) if SOCKETIO_RELAY_DIR else None)
+
+# Decision: One long-lived publisher per process instead of a new connection per order.
+order_publisher = OrderPublisher(
+    RABBITMQ_URL,
+    queue_name=ORDER_QUEUE_NAME,
+    pool_size=int(os.environ.get('RABBITMQ_POOL_SIZE', '2'))
+)
+# Decision: Orders go to a durable local outbox first; a background flusher publishes them in batches.
+order_outbox = OrderOutbox(
+    os.environ.get('ORDER_OUTBOX_PATH', 'order_outbox.db'),
+    order_publisher,
+    batch_size=int(os.environ.get('ORDER_OUTBOX_BATCH_SIZE', '100')),
+    max_attempts=int(os.environ.get('ORDER_OUTBOX_MAX_ATTEMPTS', '5'))
+)
+
+log = get_logger('API')
+producer_log = get_logger('API/PRODUCER')
+socket_log = get_logger('API/SOCKETIO')
+log.debug("Initial RABBITMQ_URL value = %r", RABBITMQ_URL)
+
+# --- Metrics (exposed on GET /metrics) ---
+HTTP_REQUEST_SECONDS = REGISTRY.histogram('library_http_request_seconds', 'HTTP request latency by endpoint.',
+                                          ('method', 'endpoint', 'status'))
+ORDERS_TOTAL = REGISTRY.counter('library_orders_total', 'Orders by outcome.', ('outcome',))
+AI_REQUESTS_TOTAL = REGISTRY.counter('library_ai_requests_total', 'AI prompts by transport and result status.',
+                                     ('transport', 'status'))
 
 
 #inventory = [{book_id: data['stock'] for book_id, data in books_data.items()}]
@@ -27,202 +67,686 @@ print(f"DEBUG: Initial RABBITMQ_URL value = {repr(RABBITMQ_URL)}")
 def api_root():
     return "Welcome to our Lib"
 
+# Pre-encoded catalog responses, invalidated whenever data_store.catalog_version changes.
+catalog_responses = EncodedResponseCache(max_entries=int(os.environ.get('CATALOG_RESPONSE_CACHE_SIZE', '4096')))
+
+# /books page size: default and upper bound for ?limit=.
+BOOKS_DEFAULT_LIMIT = int(os.environ.get('BOOKS_DEFAULT_LIMIT', '100'))
+BOOKS_MAX_LIMIT = int(os.environ.get('BOOKS_MAX_LIMIT', '1000'))
+
 @app.route('/books', methods=['GET'])
 def get_books():
-    if books_data:
-    #Gets a list of books
-        books_list = list(books_data.values())
-        return jsonify(books_list), 200
-    abort(404, message="books not found")
+    """
+    Lists books one page at a time. Query params: limit, cursor (from the
+    X-Next-Cursor header of the previous page), author, year, isbn and
+    fields (comma-separated projection, e.g. fields=title,author).
+    The body stays a JSON list; the next page is linked via X-Next-Cursor / Link.
+    """
+    try:
+        limit = int(request.args.get('limit', BOOKS_DEFAULT_LIMIT))
+        year = request.args.get('year', type=str)
+        year = int(year) if year else None
+        if year is not None and not fits_sqlite(year):
+            raise ValueError(year)
+    except ValueError:
+        return jsonify({"error": {"message": "'limit' and 'year' must be integers."}, "status": "failed"}), 400
+    if not 1 <= limit <= BOOKS_MAX_LIMIT:
+        return jsonify({"error": {"message": f"'limit' must be between 1 and {BOOKS_MAX_LIMIT}."}, "status": "failed"}), 400
+    fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()]
+    unknown = [field for field in fields if field not in BOOK_FIELDS]
+    if unknown:
+        return jsonify({"error": {"message": f"Unknown field(s): {', '.join(unknown)}. Allowed: {', '.join(BOOK_FIELDS)}."}, "status": "failed"}), 400
+
+    def build():
+        books_list, next_id = catalog.list_books(
+            cursor=request.args.get('cursor') or None, limit=limit,
+            author=request.args.get('author') or None, year=year,
+            isbn=request.args.get('isbn') or None, fields=fields or None)
+        if not books_list and not request.args and not books_data:
+            return None
+        headers = {}
+        if next_id is not None:
+            next_cursor = encode_cursor(next_id)
+            args = dict(request.args, cursor=next_cursor)
+            headers['X-Next-Cursor'] = next_cursor
+            headers['Link'] = f'<{url_for("get_books", **args)}>; rel="next"'
+        return EncodedResponse(books_list, data_store.catalog_updated_at, headers)
+
+    # Decision: Pages are encoded once per catalog version; repeat reads are a dict lookup (or a 304).
+    try:
+        entry = catalog_responses.get(data_store.catalog_version, ('books', tuple(sorted(request.args.items(multi=True)))), build)
+    except InvalidCursor as e:
+        return jsonify({"error": {"message": str(e)}, "status": "failed"}), 400
+    if entry is None:
+        abort(404, description="books not found")
+    return serve(entry, request)
 
 @app.route('/books/<int:book_id>', methods=['GET'])
 def get_one_book(book_id):
     #Returns details for a specific book by its ID
-    book = books_data.get(book_id)
+    def build():
+        book = books_data.get(book_id)
+        return EncodedResponse(book, data_store.catalog_updated_at) if book else None
+    entry = catalog_responses.get(data_store.catalog_version, ('book', book_id), build)
     # 2. Checks if book is found
-    if book:
-        #Flask automatically sends a 200 OK status code here.
-        return jsonify(book)
+    if entry:
+        #The pre-encoded body is served as-is, or 304 if the client's ETag still matches.
+        return serve(entry, request)
     else:
         #     will catch this and return a standard JSON error message.
         abort(404, description=f"book with ID {book_id} not found.")
 
 
-def get_rabbitmq_connection():
-    """Establishes a connection to RabbitMQ."""
-    # This print uses the potentially problematic RABBITMQ_URL
-    print(f"Attempting to connect to RabbitMQ at {RABBITMQ_URL}...") # <<< This showed None
-    # Add a check here too, just before using it
-    if not RABBITMQ_URL:
-        print("ERROR: RABBITMQ_URL is None or empty inside get_rabbitmq_connection!")
-        return None
-    try:
-        params = pika.URLParameters(RABBITMQ_URL) # <<< This fails if RABBITMQ_URL is None
-        connection = pika.BlockingConnection(params)
-        print("RabbitMQ connection successful.")
-        return connection
-    except pika.exceptions.AMQPConnectionError as e:
-        print(f"Error connecting to RabbitMQ: {e}")
-        return None
-    except Exception as e: # Catch other potential errors like the TypeError
-        print(f"Error during RabbitMQ connection parameter parsing: {e}")
-        return None
-
 def send_order_to_queue(order_message):
-    #Sends order data as a JSON message to the RabbitMQ queue.
-    connection = None
+    #Stores the order message in the durable outbox; the outbox flusher publishes it to RabbitMQ.
     try:
-        connection = get_rabbitmq_connection()
-        if not connection:
-            print("Failed to get RabbitMQ connection.")
-            return False
-
-        channel = connection.channel()
-
-        channel.queue_declare(queue=ORDER_QUEUE_NAME, durable=True)
+        order_outbox.append(order_message)
+        return True
+    except sqlite3.Error as e:
+        producer_log.error("Error writing order %s to the outbox: %s", order_message.get('order_id', ''), e)
+        return False
 
-        message_body = json.dumps(order_message) # Convert dict to JSON string
+def validate_order_items(items, books):
+    """
+    Validates an order's line items against ``books`` (any book_id -> book
+    mapping) and returns ([(book_id, title, quantity, price)], None) or
+    (None, error message). Stops at the first invalid item.
+    """
+    lines = []
+    totals = {}
+    for item in items:
+        if not isinstance(item, dict):
+            return None, f"Invalid item: {item!r}"
+        book_id_str = item.get('book_id')  # Get book_id (might be str or int from JSON).
+        quantity = item.get('quantity', 1) # Get quantity, default to 1 if not provided.
 
-        channel.basic_publish(
-            exchange='',
-            routing_key=ORDER_QUEUE_NAME,
-            body=message_body,
-            properties=pika.BasicProperties(delivery_mode=2) # Make message persistent
-        )
-        print(f" [API/PRODUCER] Sent order {order_message.get('order_id', '')} to queue '{ORDER_QUEUE_NAME}'")
-        return True
-    except Exception as e:
-        print(f"Error sending message to RabbitMQ: {e}")
+        # Decision: Validate book_id and quantity rigorously within a try-except block.
+        try:
+            book_id = int(book_id_str) # Attempt to convert book_id to integer.
+        except (ValueError, TypeError):
+            # Decision: Handle cases where book_id couldn't be converted to int.
+            return None, f"Invalid book_id format: {book_id_str}"
+        # Decision: Check if the converted book_id exists in our known books (ids beyond SQLite's range never do).
+        book = books.get(book_id) if fits_sqlite(book_id) else None
+        if book is None:
+            return None, f"Invalid book_id: {book_id}"
+        # Decision: Check if quantity is an integer and is positive.
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+            return None, f"Invalid quantity ({quantity}) for book_id: {book_id}"
+        # Decision: Quantities are summed per book and stored as SQLite integers; reject totals that cannot be.
+        totals[book_id] = totals.get(book_id, 0) + quantity
+        if totals[book_id] > SQLITE_MAX_INT:
+            return None, f"Invalid quantity ({quantity}) for book_id: {book_id}"
+        #Safely get the price, defaulting to 0.
+        lines.append((book_id, book['title'], quantity, book.get('price', 0)))
+    return lines, None
+
+def order_user_id(payload):
+    """
+    Returns (user id as a string, None) or (None, error message). Any JSON
+    scalar is accepted and converted; a missing or empty one gets an anonymous id.
+    """
+    user_id = payload.get('user_identifier')
+    if not user_id:
+        return f"anon_{uuid.uuid4().hex[:6]}", None
+    if isinstance(user_id, (dict, list)):
+        return None, "Invalid user_identifier: expected a string."
+    return user_id if isinstance(user_id, str) else str(user_id), None
+
+def failed_attempt(reservation) -> bool:
+    """True when a replayed reservation belongs to an attempt that gave its stock back before the order was queued."""
+    if reservation.status in ('held', 'committed'):
         return False
-    finally:
-        if connection and connection.is_open:
-            connection.close()
-            print("RabbitMQ connection closed.")
+    original_order = orders.get(reservation.reference)
+    return original_order is None or original_order.status == "Queueing Failed"
+
+def reserve_retry(items, idempotency_key, order_id, outcome):
+    """
+    Returns ``outcome`` of reserving ``items`` under ``idempotency_key``,
+    except that a replay of a failed attempt drops the key and reserves again
+    for ``order_id``; only orders that were queued are replayed.
+    """
+    reservation, created = outcome
+    if created or not failed_attempt(reservation):
+        return outcome
+    reservations.forget_key(idempotency_key, reservation.reservation_id)
+    return reservations.reserve(items, idempotency_key=idempotency_key, reference=order_id)
 
 # --- Custom Error Handler for 404 ---
 @app.route('/orders', methods=['POST'])
 def create_order():
     """
-    Receives order data, validates it, performs a preliminary stock check,
-    creates an order record with 'Pending' status, and sends the order
-    details to RabbitMQ for asynchronous processing.
-    Includes debug prints before the stock comparison.
+    Receives order data, validates it, reserves stock for every item at once
+    (all or nothing), creates an order record with 'Pending' status, and
+    stores the order message in the outbox, which publishes it to RabbitMQ in
+    the background. An Idempotency-Key header (or 'idempotency_key' field)
+    makes retries return the original order; a retry after an attempt that
+    failed before its order was queued places the order again.
     """
     # Decision: Get JSON data from the incoming request body.
     data = request.get_json()
     #Decision: Basic validation: ensure data exists, has 'items' key, and 'items' is a list.
     if not data or 'items' not in data or not isinstance(data['items'], list):
+        ORDERS_TOTAL.inc('invalid')
         return jsonify({"error": "Invalid order data. 'items' list is required."}), 400 # Return 400 for bad request format.
 
     #Decision: Generate a unique ID for this order using UUID.
     order_id = str(uuid.uuid4())
-    order_items_details = []
-    order_items_message = []
-    total_price = 0
-    validation_error = None
-
-    for item in data['items']:
-        book_id_str = item.get('book_id')  # Get book_id (might be str or int from JSON).
-        quantity = item.get('quantity', 1) # Get quantity, default to 1 if not provided.
-
-        # Decision: Validate book_id and quantity rigorously within a try-except block.
-        try:
-            book_id = int(book_id_str) # Attempt to convert book_id to integer.
-            # Decision: Check if the converted book_id exists in our known books.
-            if book_id not in books_data:
-                validation_error = f"Invalid book_id: {book_id}"
-                break # Stop processing items on first error.
-            # Decision: Check if quantity is an integer and is positive.
-            if not isinstance(quantity, int) or quantity <= 0:
-                 validation_error = f"Invalid quantity ({quantity}) for book_id: {book_id}"
-                 break # Stop processing items on first error.
-        except (ValueError, TypeError):
-            # Decision: Handle cases where book_id couldn't be converted to int.
-            validation_error = f"Invalid book_id format: {book_id_str}"
-            break # Stop processing items on first error.
-
-        # --- If no 'break' occurred, validation passed for this item ---
-        # Decision: Retrieve book details using the validated integer book_id. Assumes book_id exists due to check above.
-        book = books_data[book_id]
-        # Decision: Safely get current stock count from INVENTORY, defaulting to 0 if book_id not in inventory.
-        current_stock = inventory.get(book_id, 0)
-        available_titles = []
-
-        # Decision: Print debug info just before the comparison to inspect values and types. Use repr() for clear type representation.
-        print(f"Checking item with book_id={book_id}")
-        print(f" current_stock = {repr(current_stock)} (Type: {type(current_stock)})")
-        print(f" quantity = {repr(quantity)} (Type: {type(quantity)})")
-
-        # Decision: Perform the preliminary stock check. Compare integers.
-        if current_stock < quantity:
-            # Decision: If stock is insufficient based on current view, set error and stop processing.
-            validation_error = f"Not enough stock for '{book['title']}' (ID: {book_id}). Available: {current_stock}"
-            break # Exit loop, order cannot proceed.
-
-        # --- If stock check passes, prepare item details ---
-        #Safely get the price, defaulting to 0. Calculate total price.
-        price = book.get('price', 0)
-        #Append detailed item info for the order record.
-        order_items_details.append({
-            "book_id": book_id,
-            "title": book['title'],
-            "quantity": quantity,
-            "price_per_item": price
-        })
-        # Decision: Append minimal info needed by the consumer to the message payload list.
-        order_items_message.append({"book_id": book_id, "quantity": quantity})
-        total_price += price * quantity # Accumulate total price.
-
-    # Decision: After checking all items, see if any validation error occurred during the loop.
+    with timed('order', 'validate'):
+        order_lines, validation_error = validate_order_items(data['items'], books_data)
+    # Decision: After checking all items, see if any validation error occurred.
+    if not validation_error:
+        user_id, validation_error = order_user_id(data)
     if validation_error:
+        ORDERS_TOTAL.inc('invalid')
         return jsonify({"error": validation_error}), 400 # Return 400 Bad Request with the specific error message.
+    # Decision: Minimal info needed by the consumer goes into the message payload.
+    order_items_message = [{"book_id": book_id, "quantity": quantity} for book_id, _, quantity, _ in order_lines]
 
     # --- If all items validated successfully ---
-    #Create the final order dictionary to be stored. Set initial status.
-    new_order = {
-        "order_id": order_id,
-        "items": order_items_details,
-        "total_price": round(total_price, 2), # Round price to 2 decimal places.
-        "status": "Pending", # Initial status before consumer processing.
-        "user_identifier": data.get('user_identifier', f"anon_{uuid.uuid4().hex[:6]}") # Optional user ID.
-    }
-    #Store the newly created order in our in-memory storage.
-    orders[order_id] = new_order
-
-    #Prepare the payload containing only essential info for the RabbitMQ message.
-    message_payload = {
-        "order_id": order_id,
-        "items": order_items_message
-    }
-
-    message_payload = {"order_id": order_id, "items": order_items_message}
-
-    # Decision: Attempt to send the message to the queue. This is the core producer step.
-    if send_order_to_queue(message_payload):
-        print(f" [API/PRODUCER] Order {order_id} created and sent to queue successfully.")
-        # Decision: Optionally emit a SocketIO event to notify client immediately that order was received.
-        # Emitting globally for simplicity here:
-        socketio.emit('order_received', {'order_id': order_id, 'status': 'Pending'})
-        print(f" [API/SOCKETIO] Emitted 'order_received' for order {order_id}")
+    # Decision: Reserve every line item atomically (all or nothing); a retried request with the same
+    # Idempotency-Key gets the original order back instead of reserving twice.
+    idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    items = [(item['book_id'], item['quantity']) for item in order_items_message]
+    try:
+        with timed('order', 'reserve'):
+            reservation, created = reserve_retry(items, idempotency_key, order_id, reservations.reserve(
+                items, idempotency_key=idempotency_key, reference=order_id))
+    except InsufficientStock as e:
+        ORDERS_TOTAL.inc('out_of_stock')
+        return jsonify({"error": f"Not enough stock for '{books_data[e.book_id]['title']}' (ID: {e.book_id}). Available: {e.available}"}), 400
+    except IdempotencyConflict as e:
+        ORDERS_TOTAL.inc('idempotency_conflict')
+        return jsonify({"error": str(e)}), 422
+    if not created:
+        ORDERS_TOTAL.inc('replayed')
+        producer_log.info("Replayed order %s for idempotency key %r.", reservation.reference, idempotency_key)
+        original_order = orders.get(reservation.reference)
+        if original_order is None:
+            return jsonify({"error": "An order with this idempotency key is still being created."}), 409
+        return jsonify(original_order.to_dict(book_title)), 201
+
+    # Decision: Until the message is in the outbox nothing will commit or release the reservation; give it back on errors.
+    try:
+        #Create the final order record to be stored (compact; titles are looked up by book_id when rendered).
+        record = OrderRecord(
+            order_id,
+            user_id, # Optional user ID.
+            [(book_id, quantity, price) for book_id, _, quantity, price in order_lines],
+            status="Pending", # Initial status before consumer processing.
+            reservation_id=reservation.reservation_id
+        )
+        #Store the newly created order in the order store.
+        orders.add(record)
+        new_order = record.to_dict(book_title)
+
+        #Prepare the payload containing only essential info for the RabbitMQ message.
+        message_payload = {"order_id": order_id, "items": order_items_message,
+                           "reservation_id": reservation.reservation_id, "user_identifier": record.user_id}
+
+        # Decision: Hand the message to the outbox. This is the core producer step; it does not wait on the broker.
+        with timed('order', 'publish'):
+            queued = send_order_to_queue(message_payload)
+    except Exception:
+        reservations.release(reservation.reservation_id)
+        raise
+    if queued:
+        if not reservations.shared:
+            # In-process engine: the consumer cannot see this reservation, so the stock is taken for good now.
+            reservations.commit(reservation.reservation_id)
+        ORDERS_TOTAL.inc('accepted')
+        producer_log.debug("Order %s created and stored in the outbox.", order_id)
+        # Decision: Notify only the clients subscribed to this order or its user, not every connection.
+        with timed('order', 'emit'):
+            socketio.emit('order_received', {'order_id': order_id, 'status': 'Pending'},
+                          to=[order_room(order_id), user_room(record.user_id)])
         return jsonify(new_order), 201  # Return 201 Created
 
     else:
         # Handle failure to send to queue
-        print(f" [API/PRODUCER] Failed to send order {order_id} to queue.")
-        orders[order_id]["status"] = "Queueing Failed"
+        ORDERS_TOTAL.inc('queueing_failed')
+        producer_log.error("Failed to store order %s in the outbox.", order_id)
+        orders.set_status(order_id, "Queueing Failed")
+        reservations.release(reservation.reservation_id) # Give the stock back
         # Optionally emit failure event via SocketIO
-        socketio.emit('order_error', {'order_id': order_id, 'error': 'Queueing Failed'})
+        socketio.emit('order_error', {'order_id': order_id, 'error': 'Queueing Failed'},
+                      to=[order_room(order_id), user_room(record.user_id)])
         return jsonify({"error": "Failed to queue order for processing. Please try again later."}), 500
 
+BULK_ORDER_MAX_ORDERS = int(os.environ.get('BULK_ORDER_MAX_ORDERS', '1000'))
+BULK_ORDER_CHUNK_SIZE = int(os.environ.get('BULK_ORDER_CHUNK_SIZE', '500'))
+
+def bulk_error(index, status, error):
+    return {"index": index, "status": status, "error": error}
+
+def validate_bulk(payloads, books, results, first_index):
+    """Validates each order against ``books``; records errors in ``results`` and returns the valid ones."""
+    pending = []
+    for offset, payload in enumerate(payloads):
+        index = first_index + offset
+        if not isinstance(payload, dict) or not isinstance(payload.get('items'), list):
+            ORDERS_TOTAL.inc('invalid')
+            results[offset] = bulk_error(index, 400, "Invalid order data. 'items' list is required.")
+            continue
+        order_lines, validation_error = validate_order_items(payload['items'], books)
+        if not validation_error:
+            user_id, validation_error = order_user_id(payload)
+        if validation_error:
+            ORDERS_TOTAL.inc('invalid')
+            results[offset] = bulk_error(index, 400, validation_error)
+            continue
+        pending.append((offset, str(uuid.uuid4()), order_lines, payload, user_id))
+    return pending
+
+def place_orders(payloads, first_index=0):
+    """
+    Places a batch of orders (each shaped like a POST /orders body) and
+    returns one result per order, in order. The catalog is read once for all
+    distinct book ids, every order is reserved (each all or nothing) in one
+    inventory transaction, and accepted orders go to the outbox in one
+    transaction and are announced with a single SocketIO event.
+    """
+    results = [None] * len(payloads)
+    book_ids = set()
+    for payload in payloads:
+        for item in (payload.get('items') if isinstance(payload, dict) else None) or ():
+            try:
+                book_ids.add(int(item.get('book_id')))
+            except (AttributeError, TypeError, ValueError):
+                pass  # Reported by validate_order_items below.
+    # Decision: One catalog query for the whole batch instead of one lookup per line item.
+    with timed('bulk_order', 'validate'):
+        books = catalog.get_many(book_ids)
+        pending = validate_bulk(payloads, books, results, first_index)
+
+    with timed('bulk_order', 'reserve'):
+        outcomes = reservations.reserve_many([
+            ([(book_id, quantity) for book_id, _, quantity, _ in order_lines], payload.get('idempotency_key'), order_id)
+            for _, order_id, order_lines, payload, _ in pending])
+        for position, ((_, order_id, order_lines, payload, _), outcome) in enumerate(zip(pending, outcomes)):
+            if isinstance(outcome, tuple) and not outcome[1]:
+                try:
+                    outcomes[position] = reserve_retry(
+                        [(book_id, quantity) for book_id, _, quantity, _ in order_lines],
+                        payload.get('idempotency_key'), order_id, outcome)
+                except ReservationError as e:
+                    outcomes[position] = e
+
+    records, messages, replays = [], [], []
+    try:
+        for (offset, order_id, order_lines, payload, user_id), outcome in zip(pending, outcomes):
+            index = first_index + offset
+            if isinstance(outcome, InsufficientStock):
+                ORDERS_TOTAL.inc('out_of_stock')
+                results[offset] = bulk_error(index, 400, f"Not enough stock for '{books[outcome.book_id]['title']}'"
+                                                         f" (ID: {outcome.book_id}). Available: {outcome.available}")
+                continue
+            if isinstance(outcome, IdempotencyConflict):
+                ORDERS_TOTAL.inc('idempotency_conflict')
+                results[offset] = bulk_error(index, 422, str(outcome))
+                continue
+            reservation, created = outcome
+            if not created:
+                # Resolved last: the original may be an earlier order of this same batch.
+                ORDERS_TOTAL.inc('replayed')
+                replays.append((offset, reservation.reference))
+                continue
+            record = OrderRecord(order_id, user_id,
+                                 [(book_id, quantity, price) for book_id, _, quantity, price in order_lines],
+                                 status="Pending", reservation_id=reservation.reservation_id)
+            records.append((offset, record))
+            messages.append({"order_id": order_id,
+                             "items": [{"book_id": book_id, "quantity": quantity} for book_id, _, quantity, _ in order_lines],
+                             "reservation_id": reservation.reservation_id, "user_identifier": record.user_id})
+    except Exception:
+        # Decision: Reservations that never reach the outbox would otherwise stay held until their TTL.
+        reservations.release_many([outcome[0].reservation_id for outcome in outcomes
+                                   if isinstance(outcome, tuple) and outcome[1]])
+        raise
+    if records:
+        queue_orders(records, messages, results, first_index, lambda book_id: books[book_id]['title'])
+    for offset, reference in replays:
+        original_order = orders.get(reference)
+        if original_order is None:
+            results[offset] = bulk_error(first_index + offset, 409,
+                                         "An order with this idempotency key is still being created.")
+        else:
+            results[offset] = {"index": first_index + offset, "status": 201,
+                               "order": original_order.to_dict(book_title), "replayed": True}
+    return results
+
+def queue_orders(records, messages, results, first_index, title_of):
+    """Stores a batch of new orders and hands their messages to the outbox in one transaction."""
+    try:
+        orders.add_many([record for _, record in records])
+        # Decision: The whole batch goes to the outbox in one transaction; the flusher publishes it as a batch.
+        with timed('bulk_order', 'publish'):
+            order_outbox.append_many(messages)
+    except sqlite3.Error as e:
+        ORDERS_TOTAL.inc('queueing_failed', amount=len(records))
+        producer_log.error("Failed to store %d bulk orders in the outbox: %s", len(messages), e)
+        for offset, record in records:
+            orders.set_status(record.order_id, "Queueing Failed")
+            results[offset] = bulk_error(first_index + offset, 500,
+                                         "Failed to queue order for processing. Please try again later.")
+        reservations.release_many([record.reservation_id for _, record in records])
+        emit_to_users('orders_error', [record for _, record in records], {'error': 'Queueing Failed'})
+        return
+    except Exception:
+        reservations.release_many([record.reservation_id for _, record in records])
+        raise
+
+    if not reservations.shared:
+        # In-process engine: the consumer cannot see these reservations, so the stock is taken for good now.
+        reservations.commit_orders(messages)
+    for offset, record in records:
+        results[offset] = {"index": first_index + offset, "status": 201, "order": record.to_dict(title_of)}
+    ORDERS_TOTAL.inc('accepted', amount=len(records))
+    producer_log.debug("%d bulk orders created and stored in the outbox.", len(records))
+    # Decision: One event per user in the batch instead of one broadcast per order.
+    with timed('bulk_order', 'emit'):
+        emit_to_users('orders_received', [record for _, record in records], {'status': 'Pending'})
+
+def emit_to_users(event, records, data):
+    """Emits ``event`` once per user, carrying that user's order ids, to the user's room."""
+    by_user = {}
+    for record in records:
+        by_user.setdefault(record.user_id, []).append(record.order_id)
+    for user_id, order_ids in by_user.items():
+        socketio.emit(event, {'order_ids': order_ids, **data}, to=user_room(user_id))
+
+def bulk_summary(results):
+    """Counts new orders, idempotent replays of earlier ones, and rejected orders."""
+    replayed = sum(1 for result in results if result['status'] == 201 and result.get('replayed'))
+    accepted = sum(1 for result in results if result['status'] == 201) - replayed
+    return {"accepted": accepted, "replayed": replayed, "rejected": len(results) - accepted - replayed}
+
+@app.route('/orders/bulk', methods=['POST'])
+def create_orders_bulk():
+    """
+    Places many orders in one request and returns a result per order
+    (201 with the order, or its error status and message); the response is
+    201 when every order was accepted and 207 otherwise.
+
+    JSON body: {"orders": [<POST /orders body>, ...]} (at most
+    BULK_ORDER_MAX_ORDERS). With Content-Type application/x-ndjson the body
+    is one order per line, processed BULK_ORDER_CHUNK_SIZE lines at a time,
+    and results stream back as NDJSON lines followed by a summary line.
+    Idempotency keys go in each order's 'idempotency_key' field.
+    """
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        return Response(stream_with_context(stream_bulk_results(request.stream)), mimetype='application/x-ndjson')
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('orders'), list):
+        return jsonify({"error": "Invalid bulk order data. 'orders' list is required."}), 400
+    if len(data['orders']) > BULK_ORDER_MAX_ORDERS:
+        return jsonify({"error": f"At most {BULK_ORDER_MAX_ORDERS} orders per request;"
+                                 f" use application/x-ndjson for larger batches."}), 413
+    results = place_orders(data['orders'])
+    summary = bulk_summary(results)
+    return jsonify({"results": results, **summary}), 201 if not summary['rejected'] else 207
+
+def stream_bulk_results(stream):
+    """Reads NDJSON orders from ``stream`` in chunks and yields NDJSON results."""
+    index = 0
+    totals = {"accepted": 0, "replayed": 0, "rejected": 0}
+    chunk = []
+
+    def flush():
+        results = []
+        payloads = [payload for payload in chunk if not isinstance(payload, Exception)]
+        placed = iter(place_orders(payloads, first_index=0))
+        for offset, payload in enumerate(chunk):
+            if isinstance(payload, Exception):
+                results.append(bulk_error(index + offset, 400, f"Invalid JSON line: {payload}"))
+            else:
+                result = next(placed)
+                result['index'] = index + offset
+                results.append(result)
+        for key, value in bulk_summary(results).items():
+            totals[key] += value
+        return ''.join(json.dumps(result) + '\n' for result in results)
+
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            chunk.append(json.loads(line))
+        except ValueError as e:
+            chunk.append(e)
+        if len(chunk) >= BULK_ORDER_CHUNK_SIZE:
+            yield flush()
+            index += len(chunk)
+            chunk = []
+    if chunk:
+        yield flush()
+    yield json.dumps({"summary": totals}) + '\n'
+
+def book_title(book_id):
+    book = books_data.get(book_id)
+    return book['title'] if book else None
+
+def refreshed_order(record):
+    """Marks a pending order Processed once the consumer has committed its shared-store reservation."""
+    if record.status == 'Pending' and record.reservation_id and reservations.shared:
+        reservation = reservations.get(record.reservation_id)
+        if reservation is not None and reservation.status == 'committed':
+            record = orders.set_status(record.order_id, 'Processed') or record
+    return record
+
+@app.route('/orders/<order_id>', methods=['GET'])
+def get_order(order_id):
+    """Returns one order and its current status."""
+    record = orders.get(order_id)
+    if record is None:
+        abort(404, description=f"order with ID {order_id} not found.")
+    return jsonify(refreshed_order(record).to_dict(book_title)), 200
+
+@app.route('/orders', methods=['GET'])
+def list_orders():
+    """
+    Lists one user's orders, newest first. Query params: user_identifier
+    (required), limit (default 20, max 100) and cursor (from X-Next-Cursor).
+    """
+    user_id = request.args.get('user_identifier')
+    if not user_id:
+        return jsonify({"error": "'user_identifier' query parameter is required."}), 400
+    try:
+        limit = int(request.args.get('limit', 20))
+        if not 1 <= limit <= 100:
+            raise ValueError(limit)
+        page, next_cursor = orders.list_for_user(user_id, limit=limit, cursor=request.args.get('cursor') or None)
+    except ValueError:
+        return jsonify({"error": "'limit' must be between 1 and 100 and 'cursor' must come from a previous page."}), 400
+    response = jsonify([refreshed_order(record).to_dict(book_title) for record in page])
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{url_for("list_orders", **dict(request.args, cursor=next_cursor))}>; rel="next"'
+    return response, 200
+
+@app.before_request
+def sync_shared_catalog():
+    # A catalog file may have been changed by another worker; cached pages and indexes follow catalog_version.
+    data_store.sync_catalog_version()
+
+if INSTRUMENTATION_ENABLED:
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_latency(response):
+        started = g.get('request_started')
+        if started is not None:
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, request.method,
+                                         request.endpoint or 'unmatched', str(response.status_code))
+        return response
+
+REGISTRY.gauge_callback('library_outbox_pending_messages', 'Order messages waiting in the outbox.',
+                        order_outbox.pending_count)
+REGISTRY.gauge_callback('library_outbox_dead_letters', 'Order messages the broker kept refusing (outbox_dead_letters).',
+                        order_outbox.dead_letter_count)
+REGISTRY.gauge_callback('library_orders_in_memory', 'Orders held in memory by the order store.',
+                        lambda: orders.stats()['in_memory'])
+REGISTRY.gauge_callback('library_status_events_buffered', 'Consumer status events waiting to be dispatched.',
+                        lambda: status_relay.stats()['buffered'])
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Counters, gauges and latency histograms in the Prometheus text format."""
+    return Response(REGISTRY.render(), mimetype=None, content_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.route('/orders/events/stats', methods=['GET'])
+def get_status_event_stats():
+    """Order status events received from consumers, coalesced and dispatched to SocketIO rooms."""
+    return jsonify(status_relay.stats()), 200
+
+@app.route('/orders/stats', methods=['GET'])
+def get_order_store_stats():
+    """How many orders are held in memory and how many were archived to disk."""
+    return jsonify(orders.stats()), 200
+
 @socketio.on('connect')
 def handle_connect():
     # Decision: Log when a client connects via SocketIO.
-    print(f"Client connected: {request.sid}")
+    socket_log.debug("Client connected: %s", request.sid)
 
 @socketio.on('disconnect')
 def handle_disconnect():
     # Decision: Log when a client disconnects.
-    print(f"Client disconnected: {request.sid}")
+    socket_log.debug("Client disconnected: %s", request.sid)
+
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """
+    Joins the rooms for {'order_id': ...} and/or {'user_identifier': ...}, so
+    order_received / order_status_update events for them reach this client.
+    """
+    rooms = subscription_rooms(data)
+    if not rooms:
+        emit('subscription_error', {"error": "'order_id' or 'user_identifier' is required."})
+        return
+    for room in rooms:
+        join_room(room)
+    emit('subscribed', {"rooms": rooms})
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe(data):
+    for room in subscription_rooms(data):
+        leave_room(room)
+
+def subscription_rooms(data):
+    if not isinstance(data, dict):
+        return []
+    rooms = []
+    if isinstance(data.get('order_id'), str) and data['order_id']:
+        rooms.append(order_room(data['order_id']))
+    if isinstance(data.get('user_identifier'), str) and data['user_identifier']:
+        rooms.append(user_room(data['user_identifier']))
+    return rooms
+
+def relay_order_status(event):
+    """Applies a consumer's status transition to the order store and tells the order's and user's rooms."""
+    record = orders.set_status(event['order_id'], event['status'])
+    user_id = record.user_id if record is not None else event.get('user_identifier')
+    rooms = [order_room(event['order_id'])] + ([user_room(user_id)] if user_id else [])
+    socketio.emit('order_status_update', {'order_id': event['order_id'], 'status': event['status']}, to=rooms)
+
+# Decision: Consumers run in other processes; their status events reach this server over a RabbitMQ fanout.
+status_relay = StatusRelay(
+    RABBITMQ_URL,
+    relay_order_status,
+    dispatch_interval=float(os.environ.get('STATUS_EVENTS_DISPATCH_INTERVAL', '0.1')),
+    queue_name=os.environ.get('STATUS_EVENTS_QUEUE', '')
+)
+
+@socketio.on('ai_prompt')
+def handle_ai_prompt(data):
+    """
+    Streams an AI answer to the requesting client only: 'ai_chunk' events with
+    incremental text, an 'ai_error' on refusal/failure, and always a final
+    'ai_done' carrying the title match. Same title gating as the HTTP endpoint.
+    """
+    sid = request.sid
+    request_id = data.get('request_id') if isinstance(data, dict) else None
+    request_id = request_id or str(uuid.uuid4())
+    if not isinstance(data, dict) or not isinstance(data.get('query'), str) or not data['query']:
+        emit('ai_error', {"request_id": request_id, "error": {"message": "Invalid request. 'query' field (string) is required."}, "status": "failed"}, to=sid)
+        emit('ai_done', {"request_id": request_id, "title_match": None, "status": "failed"}, to=sid)
+        return
+
+    user_query = data['query']
+    socket_log.info("Streaming AI query for %s: '%s...'", sid, user_query[:100])
+    # Decision: Stop generating as soon as the requesting client is gone.
+    is_cancelled = lambda: not socketio.server.manager.is_connected(sid, '/')
+    status, title_match = 'success', None
+    for kind, payload in ai_service.stream_ai_response(user_query, is_cancelled=is_cancelled, client_id=ai_client_id()):
+        if kind == 'chunk':
+            emit('ai_chunk', {"request_id": request_id, "text": payload}, to=sid)
+        elif kind == 'done':
+            title_match = payload.get('title_match')
+        else:
+            error_payload = ai_error_payload(payload)
+            status, title_match = payload.get('status', 'failed'), payload.get('title_match')
+            emit('ai_error', {"request_id": request_id, "error": error_payload, "status": status}, to=sid)
+    if is_cancelled():
+        AI_REQUESTS_TOTAL.inc('socketio', 'cancelled')
+        return
+    AI_REQUESTS_TOTAL.inc('socketio', status)
+    emit('ai_done', {"request_id": request_id, "title_match": title_match, "status": status}, to=sid)
+
+def client_disconnect_probe():
+    """
+    Returns a callable telling whether the HTTP client of the current request has
+    closed its connection, or None when the server does not expose the socket
+    (only the eventlet server does).
+    """
+    client_socket = getattr(request.environ.get('eventlet.input'), '_sock', None)
+    raw_socket = getattr(client_socket, 'fd', client_socket)
+    if raw_socket is None:
+        return None
+
+    def disconnected():
+        try:
+            # An orderly shutdown from the peer reads as b'' without consuming anything.
+            return raw_socket.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b''
+        except BlockingIOError:
+            return False
+        except OSError:
+            return True
+    return disconnected
+
+def ai_error_payload(result):
+    """Builds the API's {"message": ...} error shape from an ai_service error result."""
+    error_payload = result['error'] if isinstance(result['error'], dict) else {"message": str(result['error'])}
+    if result.get('suggestions'):
+        error_payload = dict(error_payload, suggestions=result['suggestions'], total_titles=result.get('total_titles'))
+    if result.get('retry_after'):
+        error_payload = dict(error_payload, retry_after=result['retry_after'])
+    return error_payload
+
+# HTTP status for non-success AI results; 499 is the de-facto "client closed request" code.
+AI_ERROR_HTTP_STATUS = {'refused': 400, 'rate_limited': 429, 'cancelled': 499, 'overloaded': 503, 'timeout': 504}
+
+# Rate limits apply per client IP; behind a proxy set this to the header carrying the real client (e.g. X-Forwarded-For).
+AI_CLIENT_ID_HEADER = os.environ.get('AI_CLIENT_ID_HEADER', '')
+
+def ai_client_id():
+    """Identifies the client of the current HTTP or SocketIO request for the AI rate limit."""
+    if AI_CLIENT_ID_HEADER:
+        forwarded = request.headers.get(AI_CLIENT_ID_HEADER, '')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.remote_addr or 'unknown'
+
+# Decision: pydantic-ai and the model are loaded lazily; warm-up loads them right after the server starts listening.
+AI_WARMUP = os.environ.get('AI_WARMUP', '1').lower() not in ('0', 'false', 'no')
+
+def start_ai_warm_up():
+    """Runs ai_service.warm_up on an OS thread so the hub keeps serving; start it with socketio.start_background_task."""
+    if AI_WARMUP:
+        threading.Thread(target=ai_service.warm_up, name='ai-warm-up', daemon=True).start()
 
 @app.route('/api/v1/ai/prompt', methods=['POST'])
 def handle_ai_chat():
@@ -232,51 +756,94 @@ def handle_ai_chat():
         return jsonify({"error": {"message": "Invalid request. 'query' field (string) is required."}, "status": "failed"}), 400
 
     user_query = data['query']
-    print(f"INFO [API]: Received AI query: '{user_query[:100]}...'") # Log query snippet
+    log.info("Received AI query: '%s...'", user_query[:100]) # Log query snippet
 
     try:
-        # --- Get available titles (already checked for list return in service) ---
-        available_titles = ai_service.get_available_book_titles()
-        # Optional: Add a redundant check here if you are paranoid
-        if not isinstance(available_titles, list):
-             print("CRITICAL ERROR [API]: get_available_titles did not return a list!")
-             # Use the specific error message structure
-             return jsonify({"error": {"message": "Internal configuration error fetching allowed titles."}, "status": "failed"}), 500
-
-        # --- Call the main AI processing function ---
-        result = ai_service.get_ai_response(user_query, available_titles)
+        # --- Call the main AI processing function (waits cooperatively; aborted if the client disconnects) ---
+        # Decision: No title list is passed, so the service matches against the whole catalog with its index.
+        result = ai_service.get_ai_response(user_query, is_cancelled=client_disconnect_probe(),
+                                            client_id=ai_client_id())
 
         # --- Process the structured response from the AI service ---
         if not isinstance(result, dict):
-            print(f"CRITICAL ERROR [API]: ai_service.get_ai_response did not return a dict! Got: {type(result)}")
+            log.critical("ai_service.get_ai_response did not return a dict! Got: %s", type(result))
             return jsonify({"error": {"message": "Internal server error processing AI request."}, "status": "failed"}), 500
 
         # Check if the service returned an error payload
         if 'error' in result:
-            error_payload = result['error']
+            # The service reports errors as plain strings; keep the API's {"message": ...} shape.
+            error_payload = ai_error_payload(result)
             status = result.get('status', 'failed') # Get status if present
-            print(f"WARN [API]: AI service returned error: {error_payload.get('message')}")
+            if status in ('rate_limited', 'overloaded'):
+                log.debug("AI request turned away (%s).", status) # Expected during spikes; counted in /metrics
+            else:
+                log.warning("AI service returned error: %s", error_payload.get('message'))
+            AI_REQUESTS_TOTAL.inc('http', status)
             # Determine HTTP status code (e.g., 400 for refusal, 500 for internal AI failure)
-            http_status_code = 400 if status == 'refused' else 500
+            http_status_code = AI_ERROR_HTTP_STATUS.get(status, 500)
+            if result.get('retry_after'):
+                return jsonify({"error": error_payload}), http_status_code, {'Retry-After': str(result['retry_after'])}
             return jsonify({"error": error_payload}), http_status_code
         # Check if the service returned a data payload
         elif 'data' in result:
-             print("INFO [API]: AI service returned success.")
+             AI_REQUESTS_TOTAL.inc('http', 'success')
+             log.debug("AI service returned success.")
              return jsonify(result['data']), 200 # Return just the inner data part for success
         else:
              # Should not happen if ai_service returns consistent format
-             print("CRITICAL ERROR [API]: AI service returned unknown structure.")
+             log.critical("AI service returned unknown structure.")
              return jsonify({"error": {"message": "Internal server error: Unknown AI response format."}, "status": "failed"}), 500
 
     except Exception as e:
         # Catch unexpected errors in the API handler itself
-        print(f"CRITICAL ERROR [API]: Unexpected error in handle_ai_chat: {e}")
+        log.critical("Unexpected error in handle_ai_chat: %s", e)
         return jsonify({"error": {"message": "An unexpected server error occurred handling AI request."}, "status": "failed"}), 500
 
 
+@app.route('/api/v1/ai/cache/stats', methods=['GET'])
+def get_ai_cache_stats():
+    #Returns hit/miss counters of the AI answer cache
+    return jsonify(ai_service.get_cache_stats()), 200
+
+@app.route('/api/v1/ai/admission/stats', methods=['GET'])
+def get_ai_admission_stats():
+    """Admitted, queued, rate-limited and shed AI requests, and the slots in use."""
+    return jsonify(ai_service.get_admission_stats()), 200
+
+@app.route('/orders/reservations/stats', methods=['GET'])
+def get_reservation_stats():
+    """Held, committed, released, expired and rejected stock reservations."""
+    return jsonify(reservations.stats()), 200
+
+@app.route('/books/cache/stats', methods=['GET'])
+def get_books_cache_stats():
+    """Hit/miss counters of the pre-encoded catalog responses."""
+    return jsonify(catalog_responses.stats()), 200
+
+@app.route('/api/v1/ai/catalog/stats', methods=['GET'])
+def get_ai_catalog_stats():
+    """How many AI prompts were answered from the catalog instead of the LLM."""
+    return jsonify(ai_service.get_catalog_answer_stats()), 200
+
+@app.route('/api/v1/ai/executor/stats', methods=['GET'])
+def get_ai_executor_stats():
+    #Returns concurrency, timeout and cancellation counters of the AI executor
+    return jsonify(ai_service.get_executor_stats()), 200
+
+
+def start_background_services():
+    """Starts the publisher, the outbox flusher, the status relay and the AI warm-up of this process."""
+    order_publisher.start()
+    order_outbox.start()
+    status_relay.start()
+    socketio.start_background_task(status_relay.run_dispatcher)
+    socketio.start_background_task(start_ai_warm_up)
 
 if __name__ == '__main__':
-    print("Starting Flask-SocketIO server...")
+    log.info("Starting Flask-SocketIO server...")
+    # Decision: debug=True runs this file in a reloader watcher and in a serving child; only the child may flush the outbox.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services()
     socketio.run(app, debug=True, host='0.0.0.0', port=5000, allow_unsafe_werkzeug=True)
 
 
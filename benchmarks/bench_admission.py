@@ -0,0 +1,152 @@
+"""
+AI admission control under a spike: --clients clients send AI prompts that
+miss the answer cache to a server whose fake model answers in
+--model-latency-ms, first with admission control off, then on. Reports per
+run the latency of answered prompts, how many were turned away (429/503) and
+how quickly, and the latency of a cached prompt asked throughout the spike.
+Clients wait out Retry-After like well-behaved clients do.
+
+    python benchmarks/bench_admission.py --clients 64 --duration 10
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from argparse import Namespace
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from loadtest import free_port, percentile, start_server
+
+
+def ask(connection: http.client.HTTPConnection, query: str, client_id: str):
+    connection.request('POST', '/api/v1/ai/prompt', body=json.dumps({"query": query}),
+                       headers={'Content-Type': 'application/json', 'X-Client-Id': client_id})
+    response = connection.getresponse()
+    response.read()
+    return response.status, response.getheader('Retry-After')
+
+
+def spike_client(port: int, index: int, title: str, deadline: float, results: Dict[str, List[float]], lock):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    n = 0
+    while time.monotonic() < deadline:
+        n += 1
+        started = time.perf_counter()
+        try:
+            status, retry_after = ask(connection, f"What themes does {title} explore? (spike {index}-{n})",
+                                      f"spike-{index}")
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            status, retry_after = 'failed', None
+        with lock:
+            results[str(status)].append(time.perf_counter() - started)
+        if retry_after:
+            time.sleep(max(0.0, min(float(retry_after), deadline - time.monotonic())))
+    connection.close()
+
+
+def cached_probe(port: int, query: str, deadline: float, results: Dict[str, List[float]], lock):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        status, _ = ask(connection, query, 'probe')
+        with lock:
+            results[str(status)].append(time.perf_counter() - started)
+        time.sleep(0.02)
+    connection.close()
+
+
+def latency(values: List[float]) -> Dict[str, Any]:
+    values = sorted(values)
+    return {"count": len(values), **{f"p{int(q * 100)}_ms": round(percentile(values, q) * 1000, 1)
+                                      for q in (0.5, 0.95, 0.99)}}
+
+
+def run(args, admission: bool) -> Dict[str, Any]:
+    os.environ.update(AI_CLIENT_ID_HEADER='X-Client-Id', AI_MAX_CONCURRENCY=str(args.executor_concurrency),
+                      AI_ADMISSION_MAX_CONCURRENT=str(args.max_concurrent if admission else 0),
+                      AI_ADMISSION_QUEUE_SIZE=str(args.queue_size),
+                      AI_ADMISSION_QUEUE_TIMEOUT=str(args.queue_timeout),
+                      AI_RATE_LIMIT_PER_SECOND=str(args.rate if admission else 0),
+                      AI_RATE_LIMIT_BURST=str(args.burst))
+    server_args = Namespace(model_latency_ms=args.model_latency_ms, publish_latency_ms=1.0, notify_latency_ms=0.0,
+                            consumer_mode='batch', workers=1)
+    port = free_port()
+    server = start_server(server_args, port, tempfile.mkdtemp(prefix='bench-admission-'))
+    try:
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        connection.request('GET', '/books?limit=1000')
+        books = json.loads(connection.getresponse().read())
+        cached_query = f"Tell me about {books[0]['title']}"
+        ask(connection, cached_query, 'probe')  # Computes and caches the probe's answer.
+
+        lock = threading.Lock()
+        spike: Dict[str, List[float]] = defaultdict(list)
+        probe: Dict[str, List[float]] = defaultdict(list)
+        deadline = time.monotonic() + args.duration
+        threads = [threading.Thread(target=spike_client, daemon=True,
+                                    args=(port, i, books[i % len(books)]['title'], deadline, spike, lock))
+                   for i in range(args.clients)]
+        threads.append(threading.Thread(target=cached_probe, args=(port, cached_query, deadline, probe, lock),
+                                        daemon=True))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        connection.request('GET', '/api/v1/ai/admission/stats')
+        server_stats = json.loads(connection.getresponse().read())
+        connection.close()
+        answered = spike.pop('200', [])
+        return {
+            "answered": dict(latency(answered), throughput_rps=round(len(answered) / args.duration, 2)),
+            "rate_limited": latency(spike.pop('429', [])),
+            "overloaded": latency(spike.pop('503', [])),
+            "other": {status: len(values) for status, values in spike.items()},
+            "cached": dict(latency(probe.pop('200', [])), failed=sum(len(values) for values in probe.values())),
+            "server": server_stats,
+        }
+    finally:
+        server.terminate()
+        try:
+            server.wait(10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=64, help='Concurrent clients in the spike.')
+    parser.add_argument('--duration', type=float, default=8.0)
+    parser.add_argument('--model-latency-ms', type=float, default=200.0)
+    parser.add_argument('--executor-concurrency', type=int, default=8, help='Model calls in flight (AI_MAX_CONCURRENCY).')
+    parser.add_argument('--max-concurrent', type=int, default=8, help='AI_ADMISSION_MAX_CONCURRENT when on.')
+    parser.add_argument('--queue-size', type=int, default=16, help='AI_ADMISSION_QUEUE_SIZE.')
+    parser.add_argument('--queue-timeout', type=float, default=1.0, help='AI_ADMISSION_QUEUE_TIMEOUT (seconds).')
+    parser.add_argument('--rate', type=float, default=2.0, help='AI_RATE_LIMIT_PER_SECOND per client when on.')
+    parser.add_argument('--burst', type=float, default=20.0, help='AI_RATE_LIMIT_BURST.')
+    parser.add_argument('--output', help='Write the JSON results to this file.')
+    args = parser.parse_args()
+
+    results = {"off": run(args, admission=False), "on": run(args, admission=True)}
+    print(f"  {'admission':10} {'answered':>9} {'p50 ms':>8} {'p99 ms':>8} {'429':>6} {'503':>6} "
+          f"{'reject p99':>11} {'cached p99':>11}")
+    for mode, result in results.items():
+        rejected = result['rate_limited']['count'] + result['overloaded']['count']
+        reject_p99 = max(result['rate_limited']['p99_ms'], result['overloaded']['p99_ms']) if rejected else 0.0
+        print(f"  {mode:10} {result['answered']['count']:9} {result['answered']['p50_ms']:8.1f} "
+              f"{result['answered']['p99_ms']:8.1f} {result['rate_limited']['count']:6} "
+              f"{result['overloaded']['count']:6} {reject_p99:11.1f} {result['cached']['p99_ms']:11.1f}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Per-order cost of placing orders one POST /orders at a time vs in
+POST /orders/bulk batches, through the Flask test client against the
+shared SQLite inventory, the order store and the outbox (no broker needed).
+
+    python benchmarks/bench_bulk_orders.py --orders 2000 --batch-size 500
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_orders(count, book_ids, rng):
+    return [{"items": [{"book_id": rng.choice(book_ids), "quantity": 1} for _ in range(rng.randint(1, 3))],
+             "user_identifier": f"user_{rng.randint(1, 500)}"} for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ.setdefault('GEMINI_API_KEY', 'benchmark')
+    os.environ['INVENTORY_DB_PATH'] = os.path.join(directory, 'inventory.db')
+    os.environ['ORDER_LOG_PATH'] = os.path.join(directory, 'orders.log')
+    os.environ['ORDER_OUTBOX_PATH'] = os.path.join(directory, 'outbox.db')
+    os.environ.pop('RABBITMQ_URL', None)
+    import app as api  # noqa: E402 (reads the paths above at import time)
+
+    book_ids = list(api.books_data)
+    # Enough stock that every order is accepted in both runs.
+    for book_id in book_ids:
+        api.reservations.restock(book_id, args.orders * 10)
+    client = api.app.test_client()
+    rng = random.Random(args.seed)
+    print(f"{args.orders} orders, bulk batches of {args.batch_size}")
+
+    orders = make_orders(args.orders, book_ids, rng)
+    started = time.perf_counter()
+    accepted = sum(client.post('/orders', json=order).status_code == 201 for order in orders)
+    single = time.perf_counter() - started
+    print(f"  POST /orders       {single / args.orders * 1e6:8.0f} us/order  ({accepted} accepted)")
+
+    orders = make_orders(args.orders, book_ids, rng)
+    started = time.perf_counter()
+    accepted = 0
+    for start in range(0, args.orders, args.batch_size):
+        response = client.post('/orders/bulk', json={"orders": orders[start:start + args.batch_size]})
+        accepted += response.get_json()['accepted']
+    bulk = time.perf_counter() - started
+    print(f"  POST /orders/bulk  {bulk / args.orders * 1e6:8.0f} us/order  ({accepted} accepted)"
+          f"  {single / bulk:5.1f}x")
+
+    orders = make_orders(args.orders, book_ids, rng)
+    body = '\n'.join(json.dumps(order) for order in orders)
+    started = time.perf_counter()
+    lines = client.post('/orders/bulk', data=body, content_type='application/x-ndjson').get_data(as_text=True)
+    streamed = time.perf_counter() - started
+    accepted = json.loads(lines.strip().splitlines()[-1])['summary']['accepted']
+    print(f"  NDJSON stream      {streamed / args.orders * 1e6:8.0f} us/order  ({accepted} accepted)"
+          f"  {single / streamed:5.1f}x")
+    os._exit(0)  # The outbox flusher thread has no broker to drain to.
+
+
+if __name__ == '__main__':
+    main()
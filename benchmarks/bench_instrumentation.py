@@ -0,0 +1,64 @@
+"""
+Per-call cost of the instrumentation layer on a hot path: stage timers and
+counters with instrumentation enabled and disabled, and the old unconditional
+print against the queued logger (below and at the log level).
+
+    python benchmarks/bench_instrumentation.py --calls 200000
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import instrumentation  # noqa: E402
+from instrumentation import REGISTRY, get_logger, timed  # noqa: E402
+
+
+def per_call(fn, calls):
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - started) / calls * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=200000)
+    args = parser.parse_args()
+    counter = REGISTRY.counter('bench_calls_total', 'Benchmark calls.', ('kind',))
+
+    def timer():
+        with timed('bench', 'stage'):
+            pass
+
+    def count():
+        counter.inc('call')
+
+    print(f"{args.calls} calls each (ns per call)")
+    print(f"  empty call                    {per_call(lambda: None, args.calls):8.0f}")
+    for enabled in (True, False):
+        instrumentation.INSTRUMENTATION_ENABLED = enabled
+        state = 'enabled ' if enabled else 'disabled'
+        print(f"  stage timer ({state})        {per_call(timer, args.calls):8.0f}")
+        print(f"  counter     ({state})        {per_call(count, args.calls):8.0f}")
+
+    order_id = '8c4f6a8e-2d5b-4b8e-9d7a-1f3c5e7a9b0d'
+    sink = io.StringIO()
+    with contextlib.redirect_stdout(sink):
+        printed = per_call(lambda: print(f" [API/PRODUCER] Order {order_id} created and stored in the outbox."),
+                           args.calls)
+    print(f"  print (to a buffer)           {printed:8.0f}")
+    log = get_logger('BENCH')
+    log.setLevel('INFO')
+    print(f"  logger.debug (filtered)       {per_call(lambda: log.debug('Order %s created.', order_id), args.calls):8.0f}")
+    # Records at the level are only enqueued here; the writer thread formats them.
+    log.handlers[0].queue = type('Discard', (), {'put_nowait': staticmethod(lambda record: None)})()
+    print(f"  logger.info (enqueued)        {per_call(lambda: log.info('Order %s created.', order_id), args.calls):8.0f}")
+
+
+if __name__ == '__main__':
+    main()
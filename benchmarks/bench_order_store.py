@@ -0,0 +1,78 @@
+"""
+Memory of the old ever-growing ``orders`` dict vs the bounded OrderStore
+under a steady stream of orders, with the consumer completing orders
+``--consumer-lag`` orders behind the API.
+
+    python benchmarks/bench_order_store.py --orders 50000 --memory-limit 10000 --consumer-lag 20000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+import uuid
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from order_store import OrderRecord, OrderStore  # noqa: E402
+
+TITLES = ["The Hitchhiker's Guide to the Galaxy", "Ogboju Ode Ninu Igbo Irunmole", "1984", "Stay With Me",
+          "Ake: The Years of Childhood", "Pride and Prejudice"]
+
+
+def make_order(rng):
+    lines = [(rng.randint(1, len(TITLES)), rng.randint(1, 3)) for _ in range(rng.randint(1, 3))]
+    return str(uuid.uuid4()), f"user_{rng.randint(1, 5000)}", lines
+
+
+def legacy_order(order_id, user_id, lines):
+    # The dict create_order used to keep forever.
+    return {"order_id": order_id,
+            "items": [{"book_id": b, "title": TITLES[b - 1], "quantity": q, "price_per_item": 0} for b, q in lines],
+            "total_price": 0, "status": "Pending", "user_identifier": user_id}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--orders', type=int, default=50000)
+    parser.add_argument('--memory-limit', type=int, default=10000)
+    parser.add_argument('--consumer-lag', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+    checkpoints = {args.orders * step // 4 for step in range(1, 5)}
+
+    rng = random.Random(args.seed)
+    tracemalloc.start()
+    legacy = {}
+    print(f"{args.orders} orders; OrderStore keeps at most {args.memory_limit} in memory")
+    for count in range(1, args.orders + 1):
+        order_id, user_id, lines = make_order(rng)
+        legacy[order_id] = legacy_order(order_id, user_id, lines)
+        if count in checkpoints:
+            print(f"  legacy dict  after {count:7d} orders: {tracemalloc.get_traced_memory()[0] / 2**20:7.1f} MiB")
+    del legacy
+    tracemalloc.stop()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        store = OrderStore(os.path.join(directory, 'orders.log'), max_memory_orders=args.memory_limit,
+                           archive_after_seconds=1.0)
+        tracemalloc.start()
+        recent = deque()
+        for count in range(1, args.orders + 1):
+            order_id, user_id, lines = make_order(rng)
+            store.add(OrderRecord(order_id, user_id, [(b, q, 0.0) for b, q in lines]))
+            recent.append(order_id)
+            if len(recent) > args.consumer_lag:
+                store.set_status(recent.popleft(), 'Processed')  # the consumer catching up
+            if count in checkpoints:
+                print(f"  OrderStore   after {count:7d} orders: {tracemalloc.get_traced_memory()[0] / 2**20:7.1f} MiB"
+                      f"  ({store.stats()['in_memory']} in memory, {store.stats()['archived']} archived)")
+        tracemalloc.stop()
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Compares the old connect-per-order publish path with the pooled OrderPublisher.
+
+Uses an in-process stand-in for a pika connection that charges a configurable
+handshake cost per connection and a smaller cost per confirmed publish, so
+the numbers show how much of each order is spent in the AMQP handshake.
+
+    python benchmarks/bench_publisher.py --orders 500 --handshake-ms 15 --publish-ms 0.5
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from publisher import OrderPublisher  # noqa: E402
+
+
+class FakeChannel:
+    def __init__(self, publish_cost):
+        self.publish_cost = publish_cost
+        self.is_open = True
+        self.published = 0
+
+    def confirm_delivery(self):
+        pass
+
+    def queue_declare(self, queue, durable=False, passive=False):
+        time.sleep(self.publish_cost)
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        time.sleep(self.publish_cost)  # Round trip for the publisher confirm
+        self.published += 1
+
+
+class FakeConnection:
+    def __init__(self, handshake_cost, publish_cost):
+        time.sleep(handshake_cost)  # TCP connect + AMQP handshake
+        self.publish_cost = publish_cost
+        self.is_open = True
+
+    def channel(self):
+        return FakeChannel(self.publish_cost)
+
+    def process_data_events(self, time_limit=0):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(name, samples):
+    print(f"{name:>16}: p50={percentile(samples, 50) * 1000:7.3f} ms  "
+          f"p99={percentile(samples, 99) * 1000:7.3f} ms  "
+          f"mean={statistics.mean(samples) * 1000:7.3f} ms")
+
+
+def bench_connect_per_order(orders, handshake, publish):
+    samples = []
+    for _ in range(orders):
+        started = time.perf_counter()
+        connection = FakeConnection(handshake, publish)
+        channel = connection.channel()
+        channel.queue_declare(queue='order_processing_queue', durable=True)
+        channel.basic_publish(exchange='', routing_key='order_processing_queue', body=b'{}')
+        connection.close()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def bench_pooled(orders, handshake, publish):
+    publisher = OrderPublisher('amqp://stand-in', pool_size=2,
+                               connection_factory=lambda: FakeConnection(handshake, publish))
+    publisher.start()
+    samples = []
+    for i in range(orders):
+        started = time.perf_counter()
+        publisher.publish({"order_id": str(i), "items": [{"book_id": 1, "quantity": 1}]})
+        samples.append(time.perf_counter() - started)
+    publisher.close()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--orders', type=int, default=300)
+    parser.add_argument('--handshake-ms', type=float, default=15.0)
+    parser.add_argument('--publish-ms', type=float, default=0.5)
+    args = parser.parse_args()
+
+    handshake, publish = args.handshake_ms / 1000.0, args.publish_ms / 1000.0
+    report('connect-per-order', bench_connect_per_order(args.orders, handshake, publish))
+    report('pooled', bench_pooled(args.orders, handshake, publish))
+
+
+if __name__ == '__main__':
+    main()
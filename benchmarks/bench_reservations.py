@@ -0,0 +1,138 @@
+"""
+Contention benchmark for ReservationEngine: hundreds of concurrent orders,
+most of them for a few hot books. Compares the old check-then-decrement
+path (which oversells), one global lock (stripes=1) and striped locks.
+
+Each stock write sleeps ``--write-us`` to stand in for a store round trip,
+so lock hold times (and therefore lock scope) matter as they would in production.
+
+    python benchmarks/bench_reservations.py --orders 400 --threads 64 --hot-books 3
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reservations import InsufficientStock, ReservationEngine  # noqa: E402
+
+
+class SlowStock(dict):
+    """Stock mapping whose writes cost ``write_cost`` seconds (GIL released, like real I/O)."""
+
+    def __init__(self, initial, write_cost):
+        super().__init__(initial)
+        self.write_cost = write_cost
+
+    def __setitem__(self, key, value):
+        time.sleep(self.write_cost)
+        super().__setitem__(key, value)
+
+
+def make_orders(count, hot_books, cold_books, hot_share, rng):
+    orders = []
+    for _ in range(count):
+        lines = []
+        for _ in range(rng.randint(1, 3)):
+            if rng.random() < hot_share:
+                book_id = rng.randint(1, hot_books)
+            else:
+                book_id = hot_books + rng.randint(1, cold_books)
+            lines.append((book_id, rng.randint(1, 2)))
+        orders.append(lines)
+    return orders
+
+
+def legacy_place(stock, lines):
+    # The old create_order: check each line, then decrement later with no reservation.
+    for book_id, quantity in lines:
+        if stock.get(book_id, 0) < quantity:
+            return False
+    for book_id, quantity in lines:
+        stock[book_id] = stock.get(book_id, 0) - quantity
+    return True
+
+
+def run(place, orders, threads):
+    latencies = []
+    accepted = []
+    lock = threading.Lock()
+
+    def one(lines):
+        started = time.perf_counter()
+        ok = place(lines)
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if ok:
+                accepted.append(lines)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, orders))
+    return time.perf_counter() - started, latencies, accepted
+
+
+def report(name, elapsed, latencies, accepted, initial, orders):
+    # Oversold = units promised to accepted orders beyond what each book had.
+    sold = {}
+    for lines in accepted:
+        for book_id, quantity in lines:
+            sold[book_id] = sold.get(book_id, 0) + quantity
+    oversold = sum(max(0, quantity - initial[book_id]) for book_id, quantity in sold.items())
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"  {name:<16} {len(orders) / elapsed:8.0f} orders/s  p50 {statistics.median(latencies) * 1000:6.2f} ms"
+          f"  p99 {p99 * 1000:6.2f} ms  accepted {len(accepted):4d}  units sold {sum(sold.values()):5d}"
+          f"  oversold {oversold}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--orders', type=int, default=400)
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--hot-books', type=int, default=3)
+    parser.add_argument('--cold-books', type=int, default=200)
+    parser.add_argument('--hot-share', type=float, default=0.8)
+    parser.add_argument('--hot-stock', type=int, default=150)
+    parser.add_argument('--cold-stock', type=int, default=20)
+    parser.add_argument('--write-us', type=float, default=200)
+    parser.add_argument('--seed', type=int, default=11)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    orders = make_orders(args.orders, args.hot_books, args.cold_books, args.hot_share, rng)
+    initial = {book_id: args.hot_stock for book_id in range(1, args.hot_books + 1)}
+    initial.update({book_id: args.cold_stock
+                    for book_id in range(args.hot_books + 1, args.hot_books + args.cold_books + 1)})
+    write_cost = args.write_us / 1e6
+
+    print(f"{args.orders} orders on {args.threads} threads; {args.hot_books} hot books "
+          f"({args.hot_share:.0%} of lines), {args.cold_books} cold books, {args.write_us:.0f} us per stock write")
+
+    stock = SlowStock(initial, write_cost)
+    report('check-then-act', *run(lambda lines: legacy_place(stock, lines), orders, args.threads),
+           initial, orders)
+
+    for name, stripes in (('global lock', 1), ('striped (64)', 64)):
+        stock = SlowStock(initial, write_cost)
+        engine = ReservationEngine(stock, stripes=stripes)
+
+        def place(lines, engine=engine):
+            try:
+                reservation, _ = engine.reserve(lines)
+            except InsufficientStock:
+                return False
+            engine.commit(reservation.reservation_id)
+            return True
+
+        report(name, *run(place, orders, args.threads), initial, orders)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Cold-start cost: each target runs in a fresh interpreter (so nothing is
+cached in sys.modules) and the median of several runs is reported. With
+--baseline it exits 1 when a target got slower than the stored run by more
+than --tolerance.
+
+    python benchmarks/bench_startup.py --repeat 7 --output startup.json
+    python benchmarks/bench_startup.py --repeat 7 --baseline startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each snippet prints the seconds its measured part took.
+TARGETS = {
+    'import app': "import time; t = time.perf_counter(); import app; print(time.perf_counter() - t)",
+    'import consumer': "import time; t = time.perf_counter(); import consumer; print(time.perf_counter() - t)",
+    'import ai_service': "import time; t = time.perf_counter(); import ai_service; print(time.perf_counter() - t)",
+    # What the first AI request would pay without warm-up: pydantic-ai, the model, an agent, the title index.
+    'ai warm_up': ("import time, app, ai_service; t = time.perf_counter(); ai_service.warm_up(); "
+                   "print(time.perf_counter() - t)"),
+}
+
+
+def run_target(snippet: str, env) -> float:
+    output = subprocess.run([sys.executable, '-c', snippet], cwd=ROOT, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='Write the JSON results to this file.')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative slowdown (default 0.25).')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    env = dict(os.environ, GEMINI_API_KEY=os.environ.get('GEMINI_API_KEY', 'benchmark'), LOG_LEVEL='WARNING',
+               INVENTORY_DB_PATH=os.path.join(directory, 'inventory.db'),
+               ORDER_LOG_PATH=os.path.join(directory, 'orders.log'),
+               ORDER_OUTBOX_PATH=os.path.join(directory, 'outbox.db'))
+    env.pop('RABBITMQ_URL', None)
+    run_target(TARGETS['import app'], env)  # Creates the SQLite files and the .pyc caches first.
+
+    results = {}
+    for name, snippet in TARGETS.items():
+        times = [run_target(snippet, env) for _ in range(args.repeat)]
+        results[name] = {"median_ms": round(statistics.median(times) * 1000, 1), "min_ms": round(min(times) * 1000, 1)}
+        print(f"  {name:18} median {results[name]['median_ms']:7.1f} ms   min {results[name]['min_ms']:7.1f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = [f"{name}: {old['median_ms']} -> {results[name]['median_ms']} ms"
+                       for name, old in baseline.items()
+                       if name in results and results[name]['median_ms'] > old['median_ms'] * (1 + args.tolerance)]
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
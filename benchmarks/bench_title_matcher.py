@@ -0,0 +1,91 @@
+"""
+Compares the original per-title ``title.lower() in query`` loop with the
+Aho-Corasick TitleIndex used by ai_service.extract_title.
+
+    python benchmarks/bench_title_matcher.py --titles 20000 --queries 2000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from title_matcher import TitleIndex  # noqa: E402
+
+WORDS = ("night river house garden shadow empire child stone fire song years city moon "
+         "queen road winter iron forest letter kingdom salt glass voice heart island").split()
+
+
+def legacy_extract_title(query, known_titles):
+    # The loop extract_title used before the matcher index.
+    lower_query = query.lower()
+    for title in known_titles:
+        if title.lower() in lower_query:
+            return title
+    return None
+
+
+def make_catalog(size, rng):
+    books = {}
+    for book_id in range(1, size + 1):
+        title = ' '.join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(2, 5))) + f" {book_id}"
+        books[book_id] = {"id": book_id, "title": title, "author": f"Author {book_id}"}
+    return books
+
+
+def make_queries(books, count, rng):
+    titles = [details['title'] for details in books.values()]
+    queries = []
+    for i in range(count):
+        if i % 4 == 3:
+            queries.append("what is the meaning of life and everything in between?")
+        else:
+            queries.append(f"Can you summarize {rng.choice(titles)} for me please?")
+    return queries
+
+
+def timed(fn, queries):
+    started = time.perf_counter()
+    results = [fn(query) for query in queries]
+    return time.perf_counter() - started, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--titles', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    books = make_catalog(args.titles, rng)
+    titles = [details['title'] for details in books.values()]
+    queries = make_queries(books, args.queries, rng)
+
+    index = TitleIndex()
+    started = time.perf_counter()
+    index.sync(books, version=1)
+    index.match("warm up")  # failure links are built lazily
+    build = time.perf_counter() - started
+
+    books[args.titles + 1] = {"id": args.titles + 1, "title": "A Newly Added Title", "author": "New Author"}
+    started = time.perf_counter()
+    index.sync(books, version=2)
+    index.match("warm up")
+    incremental = time.perf_counter() - started
+
+    legacy_time, _ = timed(lambda q: legacy_extract_title(q, titles), queries)
+    index_time, _ = timed(index.match, queries)
+
+    print(f"catalog={args.titles} titles, {args.queries} queries")
+    print(f"  index build:        {build * 1000:9.1f} ms")
+    print(f"  incremental sync:   {incremental * 1000:9.1f} ms (one title added)")
+    print(f"  legacy loop:        {legacy_time / args.queries * 1e6:9.1f} us/query")
+    print(f"  aho-corasick index: {index_time / args.queries * 1e6:9.1f} us/query "
+          f"({legacy_time / index_time:.0f}x faster)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+"""
+In-process stand-ins for RabbitMQ and Gemini, so the API, the outbox, the
+consumer and the status relay can run (and be measured) without a broker or
+an API key.
+
+``FakeBroker`` implements the subset of pika's BlockingConnection API this
+project uses (queues, fanout exchanges, publisher confirms, prefetch, acks,
+``call_later`` / ``add_callback_threadsafe``); ``install(broker)`` routes every
+``pika.BlockingConnection(...)`` in the process to it. ``fake_model`` is a
+deterministic pydantic-ai model with configurable latency.
+"""
+import asyncio
+import hashlib
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+import pika
+from pydantic_ai.messages import ModelResponse, TextPart, UserPromptPart
+from pydantic_ai.models.function import FunctionModel
+
+
+class FakeBroker:
+    """Queues and fanout exchanges shared by every FakeConnection of the process."""
+
+    def __init__(self, publish_latency: float = 0.0):
+        self.publish_latency = publish_latency
+        self.cond = threading.Condition()
+        self.queues: Dict[str, Deque[Tuple[bytes, Any]]] = {}
+        self.exchanges: Dict[str, Set[str]] = {}
+        self._names = itertools.count(1)
+        self.published = 0
+
+    def connect(self, parameters=None) -> 'FakeConnection':
+        return FakeConnection(self)
+
+    def declare_queue(self, name: str, passive: bool = False) -> str:
+        with self.cond:
+            if not name:
+                name = f"amq.gen-{next(self._names)}"
+            if passive and name not in self.queues:
+                raise pika.exceptions.ChannelClosedByBroker(404, f"NOT_FOUND - no queue '{name}'")
+            self.queues.setdefault(name, deque())
+            return name
+
+    def publish(self, exchange: str, routing_key: str, body, properties=None, mandatory: bool = False):
+        if self.publish_latency:
+            time.sleep(self.publish_latency)  # Publisher-confirm round trip.
+        body = body.encode('utf-8') if isinstance(body, str) else body
+        with self.cond:
+            if exchange:
+                targets = list(self.exchanges.get(exchange, ()))
+            else:
+                targets = [routing_key] if routing_key in self.queues else []
+                if not targets and mandatory:
+                    raise pika.exceptions.UnroutableError([])
+            for name in targets:
+                self.queues[name].append((body, properties))
+            self.published += 1
+            self.cond.notify_all()
+
+    def depth(self, name: str) -> int:
+        with self.cond:
+            return len(self.queues.get(name, ()))
+
+
+class _Consumer:
+    __slots__ = ('tag', 'queue', 'callback', 'auto_ack')
+
+    def __init__(self, tag, queue, callback, auto_ack):
+        self.tag, self.queue, self.callback, self.auto_ack = tag, queue, callback, auto_ack
+
+
+class FakeChannel:
+    def __init__(self, connection: 'FakeConnection'):
+        self.connection = connection
+        self.broker = connection.broker
+        self.is_open = True
+        self.prefetch_count = 0
+        self.consumers: Dict[str, _Consumer] = {}
+        self.unacked: Dict[int, Tuple[str, bytes, Any]] = {}
+        self._tags = itertools.count(1)
+        self._consuming = False
+
+    # --- Declarations ---
+
+    def confirm_delivery(self):
+        pass
+
+    def queue_declare(self, queue: str = '', durable: bool = False, passive: bool = False, exclusive: bool = False,
+                      auto_delete: bool = False):
+        name = self.broker.declare_queue(queue, passive)
+        return SimpleNamespace(method=SimpleNamespace(queue=name, message_count=self.broker.depth(name)))
+
+    def exchange_declare(self, exchange: str, exchange_type: str = 'fanout', durable: bool = False):
+        with self.broker.cond:
+            self.broker.exchanges.setdefault(exchange, set())
+
+    def queue_bind(self, queue: str, exchange: str, routing_key: Optional[str] = None):
+        with self.broker.cond:
+            self.broker.exchanges.setdefault(exchange, set()).add(queue)
+
+    # --- Publishing ---
+
+    def basic_publish(self, exchange: str, routing_key: str, body, properties=None, mandatory: bool = False):
+        self.broker.publish(exchange, routing_key, body, properties, mandatory)
+
+    # --- Consuming ---
+
+    def basic_qos(self, prefetch_count: int = 0):
+        self.prefetch_count = prefetch_count
+
+    def basic_consume(self, queue: str, on_message_callback: Callable, auto_ack: bool = False) -> str:
+        tag = f"ctag-{id(self)}-{len(self.consumers) + 1}"
+        self.consumers[tag] = _Consumer(tag, queue, on_message_callback, auto_ack)
+        return tag
+
+    def basic_cancel(self, consumer_tag: str):
+        self.consumers.pop(consumer_tag, None)
+
+    def basic_ack(self, delivery_tag: int = 0, multiple: bool = False):
+        if multiple:
+            for tag in [tag for tag in self.unacked if tag <= delivery_tag]:
+                del self.unacked[tag]
+        else:
+            self.unacked.pop(delivery_tag, None)
+
+    def basic_nack(self, delivery_tag: int = 0, multiple: bool = False, requeue: bool = True):
+        tags = [tag for tag in self.unacked if tag <= delivery_tag] if multiple else [delivery_tag]
+        for tag in tags:
+            entry = self.unacked.pop(tag, None)
+            if entry is not None and requeue:
+                with self.broker.cond:
+                    self.broker.queues[entry[0]].appendleft((entry[1], entry[2]))
+                    self.broker.cond.notify_all()
+
+    def _next_delivery(self):
+        """Pops one message for one of this channel's consumers, respecting the prefetch window."""
+        if self.prefetch_count and len(self.unacked) >= self.prefetch_count:
+            return None
+        for consumer in self.consumers.values():
+            queue = self.broker.queues.get(consumer.queue)
+            if queue:
+                body, properties = queue.popleft()
+                tag = next(self._tags)
+                if not consumer.auto_ack:
+                    self.unacked[tag] = (consumer.queue, body, properties)
+                return consumer, tag, body, properties
+        return None
+
+    def start_consuming(self):
+        self._consuming = True
+        while self._consuming and self.connection.is_open:
+            self.connection.process_data_events(time_limit=0.1)
+
+    def stop_consuming(self):
+        self._consuming = False
+
+    def close(self):
+        self.is_open = False
+        for tag in sorted(self.unacked, reverse=True):
+            queue, body, properties = self.unacked.pop(tag)
+            with self.broker.cond:
+                self.broker.queues[queue].appendleft((body, properties))
+        with self.broker.cond:
+            self.broker.cond.notify_all()
+
+
+class FakeConnection:
+    """One pika-style connection; callbacks and deliveries run on whichever thread drives ``process_data_events``."""
+
+    def __init__(self, broker: FakeBroker):
+        self.broker = broker
+        self.is_open = True
+        self._channels: List[FakeChannel] = []
+        self._callbacks: Deque[Callable] = deque()
+        self._timers: List[Tuple[float, int, Callable]] = []
+        self._cancelled: Set[int] = set()
+        self._timer_ids = itertools.count(1)
+
+    def channel(self) -> FakeChannel:
+        channel = FakeChannel(self)
+        self._channels.append(channel)
+        return channel
+
+    def add_callback_threadsafe(self, callback: Callable):
+        with self.broker.cond:
+            self._callbacks.append(callback)
+            self.broker.cond.notify_all()
+
+    def call_later(self, delay: float, callback: Callable) -> int:
+        timer_id = next(self._timer_ids)
+        with self.broker.cond:
+            heapq.heappush(self._timers, (time.monotonic() + delay, timer_id, callback))
+        return timer_id
+
+    def remove_timeout(self, timer_id: int):
+        self._cancelled.add(timer_id)
+
+    def _due_work(self):
+        """Returns one callable to run now, or None; must be called with the broker lock held."""
+        if self._callbacks:
+            return self._callbacks.popleft()
+        while self._timers and self._timers[0][0] <= time.monotonic():
+            _, timer_id, callback = heapq.heappop(self._timers)
+            if timer_id in self._cancelled:
+                self._cancelled.discard(timer_id)
+                continue
+            return callback
+        for channel in self._channels:
+            if channel.is_open:
+                delivery = channel._next_delivery()
+                if delivery is not None:
+                    consumer, tag, body, properties = delivery
+                    method = SimpleNamespace(delivery_tag=tag, consumer_tag=consumer.tag, routing_key=consumer.queue)
+                    return lambda: consumer.callback(channel, method, properties, body)
+        return None
+
+    def process_data_events(self, time_limit: Optional[float] = 0):
+        deadline = time.monotonic() + (time_limit or 0)
+        while self.is_open:
+            with self.broker.cond:
+                work = self._due_work()
+                if work is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+                    next_timer = self._timers[0][0] - time.monotonic() if self._timers else remaining
+                    self.broker.cond.wait(max(0.0, min(remaining, next_timer)))
+                    continue
+            work()
+
+    def sleep(self, duration: float):
+        self.process_data_events(time_limit=duration)
+
+    def close(self):
+        if not self.is_open:
+            return
+        for channel in self._channels:
+            channel.close()
+        self.is_open = False
+
+
+def install(broker: FakeBroker):
+    """Makes every ``pika.BlockingConnection(...)`` in this process connect to ``broker``."""
+    pika.BlockingConnection = broker.connect
+
+
+def fake_answer(prompt: str, words: int) -> List[str]:
+    """Deterministic answer text for a prompt, as a list of word chunks."""
+    digest = hashlib.sha1(prompt.encode('utf-8')).hexdigest()
+    return [f"{digest[i % 40:i % 40 + 6]} " for i in range(words)]
+
+
+def _last_prompt(messages) -> str:
+    for message in reversed(messages):
+        for part in getattr(message, 'parts', ()):
+            if isinstance(part, UserPromptPart) and isinstance(part.content, str):
+                return part.content
+    return ''
+
+
+def fake_model(latency: float = 0.2, words: int = 40, first_chunk_latency: Optional[float] = None) -> FunctionModel:
+    """
+    A pydantic-ai model answering every prompt after ``latency`` seconds with
+    ``words`` deterministic words; streamed answers deliver the first chunk
+    after ``first_chunk_latency`` and spread the rest over the remaining time.
+    """
+    first = latency / 4 if first_chunk_latency is None else first_chunk_latency
+
+    async def answer(messages, info):
+        await asyncio.sleep(latency)
+        return ModelResponse(parts=[TextPart(''.join(fake_answer(_last_prompt(messages), words)))])
+
+    async def stream(messages, info):
+        chunks = fake_answer(_last_prompt(messages), words)
+        await asyncio.sleep(first)
+        step = max(0.0, latency - first) / max(1, len(chunks) - 1)
+        for index, chunk in enumerate(chunks):
+            if index:
+                await asyncio.sleep(step)
+            yield chunk
+
+    return FunctionModel(answer, stream_function=stream, model_name='fake-model')
@@ -0,0 +1,418 @@
+"""
+Reproducible load test of the whole service: starts the API in a subprocess
+against an in-process fake RabbitMQ broker and a deterministic fake model
+(benchmarks/fakes.py), runs an in-process order consumer, and drives a mixed
+workload (/books reads, /orders writes, AI prompts, SocketIO subscribers) at a
+fixed concurrency. Reports throughput and p50/p95/p99 per endpoint, how long
+the consumer takes to drain the orders, and how long status updates take to
+reach subscribers, as JSON; with --baseline it exits 1 on a regression.
+
+    python benchmarks/loadtest.py --duration 20 --concurrency 16 --output results.json
+    python benchmarks/loadtest.py --duration 20 --concurrency 16 --baseline results.json
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_MIX = 'books=45,book=20,orders=25,ai=10'
+FINAL_STATUSES = ('Processed', 'Processing Failed')
+AI_QUESTIONS = ("Who wrote {title}?", "Is {title} in stock?", "Tell me about {title}",
+                "What themes does {title} explore? (variant {n})")
+
+
+# --- Server side (runs in the subprocess) ---
+
+def prepare_process(args):
+    """Fake broker and model, plenty of stock and an in-process consumer for this server (or worker) process."""
+    from fakes import FakeBroker, fake_model, install
+
+    install(FakeBroker(publish_latency=args.publish_latency_ms / 1000))
+    import ai_service
+    import data_store
+    from consumer import OrderConsumer
+
+    ai_service.model = fake_model(latency=args.model_latency_ms / 1000)
+    ai_service.api_key_loaded = 'fake'
+    # Enough stock that the run measures throughput, not sold-out rejections.
+    for book_id in data_store.books_data:
+        data_store.reservations.restock(book_id, 10 ** 7)
+
+    consumer = OrderConsumer(mode=args.consumer_mode)
+    threading.Thread(target=consumer.run, name='loadtest-consumer', daemon=True).start()
+
+
+def run_server(args):
+    if args.workers > 1:
+        # Each worker gets its own fake broker and consumer; SocketIO emits still cross workers via serve.py's relay.
+        import serve
+        serve.main(worker_init=lambda index: prepare_process(args), host='127.0.0.1', port=args.port,
+                   workers=args.workers)
+        return
+    prepare_process(args)
+    import app as api
+    api.start_background_services()
+    api.socketio.run(api.app, host='127.0.0.1', port=args.port, log_output=False)
+
+
+def start_server(args, port: int, directory: str) -> subprocess.Popen:
+    env = dict(os.environ, GEMINI_API_KEY='fake', RABBITMQ_URL='amqp://fake/', LOG_LEVEL='WARNING',
+               INVENTORY_DB_PATH=os.path.join(directory, 'inventory.db'),
+               ORDER_LOG_PATH=os.path.join(directory, 'orders.log'),
+               ORDER_OUTBOX_PATH=os.path.join(directory, 'outbox.db'),
+               CATALOG_DB_PATH=os.path.join(directory, 'catalog.db'), ORDER_DB_PATH=os.path.join(directory, 'orders.db'),
+               CONSUMER_SIMULATED_NOTIFY_LATENCY=str(args.notify_latency_ms / 1000),
+               # All clients share one address; a per-client AI rate limit would throttle the whole run.
+               AI_RATE_LIMIT_PER_SECOND=os.environ.get('AI_RATE_LIMIT_PER_SECOND', '0'))
+    command = [sys.executable, os.path.abspath(__file__), '--serve', '--port', str(port),
+               '--model-latency-ms', str(args.model_latency_ms), '--publish-latency-ms', str(args.publish_latency_ms),
+               '--consumer-mode', args.consumer_mode, '--workers', str(args.workers)]
+    process = subprocess.Popen(command, cwd=ROOT, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Server did not start within 30s")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# --- Client side ---
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    values = sorted(latencies)
+    return {"requests": len(values) + errors, "errors": errors,
+            "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 2)}
+
+
+def parse_mix(text: str) -> Dict[str, int]:
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in ('books', 'book', 'orders', 'ai'):
+            raise argparse.ArgumentTypeError(f"Unknown endpoint in mix: {name!r}")
+        mix[name.strip()] = int(weight)
+    return mix
+
+
+class LoadClient:
+    """One keep-alive HTTP connection issuing requests picked from the mix until the deadline."""
+
+    def __init__(self, port: int, mix: Dict[str, int], books: List[Dict[str, Any]], subscribers: int,
+                 rng: random.Random, recorder: 'Recorder', source_ip: Optional[str] = None):
+        self.port = port
+        # serve.py pins clients to workers by IP; distinct loopback addresses spread the clients out.
+        self.source_address = (source_ip, 0) if source_ip else None
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.books = books
+        self.subscribers = max(1, subscribers)
+        self.rng = rng
+        self.recorder = recorder
+        self.connection = self._connect()
+
+    def _connect(self) -> http.client.HTTPConnection:
+        return http.client.HTTPConnection('127.0.0.1', self.port, timeout=60, source_address=self.source_address)
+
+    def request(self, method: str, path: str, body: Optional[Dict[str, Any]] = None):
+        payload = json.dumps(body) if body is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        try:
+            self.connection.request(method, path, body=payload, headers=headers)
+            response = self.connection.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = self._connect()
+            raise
+
+    def run_one(self):
+        name = self.rng.choices(self.names, self.weights)[0]
+        book = self.rng.choice(self.books)
+        if name == 'books':
+            method, path, body = 'GET', f"/books?limit={self.rng.choice((10, 50, 100))}", None
+        elif name == 'book':
+            method, path, body = 'GET', f"/books/{book['id']}", None
+        elif name == 'orders':
+            method, path = 'POST', '/orders'
+            body = {"items": [{"book_id": self.rng.choice(self.books)['id'], "quantity": 1}
+                              for _ in range(self.rng.randint(1, 3))],
+                    "user_identifier": f"load_{self.rng.randrange(self.subscribers)}"}
+        else:
+            method, path = 'POST', '/api/v1/ai/prompt'
+            question = self.rng.choice(AI_QUESTIONS)
+            body = {"query": question.format(title=book['title'], n=self.rng.randrange(1000))}
+        started = time.perf_counter()
+        try:
+            status, data = self.request(method, path, body)
+        except (OSError, http.client.HTTPException):
+            self.recorder.record(name, None)
+            return
+        elapsed = time.perf_counter() - started
+        # Stock and validation rejections are answers, not failures; only 5xx counts as an error.
+        self.recorder.record(name, elapsed if status < 500 else None)
+        if name == 'orders' and status == 201:
+            self.recorder.order_accepted(json.loads(data)['order_id'])
+
+    def run(self, deadline: float):
+        while time.monotonic() < deadline:
+            self.run_one()
+        self.connection.close()
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.accepted_at: Dict[str, float] = {}
+        self.settled: set = set()
+        self.event_latencies: List[float] = []
+        self.events = 0
+
+    def record(self, name: str, elapsed: Optional[float]):
+        with self.lock:
+            if elapsed is None:
+                self.errors[name] += 1
+            else:
+                self.latencies[name].append(elapsed)
+
+    def order_accepted(self, order_id: str):
+        with self.lock:
+            self.accepted_at[order_id] = time.perf_counter()
+
+    def status_event(self, data: Dict[str, Any]):
+        now = time.perf_counter()
+        with self.lock:
+            self.events += 1
+            if data.get('status') in FINAL_STATUSES:
+                self.settled.add(data.get('order_id'))
+                accepted = self.accepted_at.get(data.get('order_id'))
+                if accepted is not None:
+                    self.event_latencies.append(now - accepted)
+
+
+def start_subscribers(port: int, count: int, recorder: Recorder) -> List[Any]:
+    """SocketIO clients subscribed to one user room each (load_0..load_N-1)."""
+    import socketio
+
+    clients = []
+    for index in range(count):
+        client = socketio.Client(reconnection=False)
+        client.on('order_status_update', recorder.status_event)
+        client.connect(f"http://127.0.0.1:{port}", transports=['polling'], wait_timeout=10)
+        client.emit('subscribe', {"user_identifier": f"load_{index}"})
+        clients.append(client)
+    return clients
+
+
+def consumer_orders_settled(port: int) -> float:
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    try:
+        connection.request('GET', '/metrics')
+        text = connection.getresponse().read().decode('utf-8')
+    finally:
+        connection.close()
+    return sum(float(value) for value in re.findall(r'^library_consumer_orders_total\{[^}]*\} (\S+)$', text, re.M))
+
+
+def wait_for_drain(port: int, order_ids: List[str], recorder: Optional[Recorder], timeout: float) -> Optional[float]:
+    """
+    Seconds until every order in ``order_ids`` is settled, or None on timeout.
+    With subscribers that is when their final status event arrived (which
+    works across workers); without, the consumer's counter on /metrics.
+    """
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if recorder is not None:
+            with recorder.lock:
+                done = recorder.settled.issuperset(order_ids)
+        else:
+            done = consumer_orders_settled(port) >= len(order_ids)
+        if done:
+            return time.perf_counter() - started
+        time.sleep(0.05)
+    return None
+
+
+def run_load(args) -> Dict[str, Any]:
+    directory = tempfile.mkdtemp(prefix='loadtest-')
+    port = free_port()
+    server = start_server(args, port, directory)
+    try:
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        connection.request('GET', '/books?limit=1000')
+        books = json.loads(connection.getresponse().read())
+        connection.close()
+
+        recorder = Recorder()
+        subscribers = start_subscribers(port, args.subscribers, recorder)
+        mix = parse_mix(args.mix)
+        # Warm-up: first-request costs (caches, imports, SQLite pages) are not what this measures.
+        warmup_recorder = Recorder()
+        warmup = [LoadClient(port, mix, books, args.subscribers, random.Random(args.seed - i - 1), warmup_recorder,
+                             source_ip(args, i)) for i in range(min(4, args.concurrency))]
+        run_clients(warmup, args.warmup)
+
+        clients = [LoadClient(port, mix, books, args.subscribers, random.Random(args.seed + i), recorder,
+                              source_ip(args, i)) for i in range(args.concurrency)]
+        started = time.perf_counter()
+        run_clients(clients, args.duration)
+        elapsed = time.perf_counter() - started
+
+        drain = wait_for_drain(port, list(warmup_recorder.accepted_at) + list(recorder.accepted_at),
+                               recorder if subscribers else None, args.drain_timeout)
+        for client in subscribers:
+            client.disconnect()
+
+        endpoints = {name: summarize(recorder.latencies[name], recorder.errors[name], elapsed)
+                     for name in sorted(set(recorder.latencies) | set(recorder.errors))}
+        return {
+            "config": {key: getattr(args, key) for key in ('duration', 'concurrency', 'workers', 'mix', 'subscribers',
+                                                           'model_latency_ms', 'publish_latency_ms',
+                                                           'notify_latency_ms', 'consumer_mode', 'seed')},
+            "elapsed_s": round(elapsed, 3),
+            "endpoints": endpoints,
+            "total": summarize([v for values in recorder.latencies.values() for v in values],
+                               sum(recorder.errors.values()), elapsed),
+            "consumer": {"orders_accepted": len(recorder.accepted_at),
+                         "drain_s": round(drain, 3) if drain is not None else None},
+            "socketio": {"subscribers": len(subscribers), "status_events": recorder.events,
+                         **{key: value for key, value in summarize(recorder.event_latencies, 0, elapsed).items()
+                            if key.startswith('p')}},
+        }
+    finally:
+        server.terminate()
+        try:
+            server.wait(10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def source_ip(args, index: int) -> Optional[str]:
+    return f"127.0.0.{2 + index % 250}" if args.workers > 1 else None
+
+
+def run_clients(clients: List[LoadClient], duration: float):
+    if duration <= 0:
+        return
+    deadline = time.monotonic() + duration
+    threads = [threading.Thread(target=client.run, args=(deadline,), daemon=True) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+# --- Baseline comparison ---
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions beyond ``tolerance`` (a fraction): lower throughput, higher tail latency, new errors."""
+    regressions = []
+    for name, old in baseline.get('endpoints', {}).items():
+        new = results['endpoints'].get(name)
+        if new is None:
+            continue
+        if old['throughput_rps'] and new['throughput_rps'] < old['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {old['throughput_rps']} -> {new['throughput_rps']} rps")
+        for key in ('p95_ms', 'p99_ms'):
+            if old[key] and new[key] > old[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {old[key]} -> {new[key]}")
+        if new['errors'] > old['errors']:
+            regressions.append(f"{name}: errors {old['errors']} -> {new['errors']}")
+    old_drain, new_drain = baseline.get('consumer', {}).get('drain_s'), results['consumer']['drain_s']
+    if old_drain is not None and (new_drain is None or new_drain > old_drain * (1 + tolerance) + 0.5):
+        regressions.append(f"consumer drain {old_drain}s -> {new_drain}s")
+    return regressions
+
+
+def print_report(results: Dict[str, Any]):
+    print(f"{'endpoint':10} {'requests':>9} {'errors':>7} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}",
+          file=sys.stderr)
+    for name, row in list(results['endpoints'].items()) + [('total', results['total'])]:
+        print(f"{name:10} {row['requests']:9} {row['errors']:7} {row['throughput_rps']:9.1f} {row['p50_ms']:9.2f}"
+              f" {row['p95_ms']:9.2f} {row['p99_ms']:9.2f}", file=sys.stderr)
+    consumer, events = results['consumer'], results['socketio']
+    print(f"consumer: {consumer['orders_accepted']} orders drained in {consumer['drain_s']}s after the load; "
+          f"socketio: {events['status_events']} status events, order->processed p95 {events['p95_ms']} ms",
+          file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds of measured load.')
+    parser.add_argument('--warmup', type=float, default=2.0, help='Seconds of unmeasured load first.')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent HTTP clients.')
+    parser.add_argument('--workers', type=int, default=1, help='API workers; more than 1 runs serve.py.')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Endpoint weights (default: {DEFAULT_MIX}).')
+    parser.add_argument('--subscribers', type=int, default=20, help='SocketIO clients, one user room each.')
+    parser.add_argument('--model-latency-ms', type=float, default=200.0, help='Fake model answer latency.')
+    parser.add_argument('--publish-latency-ms', type=float, default=1.0, help='Fake broker confirm latency.')
+    parser.add_argument('--notify-latency-ms', type=float, default=0.0, help='Consumer notification latency.')
+    parser.add_argument('--consumer-mode', choices=('concurrent', 'batch'), default='batch')
+    parser.add_argument('--drain-timeout', type=float, default=60.0)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help='Write the JSON results to this file (default: stdout).')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative regression (default 0.2).')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        run_server(args)
+        return
+
+    results = run_load(args)
+    print_report(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}.", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+import math
+import re
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+from catalog_store import normalize_isbn
+from title_matcher import normalize_text
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+# ISBN-10/13 as typed by people: digits with optional dashes/spaces, possibly ending in X.
+ISBN_RE = re.compile(r'\b(?:\d[\s-]?){9,12}[\dx]\b')
+STOPWORDS = frozenset(
+    "a an and are book books by can copies copy did do does for from have how i in is it me of "
+    "on or please tell the there to was we what when which who written you".split()
+)
+
+# Intent patterns run on normalize_text() output; order matters (first match wins).
+INTENT_PATTERNS: List[Tuple[str, re.Pattern]] = [
+    ('books_in_year', re.compile(r'\b(?:books?|novels?|titles?)\s+(?:\w+\s+)?(?:published|written|released|from|in)\s+'
+                                 r'(?:in\s+)?(?P<name>\d{4})$')),
+    ('books_by', re.compile(r'\b(?:books?|novels?|works?|titles?)\s+(?:written\s+)?by\s+(?P<name>.+)$')),
+    ('books_by', re.compile(r'\bwhat (?:else )?(?:has|did|does) (?P<name>.+?) (?:write|written)\b')),
+    ('author', re.compile(r'\bwho (?:wrote|authored|is the author of|was the author of)\b|\bauthor of\b')),
+    ('year', re.compile(r'\b(?:what|which) year\b|\bpublication (?:year|date)\b'
+                        r'|\bwhen (?:was|did)\b.*\b(?:published|written|released|come out|came out|publish)\b')),
+    ('stock', re.compile(r'\bin stock\b|\bout of stock\b|\bavailab\w*\b|\bhow many (?:copies|left)\b|\bcopies left\b')),
+    ('isbn', re.compile(r'\bisbn\b')),
+]
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(normalize_text(text))
+
+
+class BM25Index:
+    """
+    In-memory inverted index with per-field BM25 scoring. Documents are added
+    and removed individually, so keeping it in sync with the catalog costs
+    only the changed books.
+    """
+
+    def __init__(self, fields: Tuple[str, ...], k1: float = 1.2, b: float = 0.75):
+        self.fields = fields
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, Dict[object, int]]] = {field: {} for field in fields}
+        self._lengths: Dict[str, Dict[object, int]] = {field: {} for field in fields}
+        self._total_length: Dict[str, int] = {field: 0 for field in fields}
+        self._terms: Dict[object, Dict[str, List[str]]] = {}
+
+    def __len__(self):
+        return len(self._terms)
+
+    def add(self, doc_id, field_terms: Dict[str, List[str]]):
+        if doc_id in self._terms:
+            self.remove(doc_id)
+        self._terms[doc_id] = field_terms
+        for field in self.fields:
+            terms = field_terms.get(field, [])
+            self._lengths[field][doc_id] = len(terms)
+            self._total_length[field] += len(terms)
+            postings = self._postings[field]
+            for term in terms:
+                docs = postings.setdefault(term, {})
+                docs[doc_id] = docs.get(doc_id, 0) + 1
+
+    def remove(self, doc_id):
+        field_terms = self._terms.pop(doc_id, None)
+        if field_terms is None:
+            return
+        for field in self.fields:
+            self._total_length[field] -= self._lengths[field].pop(doc_id, 0)
+            postings = self._postings[field]
+            for term in set(field_terms.get(field, [])):
+                docs = postings.get(term)
+                if docs is not None:
+                    docs.pop(doc_id, None)
+                    if not docs:
+                        del postings[term]
+
+    def terms(self, doc_id, field: str) -> List[str]:
+        return self._terms.get(doc_id, {}).get(field, [])
+
+    def search(self, terms: List[str], fields: Dict[str, float], limit: int = 10) -> List[Tuple[object, float]]:
+        """Scores documents for ``terms`` over ``fields`` ({field: weight}); best first."""
+        count = len(self._terms)
+        if not count or not terms:
+            return []
+        scores: Dict[object, float] = {}
+        for field, weight in fields.items():
+            postings = self._postings[field]
+            lengths = self._lengths[field]
+            average = (self._total_length[field] / count) or 1.0
+            for term in set(terms):
+                docs = postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+                for doc_id, tf in docs.items():
+                    norm = self.k1 * (1 - self.b + self.b * lengths[doc_id] / average)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + weight * idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: -item[1])[:limit]
+
+
+class CatalogAnswerEngine:
+    """
+    Answers structured catalog questions (publication year, author, stock,
+    ISBN, books by an author or from a year) straight from the catalog and
+    inventory. ``answer`` returns None for anything it does not recognise so
+    the caller can fall back to the LLM. ``match_title`` is the exact title matcher used
+    to pick the book a question is about; BM25 covers partial names and ISBNs.
+    """
+
+    def __init__(self, match_title: Optional[Callable[[str], Optional[str]]] = None,
+                 min_score: float = 1.0, ambiguity_ratio: float = 1.5):
+        self.match_title = match_title
+        self.min_score = min_score
+        self.ambiguity_ratio = ambiguity_ratio
+        self._index = BM25Index(('title', 'author', 'year', 'isbn'))
+        self._books: Dict[object, dict] = {}
+        self._ids_by_title: Dict[str, List[object]] = {}
+        self._ids_by_isbn: Dict[str, object] = {}
+        self.version = None
+        self.answered = 0
+        self.passed = 0
+
+    def sync(self, books: Mapping[object, dict], version=None):
+        """Brings the index in line with ``books``; only changed entries are re-indexed."""
+        if version is not None and version == self.version:
+            return
+        current = {key: details for key, details in books.items()
+                   if isinstance(details, dict) and isinstance(details.get('title'), str)}
+        for key in [key for key in self._books if key not in current or current[key] != self._books[key]]:
+            self._index.remove(key)
+            del self._books[key]
+        for key, details in current.items():
+            if key not in self._books:
+                self._books[key] = dict(details)
+                self._index.add(key, {
+                    'title': tokenize(details['title']),
+                    'author': tokenize(str(details.get('author') or '')),
+                    'year': [str(details['year'])] if details.get('year') is not None else [],
+                    'isbn': [normalize_isbn(str(details['isbn']))] if details.get('isbn') else [],
+                })
+        self._ids_by_title = {}
+        self._ids_by_isbn = {}
+        for key, details in self._books.items():
+            self._ids_by_title.setdefault(details['title'], []).append(key)
+            if details.get('isbn'):
+                self._ids_by_isbn[normalize_isbn(str(details['isbn']))] = key
+        self.version = version
+
+    @staticmethod
+    def detect_intent(query: str) -> Optional[Tuple[str, Optional[str]]]:
+        """Returns (intent, author name / year or None) for a catalog question, or None."""
+        normalized = normalize_text(query).rstrip(' ?!.')
+        for intent, pattern in INTENT_PATTERNS:
+            found = pattern.search(normalized)
+            if found:
+                return intent, found.groupdict().get('name')
+        return None
+
+    def _best(self, terms: List[str], fields: Dict[str, float]) -> Optional[object]:
+        hits = self._index.search(terms, fields, limit=2)
+        if not hits or hits[0][1] < self.min_score:
+            return None
+        if len(hits) > 1 and hits[0][1] < hits[1][1] * self.ambiguity_ratio:
+            return None  # two books fit about equally well; let the LLM ask or refuse
+        return hits[0][0]
+
+    def _resolve_book(self, query: str) -> Optional[object]:
+        for candidate in ISBN_RE.findall(normalize_text(query)):
+            key = self._ids_by_isbn.get(normalize_isbn(candidate))
+            if key is not None:
+                return key
+        if self.match_title is not None:
+            title = self.match_title(query)
+            if title is not None and self._ids_by_title.get(title):
+                return self._ids_by_title[title][0]
+        terms = [term for term in tokenize(query) if term not in STOPWORDS]
+        return self._best(terms, {'title': 1.0})
+
+    def _books_by(self, name: str) -> List[object]:
+        terms = [term for term in tokenize(name) if term not in STOPWORDS]
+        if not terms:
+            return []
+        # Every name token must occur in the author; BM25 only orders the matches.
+        hits = self._index.search(terms, {'author': 1.0}, limit=len(self._books))
+        return [key for key, _ in hits if set(terms) <= set(self._index.terms(key, 'author'))]
+
+    @staticmethod
+    def _summary(key, details: dict, stock: Optional[int]) -> Dict[str, Any]:
+        return {"id": details.get('id', key), "title": details['title'], "author": details.get('author'),
+                "year": details.get('year'), "isbn": details.get('isbn'), "stock": stock}
+
+    def answer(self, query: str, inventory: Optional[Mapping[object, int]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Returns the service's success dict for a recognised catalog question,
+        or None when the query needs the LLM. Stock comes from ``inventory``
+        (falling back to the catalog's own ``stock`` field).
+        """
+        detected = self.detect_intent(query)
+        if detected is None:
+            self.passed += 1
+            return None
+        intent, name = detected
+        stock_of = lambda key: (inventory.get(key) if inventory is not None and key in inventory
+                                else self._books[key].get('stock'))
+
+        if intent == 'books_in_year':
+            keys = [key for key, _ in self._index.search([name], {'year': 1.0}, limit=len(self._books))]
+            listing = ', '.join(f"'{self._books[key]['title']}' by {self._books[key].get('author')}" for key in keys)
+            response = (f"Books published in {name} in our catalog: {listing}." if keys
+                        else f"I couldn't find any books published in {name} in our catalog.")
+            title_match = self._books[keys[0]]['title'] if len(keys) == 1 else None
+        elif intent == 'books_by':
+            keys = self._books_by(name or '')
+            if not keys:
+                response = f"I couldn't find any books by {name.title()} in our catalog."
+                title_match = None
+            else:
+                listing = ', '.join(f"'{self._books[key]['title']}' ({self._books[key].get('year')})" for key in keys)
+                response = f"Books by {self._books[keys[0]].get('author')} in our catalog: {listing}."
+                title_match = self._books[keys[0]]['title'] if len(keys) == 1 else None
+        else:
+            key = self._resolve_book(query)
+            if key is None:
+                self.passed += 1
+                return None
+            keys = [key]
+            details = self._books[key]
+            title, author, title_match = details['title'], details.get('author'), details['title']
+            if intent == 'year':
+                response = f"'{title}' by {author} was published in {details.get('year')}."
+            elif intent == 'author':
+                response = f"'{title}' was written by {author}."
+            elif intent == 'isbn':
+                response = f"The ISBN of '{title}' is {details.get('isbn')}."
+            else:
+                stock = stock_of(key)
+                response = (f"Yes, '{title}' is in stock ({stock} copies available)." if stock and stock > 0
+                            else f"Sorry, '{title}' is currently out of stock.")
+
+        self.answered += 1
+        return {"data": {"response": response, "title_match": title_match, "source": "catalog", "intent": intent,
+                         "books": [self._summary(key, self._books[key], stock_of(key)) for key in keys]},
+                "status": "success"}
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.answered + self.passed
+        return {"answered": self.answered, "passed_to_llm": self.passed, "indexed_books": len(self._index),
+                "answer_ratio": round(self.answered / total, 4) if total else 0.0}
@@ -0,0 +1,160 @@
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Bodies smaller than this are not worth compressing.
+COMPRESS_MIN_BYTES = 512
+
+
+def encode_json(payload: Any) -> bytes:
+    """Deterministic compact JSON, so equal payloads always get the same ETag."""
+    return (json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+class EncodedResponse:
+    """
+    A JSON body encoded once, with lazily built compressed variants. Each
+    variant has its own ETag: ``etag`` for identity, ``etag_for(coding)``
+    for the others.
+    """
+
+    __slots__ = ('body', 'etag', 'last_modified', 'headers', '_variants', '_lock')
+
+    def __init__(self, payload: Any, last_modified: float, headers: Optional[Dict[str, str]] = None):
+        self.body = encode_json(payload)
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest()[:20] + '"'
+        self.last_modified = int(last_modified)
+        self.headers = headers or {}
+        self._variants: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def variant(self, encoding: Optional[str]) -> bytes:
+        if encoding is None:
+            return self.body
+        cached = self._variants.get(encoding)
+        if cached is None:
+            with self._lock:
+                cached = self._variants.get(encoding)
+                if cached is None:
+                    if encoding == 'br':
+                        cached = brotli.compress(self.body)
+                    else:
+                        cached = gzip.compress(self.body, compresslevel=6, mtime=0)
+                    self._variants[encoding] = cached
+        return cached
+
+    def etag_for(self, encoding: Optional[str]) -> str:
+        """Strong validators must differ between content-codings, so compressed variants get a suffix."""
+        if encoding is None:
+            return self.etag
+        return self.etag[:-1] + ('-br"' if encoding == 'br' else '-gz"')
+
+
+def _accepted_encodings(header: str) -> Dict[str, float]:
+    accepted = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    return accepted
+
+
+def choose_encoding(accept_encoding: str, body_size: int) -> Optional[str]:
+    """Picks br (when installed) or gzip from an Accept-Encoding header, or None for identity."""
+    if body_size < COMPRESS_MIN_BYTES or not accept_encoding:
+        return None
+    accepted = _accepted_encodings(accept_encoding)
+    for encoding in (('br', 'gzip') if brotli is not None else ('gzip',)):
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+
+def _not_modified(entry: EncodedResponse, etag: str, headers) -> bool:
+    if_none_match = headers.get('If-None-Match')
+    if if_none_match is not None:
+        # Weak comparison, as RFC 9110 prescribes for If-None-Match.
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return '*' in tags or etag in tags
+    if_modified_since = headers.get('If-Modified-Since')
+    if if_modified_since:
+        try:
+            return entry.last_modified <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def serve(entry: EncodedResponse, request, status: int = 200) -> Response:
+    """Turns a cached entry into a response: 304 on a validator match, else the best encoded variant."""
+    encoding = choose_encoding(request.headers.get('Accept-Encoding', ''), len(entry.body))
+    common = {'ETag': entry.etag_for(encoding), 'Last-Modified': formatdate(entry.last_modified, usegmt=True),
+              'Vary': 'Accept-Encoding'}
+    if _not_modified(entry, common['ETag'], request.headers):
+        return Response(status=304, headers=common)
+    response = Response(entry.variant(encoding), status=status, mimetype='application/json',
+                        headers=dict(common, **entry.headers))
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+class EncodedResponseCache:
+    """
+    Pre-encoded responses keyed by request shape, valid for one catalog
+    version. A version change drops every entry; ``max_entries`` bounds how
+    many distinct pages and books are kept (least recently used go first).
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max(1, max_entries)
+        self._entries: 'OrderedDict[Hashable, EncodedResponse]' = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version, key: Hashable, build: Callable[[], Optional[EncodedResponse]]) -> Optional[EncodedResponse]:
+        """Returns the entry for ``key`` at ``version``, building it on a miss (None is not cached)."""
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        entry = build()
+        if entry is None:
+            return None
+        with self._lock:
+            if version == self._version:
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries),
+                    "version": self._version, "brotli": brotli is not None}
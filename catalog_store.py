@@ -0,0 +1,246 @@
+import base64
+import json
+import sqlite3
+import threading
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from title_matcher import normalize_text
+
+BOOK_FIELDS = ('id', 'title', 'author', 'year', 'isbn', 'stock')
+# SQLite integers are signed 64-bit; a larger Python int cannot even be bound as a parameter.
+SQLITE_MIN_INT, SQLITE_MAX_INT = -2 ** 63, 2 ** 63 - 1
+
+
+def fits_sqlite(value: int) -> bool:
+    return SQLITE_MIN_INT <= value <= SQLITE_MAX_INT
+
+
+def normalize_isbn(value) -> str:
+    return ''.join(ch for ch in str(value).casefold() if ch.isdigit() or ch == 'x')
+
+
+class InvalidCursor(ValueError):
+    """Raised for a pagination cursor the store did not issue."""
+
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"after": last_id}).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        last_id = int(json.loads(base64.urlsafe_b64decode(padded.encode()))['after'])
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}") from e
+    if not fits_sqlite(last_id):
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}")
+    return last_id
+
+
+class CatalogStore:
+    """
+    Book catalog in SQLite with secondary indexes on (normalized) author, year
+    and ISBN. Nothing is opened or seeded until the first read, so importing
+    the module stays cheap. ``path`` defaults to an in-memory database seeded
+    from ``seed``; a file path keeps the catalog across restarts (it is only
+    seeded when empty). ``on_change`` runs after every write.
+    """
+
+    def __init__(self, path: str = ':memory:', seed: Optional[Mapping] = None,
+                 on_change: Optional[Callable[[], Any]] = None):
+        self.path = path
+        self._seed = seed
+        self._on_change = on_change
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        self._data_version: Optional[int] = None
+        # A file can be written by other processes; an in-memory catalog only by this one.
+        self.shared = path != ':memory:'
+
+    # --- Loading ---
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is not None:
+            return self._db
+        with self._lock:
+            if self._db is None:
+                db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                if self.path != ':memory:':
+                    db.execute("PRAGMA journal_mode=WAL")
+                    db.execute("PRAGMA synchronous=NORMAL")
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS books ("
+                    " id INTEGER PRIMARY KEY, title TEXT NOT NULL, author TEXT, year INTEGER, isbn TEXT,"
+                    " stock INTEGER NOT NULL DEFAULT 0, author_key TEXT, isbn_key TEXT)"
+                )
+                db.execute("CREATE INDEX IF NOT EXISTS books_author ON books (author_key, id)")
+                db.execute("CREATE INDEX IF NOT EXISTS books_year ON books (year, id)")
+                db.execute("CREATE INDEX IF NOT EXISTS books_isbn ON books (isbn_key)")
+                if self._seed and db.execute("SELECT 1 FROM books LIMIT 1").fetchone() is None:
+                    db.execute("BEGIN")
+                    db.executemany(self._UPSERT, [self._row(book) for book in self._seed.values()])
+                    db.execute("COMMIT")
+                self._db = db
+        return self._db
+
+    _UPSERT = ("INSERT OR REPLACE INTO books (id, title, author, year, isbn, stock, author_key, isbn_key)"
+               " VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+
+    @staticmethod
+    def _row(book: Dict[str, Any]) -> Tuple:
+        author = book.get('author')
+        isbn = book.get('isbn')
+        return (int(book['id']), book['title'], author, book.get('year'), isbn, int(book.get('stock') or 0),
+                normalize_text(author) if author else None, normalize_isbn(isbn) if isbn else None)
+
+    def changed_elsewhere(self) -> bool:
+        """True if another connection committed to the catalog since the previous call (PRAGMA data_version)."""
+        version = self._query("PRAGMA data_version")[0][0]
+        changed = self._data_version is not None and version != self._data_version
+        self._data_version = version
+        return changed
+
+    def _query(self, sql: str, params: Sequence = ()) -> List[tuple]:
+        db = self._connect()
+        with self._lock:
+            return db.execute(sql, params).fetchall()
+
+    # --- Reads ---
+
+    def get(self, book_id) -> Optional[Dict[str, Any]]:
+        try:
+            book_id = int(book_id)
+        except (TypeError, ValueError):
+            return None
+        if not fits_sqlite(book_id):
+            return None
+        rows = self._query("SELECT id, title, author, year, isbn, stock FROM books WHERE id = ?", (book_id,))
+        return dict(zip(BOOK_FIELDS, rows[0])) if rows else None
+
+    def get_many(self, book_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """Looks up many books with one query per 500 ids; unknown (or out-of-range) ids are simply missing."""
+        ids = sorted({book_id for book_id in map(int, book_ids) if fits_sqlite(book_id)})
+        books = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows = self._query(f"SELECT id, title, author, year, isbn, stock FROM books WHERE id IN"
+                               f" ({', '.join('?' * len(chunk))})", chunk)
+            books.update((row[0], dict(zip(BOOK_FIELDS, row))) for row in rows)
+        return books
+
+    def count(self) -> int:
+        return self._query("SELECT COUNT(*) FROM books")[0][0]
+
+    def ids(self) -> List[int]:
+        return [row[0] for row in self._query("SELECT id FROM books ORDER BY id")]
+
+    def iter_books(self, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """Yields every book in id order, reading ``batch_size`` rows at a time."""
+        after = None
+        while True:
+            page, after = self.list_books(cursor_id=after, limit=batch_size)
+            yield from page
+            if after is None:
+                return
+
+    def find_by_isbn(self, isbn: str) -> Optional[Dict[str, Any]]:
+        page, _ = self.list_books(isbn=isbn, limit=1)
+        return page[0] if page else None
+
+    def list_books(self, cursor: Optional[str] = None, limit: int = 100, author: Optional[str] = None,
+                   year: Optional[int] = None, isbn: Optional[str] = None,
+                   fields: Optional[Iterable[str]] = None,
+                   cursor_id: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        Returns one page of books in id order and the id to continue after
+        (None on the last page). Filters use the secondary indexes; ``fields``
+        projects the returned dicts (``id`` is always included).
+        """
+        columns = list(BOOK_FIELDS) if not fields else ['id'] + [f for f in BOOK_FIELDS if f in set(fields) and f != 'id']
+        where, params = [], []
+        if cursor is not None:
+            cursor_id = decode_cursor(cursor)
+        if cursor_id is not None:
+            where.append("id > ?")
+            params.append(cursor_id)
+        if author:
+            where.append("author_key = ?")
+            params.append(normalize_text(author))
+        if year is not None:
+            where.append("year = ?")
+            params.append(int(year))
+        if isbn:
+            where.append("isbn_key = ?")
+            params.append(normalize_isbn(isbn))
+        sql = f"SELECT {', '.join(columns)} FROM books"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        # Decision: Keyset pagination (id > cursor) keeps deep pages as cheap as the first one.
+        rows = self._query(sql + " ORDER BY id LIMIT ?", params + [limit + 1])
+        page = [dict(zip(columns, row)) for row in rows[:limit]]
+        next_id = page[-1]['id'] if len(rows) > limit else None
+        return page, next_id
+
+    # --- Writes ---
+
+    def upsert(self, book: Dict[str, Any]):
+        self.upsert_many([book])
+
+    def upsert_many(self, books: Iterable[Dict[str, Any]]):
+        rows = [self._row(book) for book in books]
+        db = self._connect()
+        with self._lock:
+            db.execute("BEGIN")
+            try:
+                db.executemany(self._UPSERT, rows)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        if self._on_change is not None:
+            self._on_change()
+
+    def delete(self, book_id: int) -> bool:
+        db = self._connect()
+        with self._lock:
+            deleted = db.execute("DELETE FROM books WHERE id = ?", (int(book_id),)).rowcount > 0
+        if deleted and self._on_change is not None:
+            self._on_change()
+        return deleted
+
+
+class CatalogView(Mapping):
+    """
+    Read-only ``{book_id: book_dict}`` view of a CatalogStore, so code written
+    against the old ``books_data`` dict keeps working. Each lookup returns a
+    fresh dict; writes go through the store.
+    """
+
+    def __init__(self, store: CatalogStore):
+        self.store = store
+
+    def __getitem__(self, book_id):
+        book = self.store.get(book_id)
+        if book is None:
+            raise KeyError(book_id)
+        return book
+
+    def __contains__(self, book_id):
+        return self.store.get(book_id) is not None
+
+    def __iter__(self):
+        return iter(self.store.ids())
+
+    def __len__(self):
+        return self.store.count()
+
+    def __bool__(self):
+        return bool(self.store.list_books(limit=1, fields=('id',))[0])
+
+    def items(self):
+        return [(book['id'], book) for book in self.store.iter_books()]
+
+    def values(self):
+        return list(self.store.iter_books())
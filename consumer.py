@@ -2,93 +2,388 @@ import pika
 import json
 import time
 import os
+import signal
+import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from data_store import reservations
+from instrumentation import REGISTRY, get_logger, serve_metrics, timed
+from status_events import StatusPublisher
 
 # --- RabbitMQ Configuration ---
 ORDER_QUEUE_NAME = 'order_processing_queue'
 RABBITMQ_URL = os.environ.get('RABBITMQ_URL') # Use localhost if not in Docker/env var set
 
+# --- Consumer engine configuration ---
+CONSUMER_MODE = os.environ.get('CONSUMER_MODE', 'concurrent')  # 'concurrent' or 'batch'
+CONSUMER_WORKERS = int(os.environ.get('CONSUMER_WORKERS', '4'))
+CONSUMER_PREFETCH = int(os.environ.get('CONSUMER_PREFETCH', '16'))
+CONSUMER_BATCH_SIZE = int(os.environ.get('CONSUMER_BATCH_SIZE', '50'))
+CONSUMER_BATCH_TIMEOUT = float(os.environ.get('CONSUMER_BATCH_TIMEOUT', '0.2'))
+# Simulated latency of the post-processing step (e.g. notifying shipping).
+SIMULATED_NOTIFY_LATENCY = float(os.environ.get('CONSUMER_SIMULATED_NOTIFY_LATENCY', '1'))
+
+# Serves /metrics from each consumer process when set; supervised workers use this port + their worker id.
+CONSUMER_METRICS_PORT = int(os.environ.get('CONSUMER_METRICS_PORT', '0'))
+
+log = get_logger('CONSUMER')
+CONSUMER_ORDERS_TOTAL = REGISTRY.counter('library_consumer_orders_total', 'Orders settled by the consumer.',
+                                         ('result',))
+
+# Decision: Status transitions go to the API's SocketIO server through a fanout exchange, coalesced per order.
+status_publisher = StatusPublisher(
+    RABBITMQ_URL,
+    flush_interval=float(os.environ.get('STATUS_EVENTS_FLUSH_INTERVAL', '0.1'))
+)
+
+
+def notify_status(order_data: Dict[str, Any], status: str):
+    status_publisher.publish(order_data['order_id'], status, order_data.get('user_identifier'))
+
+
+# Settlement outcome for a message that failed on a transient error and goes back to the queue.
+REQUEUE = 'requeue'
+# Decision: A busy or locked inventory database clears up on its own; settlement is idempotent, so retry later.
+TRANSIENT_ERRORS = (sqlite3.OperationalError,)
+
+
+def apply_inventory_updates(orders: List[Dict[str, Any]]) -> List[bool]:
+    """
+    Settles the stock of several orders in one transaction on the shared
+    inventory store: each order's reservation is committed (or, for messages
+    without one, its units are taken directly). Returns one result per order.
+    """
+    # Decision: One bulk transaction per batch; redelivered orders find their reservation committed and are no-ops.
+    return reservations.commit_orders(orders)
+
+
 def process_order_inventory(order_data):
     """
-    Simulates processing the order and inventory update.
+    Processes one order and its inventory update.
     Returns True on success, False on failure.
     """
-    print(f"\n [CONSUMER] Received order {order_data['order_id']}. Processing inventory updates...")
     order_id = order_data['order_id']
-    items = order_data['items']
-    time.sleep(2) # Simulate work
+    log.debug("Received order %s. Processing inventory updates...", order_id)
 
-    print(f" [CONSUMER] Updating stock for order {order_id}:")
-    success = True # Assume success
-    for item in items:
-        print(f"   - Simulating decrease stock for book {item['book_id']} by {item['quantity']}")
-        # --- !!! REAL INVENTORY UPDATE LOGIC HERE (DB interaction) !!! ---
+    with timed('consumer', 'inventory'):
+        success = apply_inventory_updates([order_data])[0]
 
     if success:
-        print(f" [CONSUMER] Inventory updated successfully for order {order_id}.")
-        time.sleep(1) # Simulate more work (e.g., notifying shipping)
-        print(f" [CONSUMER] Order {order_id} processing complete (simulation).")
-        print(f" [CONSUMER] SIMULATING SocketIO emit: Order {order_id} status changed to Processed.")
+        log.debug("Inventory updated successfully for order %s.", order_id)
+        with timed('consumer', 'notify'):
+            time.sleep(SIMULATED_NOTIFY_LATENCY) # Simulate more work (e.g., notifying shipping)
+        CONSUMER_ORDERS_TOTAL.inc('processed')
+        notify_status(order_data, 'Processed')
         return True
     else:
-         print(f" [CONSUMER] Inventory update FAILED for order {order_id}.")
-         print(f" [CONSUMER] SIMULATING SocketIO emit: Order {order_id} status changed to Processing Failed.")
+         log.warning("Inventory update FAILED for order %s.", order_id)
+         CONSUMER_ORDERS_TOTAL.inc('failed')
+         notify_status(order_data, 'Processing Failed')
          return False
 
-def main():
-    #Sets up RabbitMQ connection, channel, consumer, and starts listening.
-    connection = None
-    print("Starting Consumer...")
-    # Decision: Loop trying to connect to RabbitMQ in case it starts after the consumer.
-    while True:
-        try:
-            connection = pika.BlockingConnection(pika.URLParameters(RABBITMQ_URL))
-            channel = connection.channel()
-            channel.queue_declare(queue=ORDER_QUEUE_NAME, durable=True)
-            print(f' [*] Connected to RabbitMQ. Waiting for messages in queue: {ORDER_QUEUE_NAME}. To exit press CTRL+C')
-            break # Exit loop once connected
-        except pika.exceptions.AMQPConnectionError as e:
-            print(f"Connection error: {e}. Retrying in 5 seconds...")
-            time.sleep(5)
-        except Exception as e:
-            print(f"Unexpected error during connection setup: {e}. Retrying in 5 seconds...")
-            time.sleep(5)
 
-    channel.basic_qos(prefetch_count=1) # Process one message at a time
+def process_order_batch(orders: List[Dict[str, Any]]) -> List[bool]:
+    """
+    Processes several orders with a single inventory transaction.
+    Returns one success flag per order.
+    """
+    log.debug("Processing batch of %d order(s)...", len(orders))
+    with timed('consumer', 'inventory_batch'):
+        results = apply_inventory_updates(orders)
+    with timed('consumer', 'notify'):
+        time.sleep(SIMULATED_NOTIFY_LATENCY) # One notification round for the whole batch
+    for order_data, ok in zip(orders, results):
+        if ok:
+            notify_status(order_data, 'Processed')
+        else:
+            log.warning("Inventory update FAILED for order %s.", order_data['order_id'])
+            notify_status(order_data, 'Processing Failed')
+    processed = sum(results)
+    CONSUMER_ORDERS_TOTAL.inc('processed', amount=processed)
+    CONSUMER_ORDERS_TOTAL.inc('failed', amount=len(results) - processed)
+    log.info("Batch done: %d processed, %d failed.", processed, len(results) - processed)
+    return results
+
+
+class DeliveryTracker:
+    """
+    Keeps unsettled delivery tags in delivery order and turns out-of-order
+    completions into in-order settle operations. Consecutive successes are
+    collapsed into one ``basic_ack(multiple=True)``.
+    """
+
+    def __init__(self):
+        self._pending: 'OrderedDict[int, Any]' = OrderedDict()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, delivery_tag: int):
+        self._pending[delivery_tag] = None
+
+    def complete(self, results: List[Tuple[int, Any]]) -> List[Tuple[str, int, bool]]:
+        """
+        Records (tag, outcome) results, where outcome is True, False or
+        REQUEUE, and returns ('ack'|'nack'|'requeue', tag, multiple)
+        operations to run.
+        """
+        for delivery_tag, ok in results:
+            if delivery_tag in self._pending:
+                self._pending[delivery_tag] = ok
+        operations = []
+        last_ok = None
+        while self._pending:
+            delivery_tag, ok = next(iter(self._pending.items()))
+            if ok is None:
+                break
+            del self._pending[delivery_tag]
+            if ok is True:
+                last_ok = delivery_tag
+                continue
+            if last_ok is not None:
+                operations.append(('ack', last_ok, True))
+                last_ok = None
+            operations.append(('requeue' if ok == REQUEUE else 'nack', delivery_tag, False))
+        if last_ok is not None:
+            operations.append(('ack', last_ok, True))
+        return operations
+
+
+class OrderConsumer:
+    """
+    Consumes order messages with a prefetch window and a worker thread pool.
+    All channel calls stay on the connection thread; workers hand their
+    results back through ``add_callback_threadsafe`` and messages are acked in
+    delivery-tag order. In 'batch' mode queued orders are merged into a single
+    inventory update and acked with one ``basic_ack(multiple=True)``.
+    """
+
+    def __init__(self, url: Optional[str] = RABBITMQ_URL, queue_name: str = ORDER_QUEUE_NAME,
+                 mode: str = CONSUMER_MODE, workers: int = CONSUMER_WORKERS, prefetch: int = CONSUMER_PREFETCH,
+                 batch_size: int = CONSUMER_BATCH_SIZE, batch_timeout: float = CONSUMER_BATCH_TIMEOUT,
+                 connection_factory: Optional[Callable[[], Any]] = None,
+                 stats_callback: Optional[Callable[[int, int], None]] = None, stats_interval: float = 5.0,
+                 drain_timeout: float = 30.0):
+        if mode not in ('concurrent', 'batch'):
+            raise ValueError(f"Unknown consumer mode: {mode!r}")
+        self.url = url
+        self.queue_name = queue_name
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.batch_timeout = batch_timeout
+        # Decision: A batch can only fill up if the broker is allowed to deliver that many unacked messages.
+        self.prefetch = max(prefetch, self.batch_size) if mode == 'batch' else max(1, prefetch)
+        self._connection_factory = connection_factory or (lambda: pika.BlockingConnection(pika.URLParameters(self.url)))
+        self._tracker = DeliveryTracker()
+        self._batch: List[Tuple[int, Dict[str, Any]]] = []
+        self._batch_timer = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stats_callback = stats_callback
+        self.stats_interval = stats_interval
+        self.drain_timeout = drain_timeout
+        self._consumer_tag = None
+        self._stop_requested = False
+        self._drain_deadline = None
+        self.connection = None
+        self.channel = None
+        self.processed = 0
+        self.failed = 0
+        self.requeued = 0
+
+    def connect(self):
+        # Decision: Loop trying to connect to RabbitMQ in case it starts after the consumer.
+        while not self._stop_requested:
+            try:
+                self.connection = self._connection_factory()
+                self.channel = self.connection.channel()
+                self.channel.queue_declare(queue=self.queue_name, durable=True)
+                log.info("Connected to RabbitMQ. Waiting for messages in queue: %s. To exit press CTRL+C", self.queue_name)
+                return
+            except pika.exceptions.AMQPConnectionError as e:
+                log.warning("Connection error: %s. Retrying in 5 seconds...", e)
+                time.sleep(5)
+            except Exception as e:
+                log.error("Unexpected error during connection setup: %s. Retrying in 5 seconds...", e)
+                time.sleep(5)
+
+    # --- Connection-thread side ---
 
-    def callback(ch, method, properties, body):
-        """Function executed when a message is received."""
-        print(f"\n [CONSUMER] Received raw message. Delivery Tag: {method.delivery_tag}")
+    def _on_message(self, ch, method, properties, body):
+        """Function executed on the connection thread when a message is received."""
+        delivery_tag = method.delivery_tag
+        self._tracker.add(delivery_tag)
         try:
             order_data = json.loads(body.decode('utf-8'))
-            if process_order_inventory(order_data):
-                # Acknowledge message only if processing was successful.
-                print(f" [CONSUMER] Acknowledging message for order {order_data['order_id']}...")
-                ch.basic_ack(delivery_tag=method.delivery_tag)
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            log.error("Failed to decode JSON message body. Discarding message.")
+            self._settle([(delivery_tag, False)])
+            return
+
+        if self.mode == 'batch':
+            self._batch.append((delivery_tag, order_data))
+            if len(self._batch) >= self.batch_size:
+                self._flush_batch()
+            elif self._batch_timer is None:
+                self._batch_timer = self.connection.call_later(self.batch_timeout, self._flush_batch)
+        else:
+            self._executor.submit(self._run_one, delivery_tag, order_data)
+
+    def _flush_batch(self):
+        if self._batch_timer is not None:
+            self.connection.remove_timeout(self._batch_timer)
+            self._batch_timer = None
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        self._executor.submit(self._run_batch, batch)
+
+    def _settle(self, results: List[Tuple[int, Any]]):
+        for delivery_tag, ok in results:
+            if ok is True:
+                self.processed += 1
+            elif ok == REQUEUE:
+                self.requeued += 1
+            else:
+                self.failed += 1
+        for operation, delivery_tag, multiple in self._tracker.complete(results):
+            if operation == 'ack':
+                self.channel.basic_ack(delivery_tag=delivery_tag, multiple=multiple)
+            elif operation == 'requeue':
+                self.channel.basic_nack(delivery_tag=delivery_tag, requeue=True)
             else:
                 # Processing failed. Negatively acknowledge (discard). Consider DLQ in production.
-                print(f" [CONSUMER] Processing FAILED for order {order_data['order_id']}. Negatively acknowledging (discarding).")
-                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+                self.channel.basic_nack(delivery_tag=delivery_tag, requeue=False)
+
+    def _report_stats(self):
+        if self._stats_callback:
+            self._stats_callback(self.processed, self.failed)
+            self.connection.call_later(self.stats_interval, self._report_stats)
+
+    def _begin_drain(self):
+        """Stops new deliveries and waits for in-flight messages to be settled."""
+        if self._drain_deadline is not None:
+            return
+        log.info("Graceful shutdown requested; draining %d in-flight message(s)...", len(self._tracker))
+        self._drain_deadline = time.monotonic() + self.drain_timeout
+        if self.mode == 'batch':
+            self._flush_batch()
+        if self._consumer_tag is not None:
+            # Deliveries not yet handed to the callback are requeued by pika.
+            self.channel.basic_cancel(self._consumer_tag)
+        self._check_drained()
+
+    def _check_drained(self):
+        if not len(self._tracker) or time.monotonic() >= self._drain_deadline:
+            self.channel.stop_consuming()
+        else:
+            self.connection.call_later(0.1, self._check_drained)
+
+    def stop(self):
+        """
+        Requests a graceful stop. Safe to call from signal handlers and other
+        threads; messages still unacked when the drain times out are requeued
+        by the broker when the connection closes.
+        """
+        self._stop_requested = True
+        if self.connection is not None and self.connection.is_open:
+            self.connection.add_callback_threadsafe(self._begin_drain)
+
+    # --- Worker-thread side ---
+
+    def _hand_back(self, results: List[Tuple[int, Any]]):
+        self.connection.add_callback_threadsafe(partial(self._settle, results))
+
+    @staticmethod
+    def _failed(orders: List[Dict[str, Any]], error: Exception) -> List[Any]:
+        """Outcomes for orders whose processing raised: requeued when transient, else discarded as failed."""
+        if isinstance(error, TRANSIENT_ERRORS):
+            log.warning("Transient error processing %d order(s): %s. Requeueing.", len(orders), error)
+            return [REQUEUE] * len(orders)
+        log.error("Unexpected error processing %d order(s): %s. Discarding.", len(orders), error)
+        CONSUMER_ORDERS_TOTAL.inc('failed', amount=len(orders))
+        for order_data in orders:
+            if isinstance(order_data, dict) and 'order_id' in order_data:
+                notify_status(order_data, 'Processing Failed')
+        return [False] * len(orders)
 
-        except json.JSONDecodeError:
-            print(" [CONSUMER] Failed to decode JSON message body. Discarding message.")
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+    def _run_one(self, delivery_tag: int, order_data: Dict[str, Any]):
+        try:
+            ok = bool(process_order_inventory(order_data))
+        except Exception as e:
+            ok = self._failed([order_data], e)[0]
+        if ok is False:
+            log.warning("Processing FAILED for order %s. Negatively acknowledging (discarding).", order_data.get('order_id'))
+        self._hand_back([(delivery_tag, ok)])
+
+    def _run_batch(self, batch: List[Tuple[int, Dict[str, Any]]]):
+        orders = [order_data for _, order_data in batch]
+        try:
+            results = [bool(ok) for ok in process_order_batch(orders)]
         except Exception as e:
-            print(f" [CONSUMER] Unexpected error processing message: {e}. Discarding message.")
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False) # Avoid requeue loops
-
-    # Register callback and start consuming
-    channel.basic_consume(queue=ORDER_QUEUE_NAME, on_message_callback=callback, auto_ack=False)
-    try:
-        channel.start_consuming()
-    except KeyboardInterrupt:
-        print("Consumer stopped.")
-    except Exception as e:
-        print(f"An error occurred during consumption: {e}")
-    finally:
-        if connection and connection.is_open:
-            connection.close()
-            print("RabbitMQ connection closed.")
+            results = self._failed(orders, e)
+        self._hand_back([(delivery_tag, ok) for (delivery_tag, _), ok in zip(batch, results)])
+
+    def run(self):
+        """Connects, starts the worker pool and consumes until interrupted."""
+        self.connect()
+        if self._stop_requested:
+            return
+        self.channel.basic_qos(prefetch_count=self.prefetch)
+        status_publisher.start()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='order-worker')
+        self._consumer_tag = self.channel.basic_consume(
+            queue=self.queue_name, on_message_callback=self._on_message, auto_ack=False)
+        if self._stats_callback:
+            self.connection.call_later(self.stats_interval, self._report_stats)
+        log.info("Mode=%s workers=%d prefetch=%d%s", self.mode, self.workers, self.prefetch,
+                 f" batch_size={self.batch_size}" if self.mode == 'batch' else "")
+        try:
+            self.channel.start_consuming()
+        except KeyboardInterrupt:
+            log.info("Consumer stopped.")
+        except Exception as e:
+            log.error("An error occurred during consumption: %s", e)
+        finally:
+            # Unsettled messages are redelivered by the broker once the connection closes.
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            status_publisher.stop()
+            if self._stats_callback:
+                self._stats_callback(self.processed, self.failed)
+            if self.connection and self.connection.is_open:
+                self.connection.close()
+                log.info("RabbitMQ connection closed.")
+
+
+def run_worker(worker_id: int, stats_queue=None):
+    """
+    Entry point for one consumer worker process started by the supervisor.
+    SIGTERM triggers a graceful drain; progress is reported as
+    (worker_id, processed, failed, timestamp) tuples on ``stats_queue``.
+    """
+    def report(processed, failed):
+        stats_queue.put((worker_id, processed, failed, time.time()))
+
+    consumer = OrderConsumer(stats_callback=report if stats_queue is not None else None)
+    signal.signal(signal.SIGTERM, lambda signum, frame: consumer.stop())
+    # Decision: Ctrl+C goes to the whole process group; let the supervisor decide how workers stop.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    log.info("Worker %d (process %d) starting...", worker_id, os.getpid())
+    if CONSUMER_METRICS_PORT:
+        serve_metrics(CONSUMER_METRICS_PORT + worker_id)
+    consumer.run()
+
+
+def main():
+    #Sets up RabbitMQ connection, channel, consumer engine, and starts listening.
+    log.info("Starting Consumer...")
+    if CONSUMER_METRICS_PORT:
+        serve_metrics(CONSUMER_METRICS_PORT)
+    OrderConsumer().run()
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
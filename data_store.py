@@ -1,4 +1,13 @@
-books_data= {
+import os
+import time
+
+from catalog_store import CatalogStore, CatalogView
+from inventory_store import InventoryStore, InventoryView
+from order_store import OrderStore, SQLiteOrderStore
+from reservations import ReservationEngine
+
+# Initial catalog; loaded into the catalog store on first use.
+SEED_BOOKS = {
     # Using dictionary for easier lookup by ID
     1: {
         "id": 1,
@@ -50,7 +59,8 @@ books_data= {
     }
 }
 
-inventory= {
+# Initial stock per book; loaded into the inventory store when it has no row for a book yet.
+SEED_INVENTORY = {
     1: 5,
     2: 3,
     3: 10,
@@ -60,4 +70,63 @@ inventory= {
     # ... other book IDs and stock counts ...
 }
 
-orders = {}
\ No newline at end of file
+# Decision: Orders are compact records; old and overflow orders move to an append-only log on disk.
+# With ORDER_DB_PATH set (multi-worker mode, see serve.py) every worker reads and writes one SQLite file instead.
+ORDER_DB_PATH = os.environ.get('ORDER_DB_PATH', '')
+if ORDER_DB_PATH:
+    orders = SQLiteOrderStore(ORDER_DB_PATH)
+else:
+    orders = OrderStore(
+        os.environ.get('ORDER_LOG_PATH', 'orders.log'),
+        max_memory_orders=int(os.environ.get('ORDER_MEMORY_LIMIT', '10000')),
+        archive_after_seconds=float(os.environ.get('ORDER_ARCHIVE_AFTER_SECONDS', '300'))
+    )
+
+# Decision: Stock and reservations live in a shared SQLite file so every API worker and consumer sees the same
+# numbers. Orders reserve stock atomically, so concurrent orders cannot oversell. With INVENTORY_DB_PATH set to
+# an empty string the single-process in-memory engine is used instead.
+INVENTORY_DB_PATH = os.environ.get('INVENTORY_DB_PATH', 'inventory.db')
+RESERVATION_TTL_SECONDS = float(os.environ.get('RESERVATION_TTL_SECONDS', '900'))
+if INVENTORY_DB_PATH:
+    reservations = InventoryStore(INVENTORY_DB_PATH, seed=SEED_INVENTORY, ttl_seconds=RESERVATION_TTL_SECONDS)
+    # Read-only {book_id: available} view; writes go through `reservations`.
+    inventory = InventoryView(reservations)
+else:
+    inventory = dict(SEED_INVENTORY)
+    reservations = ReservationEngine(
+        inventory,
+        stripes=int(os.environ.get('RESERVATION_LOCK_STRIPES', '64')),
+        ttl_seconds=RESERVATION_TTL_SECONDS
+    )
+
+# Decision: Bump this whenever books_data changes so derived indexes (title matcher, caches) know to refresh.
+catalog_version = 0
+# When the catalog last changed (Last-Modified of catalog responses).
+catalog_updated_at = time.time()
+
+def bump_catalog_version():
+    global catalog_version, catalog_updated_at
+    catalog_version += 1
+    catalog_updated_at = time.time()
+    return catalog_version
+
+# Decision: The catalog lives in an indexed SQLite store (in memory unless CATALOG_DB_PATH is set).
+# It is opened and seeded on first access, not at import time.
+catalog = CatalogStore(os.environ.get('CATALOG_DB_PATH', ':memory:'), seed=SEED_BOOKS,
+                       on_change=bump_catalog_version)
+
+# A catalog file may be changed by other processes (e.g. other API workers); look at most this often.
+CATALOG_SYNC_INTERVAL = float(os.environ.get('CATALOG_SYNC_INTERVAL', '1'))
+_catalog_checked_at = 0.0
+
+def sync_catalog_version() -> int:
+    """Bumps catalog_version if another process changed the catalog file since the last look."""
+    global _catalog_checked_at
+    now = time.monotonic()
+    if catalog.shared and now - _catalog_checked_at >= CATALOG_SYNC_INTERVAL:
+        _catalog_checked_at = now
+        if catalog.changed_elsewhere():
+            bump_catalog_version()
+    return catalog_version
+# Read-only {id: book} view for code that still treats the catalog as a dict.
+books_data = CatalogView(catalog)
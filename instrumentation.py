@@ -0,0 +1,330 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Decision: One switch for metrics; when off, timers and counters are shared no-ops.
+INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', '1').lower() not in ('0', 'false', 'no')
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+
+# Seconds; covers in-memory stages (tens of microseconds) up to LLM calls (tens of seconds).
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0)
+
+
+# --- Logging: callers only enqueue records; one thread per process formats and writes them ---
+
+# The format uses none of these; skipping them is the optimisation the logging docs recommend.
+logging._srcfile = None
+logging.logThreads = False
+logging.logProcesses = False
+logging.logMultiprocessing = False
+
+_log_queue: 'queue.SimpleQueue' = queue.SimpleQueue()
+_listener: Optional[logging.handlers.QueueListener] = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def _start_listener():
+    global _listener, _listener_pid
+    with _listener_lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            return
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s"))
+        _listener = logging.handlers.QueueListener(_log_queue, handler)
+        _listener.start()
+        _listener_pid = os.getpid()
+
+
+def _stop_listener():
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()  # Writes whatever is still queued.
+
+
+def flush_logs():
+    """Writes every queued record now; call it before ``os._exit``, which skips atexit handlers."""
+    _stop_listener()
+
+
+def _after_fork():
+    # The writer thread does not survive fork; the child gets its own queue and thread.
+    global _log_queue, _listener
+    _log_queue = queue.SimpleQueue()
+    _listener = None
+    for logger in _loggers.values():
+        logger.handlers = [_EnqueueHandler(_log_queue)]
+    _start_listener()
+
+
+class _EnqueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves all formatting to the writer thread (the stock one formats in the caller)."""
+
+    def prepare(self, record):
+        return record
+
+
+_loggers: Dict[str, logging.Logger] = {}
+atexit.register(_stop_listener)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def get_logger(component: str) -> logging.Logger:
+    """
+    Returns the logger for a component (e.g. 'API/PRODUCER', 'CONSUMER').
+    Records below LOG_LEVEL are dropped before formatting; the rest are
+    written by a background thread so request threads never wait on stdout.
+    """
+    logger = _loggers.get(component)
+    if logger is None:
+        _start_listener()
+        logger = logging.getLogger(component)
+        logger.handlers = [_EnqueueHandler(_log_queue)]
+        logger.setLevel(LOG_LEVEL)
+        logger.propagate = False
+        _loggers[component] = logger
+    return logger
+
+
+# --- Metrics ---
+
+def _label_text(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic counter with optional labels; ``inc`` takes label values positionally."""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1.0):
+        if not INSTRUMENTATION_ENABLED:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_label_text(self.label_names, labels)} {_number(value)}" for labels, value in items]
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'total', 'count', 'lock')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.total += value
+            self.count += 1
+
+
+class Histogram:
+    """Fixed-bucket latency histogram with optional labels (Prometheus semantics: cumulative buckets)."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._children: Dict[Tuple[str, ...], _HistogramChild] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *label_values) -> _HistogramChild:
+        child = self._children.get(label_values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(label_values, _HistogramChild(self.buckets))
+        return child
+
+    def observe(self, value: float, *label_values):
+        if INSTRUMENTATION_ENABLED:
+            self.labels(*label_values).observe(value)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, child in sorted(self._children.items()):
+            with child.lock:
+                counts, total, count = list(child.counts), child.total, child.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_label_text(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.label_names, labels)} {repr(total)}")
+            lines.append(f"{self.name}_count{_label_text(self.label_names, labels)} {count}")
+        return lines
+
+
+class GaugeCallback:
+    """Gauge read on every scrape from ``read()``, which returns {label values tuple: value} or a number."""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], object], labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.read = read
+
+    def samples(self) -> List[str]:
+        try:
+            values = self.read()
+        except Exception:
+            return []  # A failing source must not break the whole scrape.
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [f"{self.name}{_label_text(self.label_names, labels)} {_number(value)}"
+                for labels, value in sorted(values.items()) if value is not None]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing  # Re-imports (and reloads in tests) share the first instance.
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labels: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def gauge_callback(self, name: str, documentation: str, read: Callable[[], object],
+                       labels: Iterable[str] = ()) -> GaugeCallback:
+        return self._register(GaugeCallback(name, documentation, read, labels))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+STAGE_SECONDS = REGISTRY.histogram('library_stage_seconds', 'Time spent in each stage of a request path.',
+                                   ('path', 'stage'))
+
+
+# --- Stage timers ---
+
+class _StageTimer:
+    __slots__ = ('_child', '_started')
+
+    def __init__(self, child: _HistogramChild):
+        self._child = child
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._child.observe(time.perf_counter() - self._started)
+        return False
+
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP_TIMER = _NoopTimer()
+
+
+def timed(path: str, stage: str):
+    """
+    ``with timed('order', 'reserve'):`` records the block's duration in
+    library_stage_seconds{path, stage}; a shared no-op when instrumentation is off.
+    """
+    if not INSTRUMENTATION_ENABLED:
+        return _NOOP_TIMER
+    return _StageTimer(STAGE_SECONDS.labels(path, stage))
+
+
+# --- Exposition for processes without an HTTP server (consumers) ---
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes are not worth a log line each.
+
+
+def serve_metrics(port: int, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+    """Serves GET /metrics on ``port`` from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    get_logger('METRICS').info("Serving /metrics on port %s.", port)
+    return server
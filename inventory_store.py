@@ -0,0 +1,309 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from reservations import (IdempotencyConflict, InsufficientStock, Reservation, ReservationError,
+                          UnknownReservation, merge_items)
+
+
+class InventoryStore:
+    """
+    Process-safe inventory and reservations in one SQLite file (WAL mode), so
+    any number of API workers and consumer processes on a host share the same
+    stock. ``stock`` keeps on-hand and reserved units per book (available =
+    on_hand - reserved); ``reservations`` keeps each order's held units.
+
+    The API reserves (all or nothing, one IMMEDIATE transaction); consumers
+    commit reservations in bulk, which turns reserved units into sold ones.
+    Reads never wait on writers. Same interface as ReservationEngine.
+    """
+
+    # Reservations are committed by the consumer, in another process.
+    shared = True
+
+    def __init__(self, path: str, seed: Optional[Dict[int, int]] = None, ttl_seconds: float = 900.0,
+                 retain_seconds: float = 86400.0, busy_timeout: float = 5.0, purge_interval: float = 60.0):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.retain_seconds = retain_seconds
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+        self.busy_timeout = busy_timeout
+        self._seed = seed or {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._pid = None
+        self._lock = threading.RLock()
+        self.rejected = 0
+        self.replayed = 0
+
+    # --- Connection (one per process, opened lazily so forked workers never share it) ---
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is not None and self._pid == os.getpid():
+            return self._db
+        with self._lock:
+            if self._db is None or self._pid != os.getpid():
+                db = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False,
+                                     isolation_level=None)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA synchronous=NORMAL")
+                db.execute("CREATE TABLE IF NOT EXISTS stock ("
+                           " book_id INTEGER PRIMARY KEY, on_hand INTEGER NOT NULL,"
+                           " reserved INTEGER NOT NULL DEFAULT 0)")
+                db.execute("CREATE TABLE IF NOT EXISTS reservations ("
+                           " reservation_id TEXT PRIMARY KEY, items TEXT NOT NULL, status TEXT NOT NULL,"
+                           " expires_at REAL NOT NULL, idempotency_key TEXT UNIQUE, reference TEXT,"
+                           " finished_at REAL)")
+                db.execute("CREATE INDEX IF NOT EXISTS reservations_held ON reservations (status, expires_at)")
+                if self._seed:
+                    # Only books the file does not know yet; existing stock always wins.
+                    db.executemany("INSERT OR IGNORE INTO stock (book_id, on_hand) VALUES (?, ?)",
+                                   list(self._seed.items()))
+                self._db, self._pid = db, os.getpid()
+        return self._db
+
+    def _write(self, work):
+        """Runs ``work(db)`` in one IMMEDIATE transaction (takes the write lock up front, no upgrade deadlocks)."""
+        db = self._connect()
+        with self._lock:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(db)
+                db.execute("COMMIT")
+                return result
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def _read(self, sql: str, params: Tuple = ()) -> List[tuple]:
+        db = self._connect()
+        with self._lock:
+            return db.execute(sql, params).fetchall()
+
+    # --- Reads ---
+
+    def available(self, book_id: int) -> int:
+        rows = self._read("SELECT on_hand - reserved FROM stock WHERE book_id = ?", (int(book_id),))
+        return rows[0][0] if rows else 0
+
+    def available_many(self) -> Dict[int, int]:
+        return dict(self._read("SELECT book_id, on_hand - reserved FROM stock"))
+
+    def get(self, reservation_id: str) -> Optional[Reservation]:
+        rows = self._read("SELECT reservation_id, items, status, expires_at, idempotency_key, reference, finished_at"
+                          " FROM reservations WHERE reservation_id = ?", (reservation_id,))
+        return self._reservation(rows[0]) if rows else None
+
+    @staticmethod
+    def _reservation(row) -> Reservation:
+        reservation = Reservation(row[0], {int(k): v for k, v in json.loads(row[1]).items()}, row[3], row[4], row[5])
+        reservation.status, reservation.finished_at = row[2], row[6]
+        return reservation
+
+    # --- Reservations (API side) ---
+
+    def _reserve_in(self, db, wanted: Dict[int, int], idempotency_key: Optional[str], reference: Any,
+                    ttl_seconds: Optional[float]) -> Tuple[Reservation, bool]:
+        """Reserves inside the caller's transaction; raises before changing anything it cannot finish."""
+        if idempotency_key is not None:
+            row = db.execute("SELECT reservation_id, items, status, expires_at, idempotency_key, reference,"
+                             " finished_at FROM reservations WHERE idempotency_key = ?",
+                             (idempotency_key,)).fetchone()
+            if row is not None:
+                existing = self._reservation(row)
+                if existing.items != wanted:
+                    raise IdempotencyConflict(f"Idempotency key {idempotency_key!r} was used for different items.")
+                self.replayed += 1
+                return existing, False
+        db.execute("SAVEPOINT reserve")
+        try:
+            for book_id, quantity in sorted(wanted.items()):
+                # Conditional update: only succeeds while enough units are unreserved.
+                updated = db.execute("UPDATE stock SET reserved = reserved + ? WHERE book_id = ?"
+                                     " AND on_hand - reserved >= ?", (quantity, book_id, quantity)).rowcount
+                if not updated:
+                    row = db.execute("SELECT on_hand - reserved FROM stock WHERE book_id = ?", (book_id,)).fetchone()
+                    self.rejected += 1
+                    raise InsufficientStock(book_id, quantity, row[0] if row else 0)
+            reservation = Reservation(uuid.uuid4().hex, wanted,
+                                      time.time() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds),
+                                      idempotency_key, reference)
+            db.execute("INSERT INTO reservations (reservation_id, items, status, expires_at, idempotency_key, reference)"
+                       " VALUES (?, ?, 'held', ?, ?, ?)",
+                       (reservation.reservation_id, json.dumps(wanted), reservation.expires_at,
+                        idempotency_key, None if reference is None else str(reference)))
+        except BaseException:
+            db.execute("ROLLBACK TO reserve")
+            db.execute("RELEASE reserve")
+            raise
+        db.execute("RELEASE reserve")
+        return reservation, True
+
+    def reserve(self, items: Iterable[Tuple[int, int]], idempotency_key: Optional[str] = None,
+                reference: Any = None, ttl_seconds: Optional[float] = None) -> Tuple[Reservation, bool]:
+        """Reserves every (book_id, quantity) or nothing; see ReservationEngine.reserve."""
+        wanted = merge_items(items)
+        self.expire_due()
+        return self._write(lambda db: self._reserve_in(db, wanted, idempotency_key, reference, ttl_seconds))
+
+    def reserve_many(self, requests: List[Tuple[Iterable[Tuple[int, int]], Optional[str], Any]]) -> List[Any]:
+        """
+        Reserves several orders, each all or nothing, in one transaction.
+        ``requests`` are (items, idempotency_key, reference); returns per order
+        either (reservation, created) or the ReservationError it failed with.
+        """
+        wanted = [(merge_items(items), key, reference) for items, key, reference in requests]
+        self.expire_due()
+
+        def work(db):
+            results = []
+            for items, key, reference in wanted:
+                try:
+                    results.append(self._reserve_in(db, items, key, reference, None))
+                except ReservationError as e:
+                    results.append(e)
+            return results
+
+        return self._write(work)
+
+    def _finish(self, db, reservation_id: str, status: str) -> Reservation:
+        row = db.execute("SELECT reservation_id, items, status, expires_at, idempotency_key, reference, finished_at"
+                         " FROM reservations WHERE reservation_id = ?", (reservation_id,)).fetchone()
+        if row is None:
+            raise UnknownReservation(f"Unknown reservation {reservation_id!r}.")
+        reservation = self._reservation(row)
+        if reservation.status != 'held':
+            raise UnknownReservation(f"Reservation {reservation_id!r} is already {reservation.status}.")
+        sold = 1 if status == 'committed' else 0
+        db.executemany("UPDATE stock SET reserved = reserved - ?, on_hand = on_hand - ? WHERE book_id = ?",
+                       [(quantity, quantity * sold, book_id) for book_id, quantity in reservation.items.items()])
+        reservation.status, reservation.finished_at = status, time.time()
+        db.execute("UPDATE reservations SET status = ?, finished_at = ? WHERE reservation_id = ?",
+                   (status, reservation.finished_at, reservation_id))
+        return reservation
+
+    def commit(self, reservation_id: str) -> Reservation:
+        return self._write(lambda db: self._finish(db, reservation_id, 'committed'))
+
+    def release(self, reservation_id: str) -> Reservation:
+        return self._write(lambda db: self._finish(db, reservation_id, 'released'))
+
+    def release_many(self, reservation_ids: List[str]):
+        def work(db):
+            for reservation_id in reservation_ids:
+                try:
+                    self._finish(db, reservation_id, 'released')
+                except UnknownReservation:
+                    pass
+        self._write(work)
+
+    def forget_key(self, idempotency_key: str, reservation_id: str) -> bool:
+        """See ReservationEngine.forget_key."""
+        return bool(self._write(lambda db: db.execute(
+            "UPDATE reservations SET idempotency_key = NULL WHERE reservation_id = ? AND idempotency_key = ?"
+            " AND status IN ('released', 'expired')", (reservation_id, idempotency_key)).rowcount))
+
+    def expire_due(self) -> int:
+        """Releases held reservations past their expiry and forgets old finished ones; returns how many expired."""
+        now = time.time()
+        due = self._read("SELECT reservation_id FROM reservations WHERE status = 'held' AND expires_at <= ? LIMIT 500",
+                         (now,))
+        # Decision: Finished rows (and their idempotency keys) are purged every purge_interval, expiries or not.
+        purge = time.monotonic() >= self._next_purge
+        if not due and not purge:
+            return 0
+        if purge:
+            self._next_purge = time.monotonic() + self.purge_interval
+
+        def work(db):
+            expired = 0
+            for (reservation_id,) in due:
+                try:
+                    self._finish(db, reservation_id, 'expired')
+                    expired += 1
+                except UnknownReservation:
+                    pass  # another process finished it first
+            if purge:
+                db.execute("DELETE FROM reservations WHERE status != 'held' AND finished_at <= ?",
+                           (now - self.retain_seconds,))
+            return expired
+
+        return self._write(work)
+
+    # --- Consumer side ---
+
+    def commit_orders(self, orders: List[Dict[str, Any]]) -> List[bool]:
+        """
+        Applies a batch of order messages in one transaction and returns one
+        result per order. Orders with a held reservation commit it; orders
+        whose reservation is already committed (a redelivery) succeed without
+        touching stock again. Orders without a reservation, or whose
+        reservation expired, take their units directly if they are available.
+        """
+        def take_directly(db, items: Dict[int, int]) -> bool:
+            db.execute("SAVEPOINT direct")
+            for book_id, quantity in items.items():
+                if not db.execute("UPDATE stock SET on_hand = on_hand - ? WHERE book_id = ?"
+                                  " AND on_hand - reserved >= ?", (quantity, book_id, quantity)).rowcount:
+                    db.execute("ROLLBACK TO direct")
+                    db.execute("RELEASE direct")
+                    return False
+            db.execute("RELEASE direct")
+            return True
+
+        def work(db):
+            results = []
+            for order_data in orders:
+                reservation_id = order_data.get('reservation_id')
+                items = merge_items((int(item['book_id']), int(item['quantity'])) for item in order_data['items'])
+                row = None
+                if reservation_id:
+                    row = db.execute("SELECT status FROM reservations WHERE reservation_id = ?",
+                                     (reservation_id,)).fetchone()
+                if row is not None and row[0] == 'held':
+                    self._finish(db, reservation_id, 'committed')
+                    results.append(True)
+                elif row is not None and row[0] == 'committed':
+                    results.append(True)
+                elif row is not None and row[0] == 'released':
+                    results.append(False)  # the API gave this order up
+                else:
+                    results.append(take_directly(db, items))
+            return results
+
+        return self._write(work)
+
+    def restock(self, book_id: int, quantity: int):
+        self._write(lambda db: db.execute(
+            "INSERT INTO stock (book_id, on_hand) VALUES (?, ?)"
+            " ON CONFLICT(book_id) DO UPDATE SET on_hand = on_hand + excluded.on_hand", (int(book_id), quantity)))
+
+    def stats(self) -> Dict[str, Any]:
+        counts = dict(self._read("SELECT status, COUNT(*) FROM reservations GROUP BY status"))
+        return {"held": counts.get('held', 0), "committed": counts.get('committed', 0),
+                "released": counts.get('released', 0), "expired": counts.get('expired', 0),
+                "rejected": self.rejected, "replayed": self.replayed, "path": self.path}
+
+
+class InventoryView(Mapping):
+    """Read-only ``{book_id: available}`` view of an InventoryStore, for code written against the old dict."""
+
+    def __init__(self, store: InventoryStore):
+        self.store = store
+
+    def __getitem__(self, book_id):
+        rows = self.store._read("SELECT on_hand - reserved FROM stock WHERE book_id = ?", (int(book_id),))
+        if not rows:
+            raise KeyError(book_id)
+        return rows[0][0]
+
+    def __iter__(self):
+        return iter(self.store.available_many())
+
+    def __len__(self):
+        return len(self.store.available_many())
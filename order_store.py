@@ -0,0 +1,353 @@
+import base64
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Orders in these states never change again and may be archived once they are old enough.
+FINAL_STATUSES = frozenset({'Processed', 'Processing Failed', 'Queueing Failed', 'Cancelled'})
+
+
+class OrderRecord:
+    """
+    One order in compact form: items are parallel arrays of book ids,
+    quantities and prices; titles are looked up by book id when the order is
+    rendered instead of being copied into every order.
+    """
+
+    __slots__ = ('order_id', 'user_id', 'status', 'created_at', 'updated_at', 'book_ids', 'quantities', 'prices',
+                 'total_price', 'reservation_id')
+
+    def __init__(self, order_id: str, user_id: str, items: List[Tuple[int, int, float]], status: str = 'Pending',
+                 created_at: Optional[float] = None, reservation_id: Optional[str] = None,
+                 total_price: Optional[float] = None, updated_at: Optional[float] = None):
+        self.order_id = order_id
+        self.user_id = sys.intern(user_id)
+        self.status = sys.intern(status)
+        self.created_at = time.time() if created_at is None else created_at
+        self.updated_at = self.created_at if updated_at is None else updated_at
+        self.book_ids = array('l', (book_id for book_id, _, _ in items))
+        self.quantities = array('l', (quantity for _, quantity, _ in items))
+        self.prices = array('d', (price for _, _, price in items))
+        self.total_price = round(sum(q * p for _, q, p in items), 2) if total_price is None else total_price
+        self.reservation_id = reservation_id
+
+    def to_dict(self, title_of: Callable[[int], Optional[str]]) -> Dict[str, Any]:
+        """The order in the API's original response shape."""
+        return {
+            "order_id": self.order_id,
+            "items": [{"book_id": book_id, "title": title_of(book_id), "quantity": quantity, "price_per_item": price}
+                      for book_id, quantity, price in zip(self.book_ids, self.quantities, self.prices)],
+            "total_price": self.total_price,
+            "status": self.status,
+            "user_identifier": self.user_id,
+            "reservation_id": self.reservation_id,
+            "created_at": self.created_at,
+        }
+
+    def to_log(self) -> Dict[str, Any]:
+        return {"order_id": self.order_id, "user_id": self.user_id, "status": self.status,
+                "created_at": self.created_at, "updated_at": self.updated_at,
+                "items": [[b, q, p] for b, q, p in zip(self.book_ids, self.quantities, self.prices)],
+                "total_price": self.total_price, "reservation_id": self.reservation_id}
+
+    @classmethod
+    def from_log(cls, entry: Dict[str, Any]) -> 'OrderRecord':
+        return cls(entry['order_id'], entry['user_id'], [tuple(item) for item in entry['items']], entry['status'],
+                   entry['created_at'], entry.get('reservation_id'), entry['total_price'], entry.get('updated_at'))
+
+
+def encode_order_cursor(created_at: float, order_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([created_at, order_id]).encode()).decode().rstrip('=')
+
+
+def decode_order_cursor(cursor: str) -> Tuple[float, str]:
+    try:
+        created_at, order_id = json.loads(base64.urlsafe_b64decode((cursor + '=' * (-len(cursor) % 4)).encode()))
+        return float(created_at), str(order_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+class OrderStore:
+    """
+    Recent and in-flight orders in memory as OrderRecords; everything else in
+    an append-only JSON-lines log on disk, located through a SQLite index
+    (order id -> offset, plus (user, created_at) for listings).
+
+    ``maintain`` (run every ``maintain_every`` writes) moves final orders
+    older than ``archive_after_seconds`` to the log, and the oldest orders of
+    any status once more than ``max_memory_orders`` are in memory, so memory
+    stays flat however long the process runs. A status change of an
+    archived order appends a new log line and repoints the index.
+    """
+
+    def __init__(self, log_path: str, max_memory_orders: int = 10000, archive_after_seconds: float = 300.0,
+                 maintain_every: int = 100, clock: Callable[[], float] = time.time):
+        self.log_path = log_path
+        self.max_memory_orders = max(1, max_memory_orders)
+        self.archive_after_seconds = archive_after_seconds
+        self.maintain_every = max(1, maintain_every)
+        self.clock = clock
+        self._memory: 'OrderedDict[str, OrderRecord]' = OrderedDict()
+        self._by_user: Dict[str, Dict[str, None]] = {}  # user -> in-memory order ids (ordered set)
+        self._lock = threading.RLock()
+        self._writes = 0
+        self._log = None
+        self._index: Optional[sqlite3.Connection] = None
+        self.archived = 0
+
+    # --- Disk tier ---
+
+    def _open(self):
+        if self._index is not None:
+            return
+        self._log = open(self.log_path, 'ab+')
+        self._index = sqlite3.connect(self.log_path + '.idx', check_same_thread=False, isolation_level=None)
+        self._index.execute("PRAGMA journal_mode=WAL")
+        self._index.execute("PRAGMA synchronous=NORMAL")
+        self._index.execute("CREATE TABLE IF NOT EXISTS archive ("
+                            " order_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, created_at REAL NOT NULL,"
+                            " offset INTEGER NOT NULL, length INTEGER NOT NULL)")
+        self._index.execute("CREATE INDEX IF NOT EXISTS archive_user ON archive (user_id, created_at, order_id)")
+
+    def _archive(self, records: List[OrderRecord]):
+        """Appends records to the log and indexes them; must be called with ``_lock`` held."""
+        if not records:
+            return
+        self._open()
+        self._log.seek(0, os.SEEK_END)
+        offset = self._log.tell()
+        rows = []
+        chunks = []
+        for record in records:
+            line = (json.dumps(record.to_log(), separators=(',', ':')) + '\n').encode('utf-8')
+            rows.append((record.order_id, record.user_id, record.created_at, offset, len(line)))
+            chunks.append(line)
+            offset += len(line)
+        self._log.write(b''.join(chunks))
+        self._log.flush()
+        self._index.execute("BEGIN")
+        self._index.executemany("INSERT OR REPLACE INTO archive (order_id, user_id, created_at, offset, length)"
+                                " VALUES (?, ?, ?, ?, ?)", rows)
+        self._index.execute("COMMIT")
+        self.archived += len(records)
+
+    def _read_archived(self, order_id: str) -> Optional[OrderRecord]:
+        if self._index is None and not os.path.exists(self.log_path + '.idx'):
+            return None
+        self._open()
+        row = self._index.execute("SELECT offset, length FROM archive WHERE order_id = ?", (order_id,)).fetchone()
+        if row is None:
+            return None
+        return self._read_at(*row)
+
+    def _read_at(self, offset: int, length: int) -> OrderRecord:
+        self._log.seek(offset)
+        return OrderRecord.from_log(json.loads(self._log.read(length)))
+
+    # --- API ---
+
+    def add(self, record: OrderRecord):
+        self.add_many([record])
+
+    def add_many(self, records: List[OrderRecord]):
+        with self._lock:
+            for record in records:
+                self._memory[record.order_id] = record
+                self._by_user.setdefault(record.user_id, {})[record.order_id] = None
+            previous, self._writes = self._writes, self._writes + len(records)
+            if self._writes // self.maintain_every != previous // self.maintain_every:
+                self.maintain()
+
+    def get(self, order_id: str) -> Optional[OrderRecord]:
+        with self._lock:
+            record = self._memory.get(order_id)
+            if record is not None:
+                return record
+            return self._read_archived(order_id)
+
+    def set_status(self, order_id: str, status: str) -> Optional[OrderRecord]:
+        with self._lock:
+            record = self._memory.get(order_id)
+            if record is not None:
+                record.status, record.updated_at = sys.intern(status), self.clock()
+                return record
+            record = self._read_archived(order_id)
+            if record is not None:
+                record.status, record.updated_at = sys.intern(status), self.clock()
+                self._archive([record])
+            return record
+
+    def maintain(self) -> int:
+        """Moves old final orders (and any overflow beyond ``max_memory_orders``) to disk; returns how many moved."""
+        with self._lock:
+            cutoff = self.clock() - self.archive_after_seconds
+            moving = [record for record in self._memory.values()
+                      if record.status in FINAL_STATUSES and record.updated_at <= cutoff]
+            moved_ids = {record.order_id for record in moving}
+            overflow = len(self._memory) - len(moving) - self.max_memory_orders
+            if overflow > 0:
+                for order_id, record in self._memory.items():  # oldest first
+                    if overflow <= 0:
+                        break
+                    if order_id not in moved_ids:
+                        moving.append(record)
+                        moved_ids.add(order_id)
+                        overflow -= 1
+            self._archive(moving)
+            for order_id in moved_ids:
+                record = self._memory.pop(order_id)
+                user_orders = self._by_user[record.user_id]
+                del user_orders[order_id]
+                if not user_orders:
+                    del self._by_user[record.user_id]
+            return len(moving)
+
+    def list_for_user(self, user_id: str, limit: int = 20,
+                      cursor: Optional[str] = None) -> Tuple[List[OrderRecord], Optional[str]]:
+        """Returns the user's orders newest first and a cursor for the next page (None on the last one)."""
+        before = decode_order_cursor(cursor) if cursor else None
+        with self._lock:
+            candidates = [self._memory[order_id] for order_id in self._by_user.get(user_id, ())]
+            candidates = [record for record in candidates
+                          if before is None or (record.created_at, record.order_id) < before]
+            if self._index is not None or os.path.exists(self.log_path + '.idx'):
+                self._open()
+                sql = "SELECT order_id, offset, length FROM archive WHERE user_id = ?"
+                params: List[Any] = [user_id]
+                if before is not None:
+                    sql += " AND (created_at < ? OR (created_at = ? AND order_id < ?))"
+                    params += [before[0], before[0], before[1]]
+                rows = self._index.execute(sql + " ORDER BY created_at DESC, order_id DESC LIMIT ?",
+                                           params + [limit + 1]).fetchall()
+                in_memory = {record.order_id for record in candidates}
+                candidates += [self._read_at(offset, length) for order_id, offset, length in rows
+                               if order_id not in in_memory and order_id not in self._memory]
+        candidates.sort(key=lambda record: (record.created_at, record.order_id), reverse=True)
+        page = candidates[:limit]
+        next_cursor = encode_order_cursor(page[-1].created_at, page[-1].order_id) if len(candidates) > limit else None
+        return page, next_cursor
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"in_memory": len(self._memory), "archived": self.archived,
+                    "max_memory_orders": self.max_memory_orders}
+
+    def close(self):
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+            if self._index is not None:
+                self._index.close()
+            self._log = self._index = None
+
+
+class SQLiteOrderStore:
+    """
+    Orders in one SQLite file (WAL mode) shared by every API worker on the
+    host, so an order placed through one worker can be read, listed and
+    updated through any other. Same interface as OrderStore; records are
+    read back on every call, never cached per process.
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._db: Optional[sqlite3.Connection] = None
+        self._pid = None
+        self._lock = threading.RLock()
+
+    # --- Connection (one per process, opened lazily so forked workers never share it) ---
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is not None and self._pid == os.getpid():
+            return self._db
+        with self._lock:
+            if self._db is None or self._pid != os.getpid():
+                db = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False,
+                                     isolation_level=None)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA synchronous=NORMAL")
+                db.execute("CREATE TABLE IF NOT EXISTS orders ("
+                           " order_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, status TEXT NOT NULL,"
+                           " created_at REAL NOT NULL, updated_at REAL NOT NULL, items TEXT NOT NULL,"
+                           " total_price REAL NOT NULL, reservation_id TEXT)")
+                db.execute("CREATE INDEX IF NOT EXISTS orders_user ON orders (user_id, created_at, order_id)")
+                self._db, self._pid = db, os.getpid()
+        return self._db
+
+    _COLUMNS = "order_id, user_id, status, created_at, updated_at, items, total_price, reservation_id"
+
+    @staticmethod
+    def _record(row) -> OrderRecord:
+        order_id, user_id, status, created_at, updated_at, items, total_price, reservation_id = row
+        return OrderRecord(order_id, user_id, [tuple(item) for item in json.loads(items)], status, created_at,
+                           reservation_id, total_price, updated_at)
+
+    def _read(self, sql: str, params: Tuple = ()) -> List[tuple]:
+        db = self._connect()
+        with self._lock:
+            return db.execute(sql, params).fetchall()
+
+    # --- API ---
+
+    def add(self, record: OrderRecord):
+        self.add_many([record])
+
+    def add_many(self, records: List[OrderRecord]):
+        rows = [(r.order_id, r.user_id, r.status, r.created_at, r.updated_at,
+                 json.dumps([[b, q, p] for b, q, p in zip(r.book_ids, r.quantities, r.prices)], separators=(',', ':')),
+                 r.total_price, r.reservation_id) for r in records]
+        db = self._connect()
+        with self._lock:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.executemany(f"INSERT OR REPLACE INTO orders ({self._COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                               rows)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def get(self, order_id: str) -> Optional[OrderRecord]:
+        rows = self._read(f"SELECT {self._COLUMNS} FROM orders WHERE order_id = ?", (order_id,))
+        return self._record(rows[0]) if rows else None
+
+    def set_status(self, order_id: str, status: str) -> Optional[OrderRecord]:
+        db = self._connect()
+        with self._lock:
+            updated = db.execute("UPDATE orders SET status = ?, updated_at = ? WHERE order_id = ?",
+                                 (status, time.time(), order_id)).rowcount
+        return self.get(order_id) if updated else None
+
+    def maintain(self) -> int:
+        return 0  # Nothing is held in memory.
+
+    def list_for_user(self, user_id: str, limit: int = 20,
+                      cursor: Optional[str] = None) -> Tuple[List[OrderRecord], Optional[str]]:
+        """Returns the user's orders newest first and a cursor for the next page (None on the last one)."""
+        before = decode_order_cursor(cursor) if cursor else None
+        sql = f"SELECT {self._COLUMNS} FROM orders WHERE user_id = ?"
+        params: List[Any] = [user_id]
+        if before is not None:
+            sql += " AND (created_at < ? OR (created_at = ? AND order_id < ?))"
+            params += [before[0], before[0], before[1]]
+        rows = self._read(sql + " ORDER BY created_at DESC, order_id DESC LIMIT ?", tuple(params + [limit + 1]))
+        page = [self._record(row) for row in rows[:limit]]
+        next_cursor = encode_order_cursor(page[-1].created_at, page[-1].order_id) if len(rows) > limit else None
+        return page, next_cursor
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_memory": 0, "archived": 0, "stored": self._read("SELECT COUNT(*) FROM orders")[0][0]}
+
+    def close(self):
+        with self._lock:
+            if self._db is not None and self._pid == os.getpid():
+                self._db.close()
+            self._db = None
@@ -0,0 +1,157 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from instrumentation import get_logger, timed
+from publisher import MessageRefused, OrderPublisher, PublishError
+
+log = get_logger('OUTBOX')
+
+
+class OrderOutbox:
+    """
+    Durable local outbox for order messages. ``append`` writes the message to a
+    SQLite table in WAL mode and returns right away; a background flusher drains
+    the table to RabbitMQ in batches and only deletes rows the broker confirmed.
+    A message the broker refuses ``max_attempts`` times is moved to the
+    ``outbox_dead_letters`` table so the messages behind it can drain.
+    """
+
+    def __init__(self, path: str, publisher: OrderPublisher, batch_size: int = 100,
+                 idle_interval: float = 1.0, retry_initial: float = 0.5, retry_max: float = 30.0,
+                 max_attempts: int = 5):
+        self.path = path
+        self.publisher = publisher
+        self.batch_size = max(1, batch_size)
+        self.max_attempts = max(1, max_attempts)
+        self.idle_interval = idle_interval
+        self.retry_initial = retry_initial
+        self.retry_max = retry_max
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # Decision: NORMAL keeps committed rows across process crashes; FULL would add an fsync per order.
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " payload TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox_dead_letters ("
+            " id INTEGER PRIMARY KEY,"
+            " payload TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " attempts INTEGER NOT NULL,"
+            " failed_at REAL NOT NULL,"
+            " error TEXT NOT NULL)"
+        )
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def append(self, message: Dict[str, Any]):
+        """Durably stores one message for publishing. Raises sqlite3.Error on failure."""
+        self.append_many([message])
+
+    def append_many(self, messages: List[Dict[str, Any]]):
+        """Stores several messages in one transaction (all or nothing)."""
+        now = time.time()
+        rows = [(json.dumps(message), now) for message in messages]
+        with self._db_lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.executemany("INSERT INTO outbox (payload, created_at) VALUES (?, ?)", rows)
+        self._wake.set()
+
+    def pending_count(self) -> int:
+        with self._db_lock:
+            return self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def dead_letter_count(self) -> int:
+        with self._db_lock:
+            return self._db.execute("SELECT COUNT(*) FROM outbox_dead_letters").fetchone()[0]
+
+    def _next_batch(self) -> List[Tuple[int, str]]:
+        with self._db_lock:
+            return self._db.execute(
+                "SELECT id, payload FROM outbox ORDER BY id LIMIT ?", (self.batch_size,)
+            ).fetchall()
+
+    def flush_once(self) -> Tuple[int, bool]:
+        """
+        Publishes the oldest batch. Returns (number published, whether the whole
+        batch was confirmed). Confirmed rows are deleted; the rest stay for a retry.
+        Only refusals by the broker count as attempts of the refused message;
+        an unreachable broker does not.
+        """
+        batch = self._next_batch()
+        if not batch:
+            return 0, True
+        messages = [json.loads(payload) for _, payload in batch]
+        refused: Optional[MessageRefused] = None
+        try:
+            with timed('outbox', 'publish_batch'):
+                published = self.publisher.publish_batch(messages)
+        except MessageRefused as e:
+            refused, published = e, e.published
+        except PublishError as e:
+            log.warning("Publish failed: %s", e)
+            published = 0
+        with self._db_lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                if published:
+                    self._db.execute("DELETE FROM outbox WHERE id <= ?", (batch[published - 1][0],))
+                if refused is not None:
+                    self._record_refusal(batch[published][0], str(refused))
+        return published, published == len(batch)
+
+    def _record_refusal(self, row_id: int, error: str):
+        """Counts a refusal of one row; at ``max_attempts`` the row is dead-lettered. Runs inside flush_once's transaction."""
+        self._db.execute("UPDATE outbox SET attempts = attempts + 1 WHERE id = ?", (row_id,))
+        attempts = self._db.execute("SELECT attempts FROM outbox WHERE id = ?", (row_id,)).fetchone()[0]
+        if attempts < self.max_attempts:
+            return
+        self._db.execute(
+            "INSERT INTO outbox_dead_letters (id, payload, created_at, attempts, failed_at, error)"
+            " SELECT id, payload, created_at, attempts, ?, ? FROM outbox WHERE id = ?", (time.time(), error, row_id))
+        self._db.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+        log.error("Outbox message %s refused %s times; moved to outbox_dead_letters: %s", row_id, attempts, error)
+
+    def _run(self):
+        delay = self.retry_initial
+        while not self._stopped.is_set():
+            self._wake.clear()
+            try:
+                published, complete = self.flush_once()
+            except Exception as e:
+                log.error("Unexpected error while flushing: %s", e)
+                published, complete = 0, False
+            if not complete:
+                # Decision: Back off exponentially while the broker is down or refusing messages.
+                self._stopped.wait(delay)
+                delay = min(delay * 2, self.retry_max)
+                continue
+            delay = self.retry_initial
+            if published < self.batch_size:
+                self._wake.wait(self.idle_interval)
+
+    def start(self):
+        """Starts the background flusher thread (idempotent)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='order-outbox-flusher', daemon=True)
+        self._thread.start()
+        log.info("Flusher started (%s message(s) pending in %s).", self.pending_count(), self.path)
+
+    def stop(self, timeout: float = 5.0):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
@@ -0,0 +1,211 @@
+import json
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+import pika
+
+from instrumentation import get_logger
+
+log = get_logger('PUBLISHER')
+
+ORDER_QUEUE_NAME = 'order_processing_queue'
+
+# Errors that mean the connection/channel is unusable and should be replaced.
+CONNECTION_ERRORS = (
+    pika.exceptions.AMQPConnectionError,
+    pika.exceptions.AMQPChannelError,
+    pika.exceptions.StreamLostError,
+    ConnectionError,
+    OSError,
+)
+
+
+class PublishError(Exception):
+    """Raised when a message could not be confirmed by the broker."""
+
+
+class MessageRefused(PublishError):
+    """The broker answered but refused a message (unroutable or nacked); ``published`` messages before it were confirmed."""
+
+    def __init__(self, message: str, published: int):
+        super().__init__(message)
+        self.published = published
+
+
+class _PooledChannel:
+    """A connection plus its single confirm-mode channel (pika channels are not thread-safe)."""
+
+    __slots__ = ('connection', 'channel')
+
+    def __init__(self, connection, channel):
+        self.connection = connection
+        self.channel = channel
+
+    @property
+    def is_open(self) -> bool:
+        return bool(self.connection.is_open and self.channel.is_open)
+
+    def close(self):
+        try:
+            if self.connection.is_open:
+                self.connection.close()
+        except Exception:
+            pass
+
+
+class OrderPublisher:
+    """
+    Long-lived RabbitMQ publisher. Keeps a small pool of open connections, each
+    with one channel in publisher-confirm mode that declares the queue when it
+    opens, and replaces broken connections transparently (e.g. after a broker
+    restart). A queue deleted under a live connection is re-declared once the
+    broker reports a message unroutable.
+    """
+
+    def __init__(self, url: Optional[str], queue_name: str = ORDER_QUEUE_NAME, pool_size: int = 2,
+                 connection_factory: Optional[Callable[[], Any]] = None, checkout_timeout: float = 5.0,
+                 max_attempts: int = 2):
+        self.url = url
+        self.queue_name = queue_name
+        self.pool_size = max(1, pool_size)
+        self.checkout_timeout = checkout_timeout
+        self.max_attempts = max(1, max_attempts)
+        self._connection_factory = connection_factory or self._default_connection_factory
+        self._idle = deque()
+        self._idle_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        self._closed = False
+
+    def _default_connection_factory(self):
+        if not self.url:
+            raise PublishError("RABBITMQ_URL is None or empty; cannot connect to RabbitMQ.")
+        return pika.BlockingConnection(pika.URLParameters(self.url))
+
+    def _open(self) -> _PooledChannel:
+        connection = self._connection_factory()
+        try:
+            channel = connection.channel()
+            channel.confirm_delivery()
+            # Decision: Declare on every new connection; a broker that restarted empty or lost the queue needs it again.
+            channel.queue_declare(queue=self.queue_name, durable=True)
+            return _PooledChannel(connection, channel)
+        except Exception:
+            try:
+                connection.close()
+            except Exception:
+                pass
+            raise
+
+    def _checkout(self) -> _PooledChannel:
+        if self._closed:
+            raise PublishError("Publisher is closed.")
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise PublishError("Timed out waiting for a free RabbitMQ channel.")
+        try:
+            while True:
+                with self._idle_lock:
+                    pooled = self._idle.pop() if self._idle else None
+                if pooled is None:
+                    return self._open()
+                try:
+                    # Services heartbeats on idle connections and surfaces dropped sockets early.
+                    pooled.connection.process_data_events(time_limit=0)
+                except CONNECTION_ERRORS:
+                    pooled.close()
+                    continue
+                if pooled.is_open:
+                    return pooled
+                pooled.close()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _checkin(self, pooled: _PooledChannel, broken: bool = False):
+        try:
+            if broken or self._closed or not pooled.is_open:
+                pooled.close()
+            else:
+                with self._idle_lock:
+                    self._idle.append(pooled)
+        finally:
+            self._slots.release()
+
+    def start(self) -> bool:
+        """Opens the first connection and declares the queue. Safe to call when the broker is down."""
+        try:
+            pooled = self._checkout()
+        except Exception as e:
+            log.warning("Could not connect to RabbitMQ at startup: %s. Will retry on first publish.", e)
+            return False
+        self._checkin(pooled)
+        log.info("Connected to RabbitMQ; queue '%s' declared.", self.queue_name)
+        return True
+
+    def publish_batch(self, messages: List[Dict[str, Any]]) -> int:
+        """
+        Publishes messages in order on one channel and returns how many were
+        confirmed by the broker (always a prefix of ``messages``). Raises
+        MessageRefused when the broker refuses one, since retrying it as is
+        will not help.
+        """
+        published = 0
+        attempt = 0
+        redeclared = False
+        while published < len(messages) and attempt < self.max_attempts:
+            attempt += 1
+            try:
+                pooled = self._checkout()
+            except PublishError:
+                raise
+            except Exception as e:
+                log.warning("Error connecting to RabbitMQ: %s", e)
+                continue
+            broken = False
+            try:
+                for message in messages[published:]:
+                    pooled.channel.basic_publish(
+                        exchange='',
+                        routing_key=self.queue_name,
+                        body=json.dumps(message),
+                        properties=pika.BasicProperties(delivery_mode=2),  # Make message persistent
+                        mandatory=True
+                    )
+                    published += 1
+            except pika.exceptions.UnroutableError as e:
+                if redeclared:
+                    log.warning("Broker did not confirm message: %s", e)
+                    raise MessageRefused(f"Broker refused message {published + 1} of {len(messages)}: {e!r}",
+                                         published)
+                # The queue was deleted under this connection; declare it again and retry the message.
+                redeclared = True
+                log.warning("Queue '%s' is gone; re-declaring it.", self.queue_name)
+                try:
+                    pooled.channel.queue_declare(queue=self.queue_name, durable=True)
+                except CONNECTION_ERRORS:
+                    broken = True
+            except pika.exceptions.NackError as e:
+                # The broker answered but refused the message; reconnecting will not help.
+                log.warning("Broker did not confirm message: %s", e)
+                raise MessageRefused(f"Broker refused message {published + 1} of {len(messages)}: {e!r}", published)
+            except CONNECTION_ERRORS as e:
+                broken = True
+                log.warning("Connection lost while publishing (%s); reconnecting.", e)
+            finally:
+                self._checkin(pooled, broken=broken)
+        return published
+
+    def publish(self, message: Dict[str, Any]) -> bool:
+        """Publishes one message and waits for the broker confirm."""
+        try:
+            return self.publish_batch([message]) == 1
+        except PublishError as e:
+            log.warning("%s", e)
+            return False
+
+    def close(self):
+        self._closed = True
+        with self._idle_lock:
+            idle, self._idle = list(self._idle), deque()
+        for pooled in idle:
+            pooled.close()
@@ -0,0 +1,278 @@
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, MutableMapping, Optional, Tuple
+
+
+class ReservationError(Exception):
+    """Base class for reservation failures."""
+
+
+class InsufficientStock(ReservationError):
+    """Raised when one line item cannot be covered; nothing of the order is reserved."""
+
+    def __init__(self, book_id: int, requested: int, available: int):
+        super().__init__(f"Not enough stock for book {book_id}: requested {requested}, available {available}")
+        self.book_id = book_id
+        self.requested = requested
+        self.available = available
+
+
+class IdempotencyConflict(ReservationError):
+    """Raised when an idempotency key is reused for a different set of items."""
+
+
+class UnknownReservation(ReservationError):
+    """Raised when committing or releasing a reservation that is not held (expired, released or unknown)."""
+
+
+class Reservation:
+    __slots__ = ('reservation_id', 'items', 'expires_at', 'status', 'idempotency_key', 'reference', 'finished_at')
+
+    def __init__(self, reservation_id: str, items: Dict[int, int], expires_at: float,
+                 idempotency_key: Optional[str], reference: Any):
+        self.reservation_id = reservation_id
+        self.items = items
+        self.expires_at = expires_at
+        self.status = 'held'  # held -> committed | released | expired
+        self.idempotency_key = idempotency_key
+        self.reference = reference  # caller's handle, e.g. the order id
+        self.finished_at: Optional[float] = None
+
+
+def merge_items(items: Iterable[Tuple[int, int]]) -> Dict[int, int]:
+    """Sums (book_id, quantity) pairs so each book is checked and locked once."""
+    merged: Dict[int, int] = {}
+    for book_id, quantity in items:
+        merged[book_id] = merged.get(book_id, 0) + quantity
+    return merged
+
+
+class ReservationEngine:
+    """
+    All-or-nothing stock reservations over a ``{book_id: available}`` mapping,
+    which is updated in place. Each book maps to one of ``stripes`` locks; an
+    order locks only the stripes of its own books (in index order, so orders
+    never deadlock), so orders for different books do not serialize.
+
+    A reservation is held until ``commit`` (stock stays taken) or ``release``
+    (stock goes back); held reservations older than ``ttl_seconds`` expire and
+    are released on the next reserve or ``expire_due``. A repeated
+    ``idempotency_key`` returns the original reservation instead of reserving
+    again; finished reservations and their keys are kept ``retain_seconds``.
+    """
+
+    # Reservations live in this process only; whoever reserved must also commit.
+    shared = False
+
+    def __init__(self, stock: MutableMapping[int, int], stripes: int = 64, ttl_seconds: float = 900.0,
+                 retain_seconds: float = 86400.0, clock: Callable[[], float] = time.monotonic):
+        self.stock = stock
+        self.ttl_seconds = ttl_seconds
+        self.retain_seconds = retain_seconds
+        self.clock = clock
+        self._stripes = [threading.Lock() for _ in range(max(1, stripes))]
+        self._reservations: Dict[str, Reservation] = {}
+        self._by_key: Dict[str, str] = {}
+        self._expiry_heap: List[Tuple[float, int, str]] = []
+        self._finished: List[Tuple[float, int, str]] = []
+        self._sequence = itertools.count()
+        self._meta_lock = threading.Lock()  # guards the dicts/heaps above, never held while waiting on a stripe
+        self.reserved = 0
+        self.committed = 0
+        self.released = 0
+        self.expired = 0
+        self.rejected = 0
+        self.replayed = 0
+
+    def _stripe_indexes(self, book_ids: Iterable[int], key: Optional[str]) -> List[int]:
+        count = len(self._stripes)
+        indexes = {hash(book_id) % count for book_id in book_ids}
+        if key is not None:
+            indexes.add(hash(key) % count)  # serializes retries of the same key
+        return sorted(indexes)
+
+    @contextmanager
+    def _locked(self, indexes: List[int]):
+        for index in indexes:
+            self._stripes[index].acquire()
+        try:
+            yield
+        finally:
+            for index in reversed(indexes):
+                self._stripes[index].release()
+
+    def available(self, book_id: int) -> int:
+        return self.stock.get(book_id, 0)
+
+    def get(self, reservation_id: str) -> Optional[Reservation]:
+        return self._reservations.get(reservation_id)
+
+    def reserve(self, items: Iterable[Tuple[int, int]], idempotency_key: Optional[str] = None,
+                reference: Any = None, ttl_seconds: Optional[float] = None) -> Tuple[Reservation, bool]:
+        """
+        Reserves every (book_id, quantity) or nothing. Returns (reservation,
+        created); ``created`` is False when ``idempotency_key`` matched an
+        earlier reservation. Raises InsufficientStock or IdempotencyConflict.
+        """
+        wanted = merge_items(items)
+        self.expire_due()
+        with self._locked(self._stripe_indexes(wanted, idempotency_key)):
+            if idempotency_key is not None:
+                with self._meta_lock:
+                    existing_id = self._by_key.get(idempotency_key)
+                    existing = self._reservations.get(existing_id) if existing_id else None
+                if existing is not None:
+                    if existing.items != wanted:
+                        raise IdempotencyConflict(f"Idempotency key {idempotency_key!r} was used for different items.")
+                    self.replayed += 1
+                    return existing, False
+            for book_id, quantity in wanted.items():
+                available = self.stock.get(book_id, 0)
+                if available < quantity:
+                    self.rejected += 1
+                    raise InsufficientStock(book_id, quantity, available)
+            for book_id, quantity in wanted.items():
+                self.stock[book_id] = self.stock.get(book_id, 0) - quantity
+            now = self.clock()
+            reservation = Reservation(uuid.uuid4().hex, wanted,
+                                      now + (self.ttl_seconds if ttl_seconds is None else ttl_seconds),
+                                      idempotency_key, reference)
+            with self._meta_lock:
+                self._reservations[reservation.reservation_id] = reservation
+                if idempotency_key is not None:
+                    self._by_key[idempotency_key] = reservation.reservation_id
+                heapq.heappush(self._expiry_heap, (reservation.expires_at, next(self._sequence),
+                                                   reservation.reservation_id))
+                self.reserved += 1
+        return reservation, True
+
+    def reserve_many(self, requests: List[Tuple[Iterable[Tuple[int, int]], Optional[str], Any]]) -> List[Any]:
+        """
+        Reserves several orders, each all or nothing. ``requests`` are (items,
+        idempotency_key, reference); returns per order either
+        (reservation, created) or the ReservationError it failed with.
+        """
+        results = []
+        for items, key, reference in requests:
+            try:
+                results.append(self.reserve(items, idempotency_key=key, reference=reference))
+            except ReservationError as e:
+                results.append(e)
+        return results
+
+    def _finish(self, reservation_id: str, status: str, give_back: bool) -> Reservation:
+        reservation = self._reservations.get(reservation_id)
+        if reservation is None:
+            raise UnknownReservation(f"Unknown reservation {reservation_id!r}.")
+        with self._locked(self._stripe_indexes(reservation.items, None)):
+            if reservation.status != 'held':
+                raise UnknownReservation(f"Reservation {reservation_id!r} is already {reservation.status}.")
+            if give_back:
+                for book_id, quantity in reservation.items.items():
+                    self.stock[book_id] = self.stock.get(book_id, 0) + quantity
+            reservation.status = status
+            reservation.finished_at = self.clock()
+            with self._meta_lock:
+                heapq.heappush(self._finished, (reservation.finished_at + self.retain_seconds,
+                                                next(self._sequence), reservation_id))
+        return reservation
+
+    def commit(self, reservation_id: str) -> Reservation:
+        """Makes a held reservation permanent: its stock is consumed."""
+        reservation = self._finish(reservation_id, 'committed', give_back=False)
+        self.committed += 1
+        return reservation
+
+    def release(self, reservation_id: str) -> Reservation:
+        """Cancels a held reservation and returns its stock."""
+        reservation = self._finish(reservation_id, 'released', give_back=True)
+        self.released += 1
+        return reservation
+
+    def release_many(self, reservation_ids: List[str]):
+        for reservation_id in reservation_ids:
+            try:
+                self.release(reservation_id)
+            except UnknownReservation:
+                pass
+
+    def forget_key(self, idempotency_key: str, reservation_id: str) -> bool:
+        """
+        Drops ``idempotency_key`` if it still belongs to ``reservation_id`` and
+        that reservation was released or expired, so the key can reserve
+        again. Returns whether the key was dropped.
+        """
+        with self._locked(self._stripe_indexes((), idempotency_key)):
+            with self._meta_lock:
+                reservation = self._reservations.get(reservation_id)
+                if (reservation is None or reservation.status not in ('released', 'expired')
+                        or self._by_key.get(idempotency_key) != reservation_id):
+                    return False
+                del self._by_key[idempotency_key]
+                reservation.idempotency_key = None
+                return True
+
+    def expire_due(self) -> int:
+        """Releases held reservations past their expiry and forgets old finished ones; returns how many expired."""
+        now = self.clock()
+        due = []
+        with self._meta_lock:
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                due.append(heapq.heappop(self._expiry_heap)[2])
+            while self._finished and self._finished[0][0] <= now:
+                reservation = self._reservations.pop(heapq.heappop(self._finished)[2], None)
+                if reservation is not None and self._by_key.get(reservation.idempotency_key) == reservation.reservation_id:
+                    del self._by_key[reservation.idempotency_key]
+        expired = 0
+        for reservation_id in due:
+            try:
+                self._finish(reservation_id, 'expired', give_back=True)
+                expired += 1
+            except UnknownReservation:
+                pass  # committed or released before it expired
+        self.expired += expired
+        return expired
+
+    def commit_orders(self, orders: List[Dict[str, Any]]) -> List[bool]:
+        """
+        Consumer-side settlement with the same contract as
+        InventoryStore.commit_orders: held reservations are committed, already
+        committed ones succeed, and orders without a reservation known here
+        take their units directly if available.
+        """
+        results = []
+        for order_data in orders:
+            reservation = self._reservations.get(order_data.get('reservation_id') or '')
+            if reservation is not None and reservation.status in ('committed', 'released'):
+                results.append(reservation.status == 'committed')
+                continue
+            if reservation is not None and reservation.status == 'held':
+                try:
+                    self.commit(reservation.reservation_id)
+                    results.append(True)
+                    continue
+                except UnknownReservation:
+                    pass  # expired meanwhile; fall through to a direct take
+            items = merge_items((int(item['book_id']), int(item['quantity'])) for item in order_data['items'])
+            try:
+                taken, _ = self.reserve(items.items())
+                self.commit(taken.reservation_id)
+                results.append(True)
+            except InsufficientStock:
+                results.append(False)
+        return results
+
+    def restock(self, book_id: int, quantity: int):
+        with self._locked(self._stripe_indexes([book_id], None)):
+            self.stock[book_id] = self.stock.get(book_id, 0) + quantity
+
+    def stats(self) -> Dict[str, Any]:
+        with self._meta_lock:
+            held = sum(1 for reservation in self._reservations.values() if reservation.status == 'held')
+        return {"held": held, "reserved": self.reserved, "committed": self.committed, "released": self.released,
+                "expired": self.expired, "rejected": self.rejected, "replayed": self.replayed,
+                "stripes": len(self._stripes)}
@@ -0,0 +1,286 @@
+"""
+Production entry point: N eventlet API workers behind one port.
+
+    SERVE_WORKERS=8 SERVE_PORT=5000 python serve.py
+
+The master process only accepts connections. Each one is handed to a worker
+chosen by the client's IP address (so SocketIO polling requests keep reaching
+the worker holding their session) over a Unix socket (SCM_RIGHTS); the worker
+serves it with eventlet like ``app.py`` does. Workers import the app after
+the fork and share state through SQLite files on this host (catalog,
+inventory, orders); SocketIO emits are relayed between workers. A worker that
+exits is restarted with the same index.
+"""
+import errno
+import os
+import selectors
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+import zlib
+from typing import Callable, List, Optional, Tuple
+
+from instrumentation import flush_logs, get_logger
+
+log = get_logger('SERVE')
+
+SERVE_HOST = os.environ.get('SERVE_HOST', '0.0.0.0')
+SERVE_PORT = int(os.environ.get('SERVE_PORT', '5000'))
+SERVE_WORKERS = int(os.environ.get('SERVE_WORKERS', str(os.cpu_count() or 1)))
+SERVE_BACKLOG = int(os.environ.get('SERVE_BACKLOG', '1024'))
+# Seconds workers get to finish in-flight requests on shutdown before they are killed.
+SERVE_GRACEFUL_TIMEOUT = float(os.environ.get('SERVE_GRACEFUL_TIMEOUT', '10'))
+# A worker that keeps dying is restarted at most this often.
+SERVE_RESTART_INTERVAL = float(os.environ.get('SERVE_RESTART_INTERVAL', '1'))
+
+
+def configure_shared_state() -> str:
+    """
+    Points every store at a host-wide SQLite file (unless configured already)
+    and returns the directory for the SocketIO relay sockets. Must run before
+    the workers import the app.
+    """
+    if os.environ.get('INVENTORY_DB_PATH') == '':
+        raise SystemExit("serve.py needs the shared inventory; do not set INVENTORY_DB_PATH to an empty string.")
+    os.environ.setdefault('CATALOG_DB_PATH', 'catalog.db')
+    os.environ.setdefault('ORDER_DB_PATH', 'orders.db')
+    # Decision: Workers compete on one status queue; whichever gets an event emits it and the relay fans it out.
+    os.environ.setdefault('STATUS_EVENTS_QUEUE', 'order_status_events.api')
+    relay_dir = tempfile.mkdtemp(prefix='library-relay-')
+    os.environ['SOCKETIO_RELAY_DIR'] = relay_dir
+    return relay_dir
+
+
+def worker_outbox_path(index: int) -> str:
+    """Each worker flushes its own outbox file (order_outbox.<index>.db); a restarted worker drains its predecessor's."""
+    root, ext = os.path.splitext(os.environ.get('ORDER_OUTBOX_PATH', 'order_outbox.db'))
+    return f"{root}.{index}{ext or '.db'}"
+
+
+class HandoffListener:
+    """
+    Stands in for a listening socket in ``eventlet.wsgi.server``: ``accept``
+    waits (cooperatively) for the next connection the master hands over.
+    When the master closes the channel, ``accept`` raises ESHUTDOWN and the
+    server stops after finishing its in-flight requests.
+    """
+
+    def __init__(self, channel: socket.socket, address, family: int):
+        self.channel = channel
+        self.channel.setblocking(False)
+        self.family = family
+        self._address = address
+
+    def getsockname(self):
+        return self._address
+
+    def accept(self):
+        from eventlet.greenio import GreenSocket
+        from eventlet.hubs import trampoline
+
+        while True:
+            try:
+                _, fds, _, _ = socket.recv_fds(self.channel, 1, 1)
+            except BlockingIOError:
+                trampoline(self.channel, read=True)
+                continue
+            if not fds:
+                raise OSError(errno.ESHUTDOWN, "The master closed the hand-off channel.")
+            connection = socket.socket(fileno=fds[0])
+            try:
+                address = connection.getpeername()
+            except OSError:
+                connection.close()  # The client went away while it was being handed over.
+                continue
+            return GreenSocket(connection), address
+
+    def close(self):
+        self.channel.close()
+
+
+def run_worker(index: int, channel: socket.socket, address, family: int,
+               worker_init: Optional[Callable[[int], None]] = None):
+    """Body of a worker process: imports the app, starts its background services and serves handed-over connections."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C reaches the whole group; the master coordinates shutdown.
+    os.environ['ORDER_OUTBOX_PATH'] = worker_outbox_path(index)
+    os.environ['SERVE_WORKER_ID'] = str(index)
+    if worker_init is not None:
+        worker_init(index)
+    import eventlet.wsgi
+    import app as api
+
+    api.start_background_services()
+    log.info("Worker %s (pid %s) serving.", index, os.getpid())
+    eventlet.wsgi.server(HandoffListener(channel, address, family), api.app, log_output=False)
+    api.status_relay.stop()
+    api.order_outbox.stop()
+
+
+class Worker:
+    __slots__ = ('index', 'pid', 'channel', 'started_at')
+
+    def __init__(self, index: int, pid: int, channel: socket.socket):
+        self.index = index
+        self.pid = pid
+        self.channel = channel
+        self.started_at = time.monotonic()
+
+
+class Master:
+    """Accepts connections, routes each client IP to the same live worker, and keeps N workers running."""
+
+    def __init__(self, host: str = SERVE_HOST, port: int = SERVE_PORT, workers: int = SERVE_WORKERS,
+                 worker_init: Optional[Callable[[int], None]] = None):
+        self.workers_wanted = max(1, workers)
+        self.worker_init = worker_init
+        self.listener = socket.create_server((host, port), backlog=SERVE_BACKLOG, reuse_port=False)
+        self.listener.setblocking(False)
+        self.address = self.listener.getsockname()
+        self.family = self.listener.family
+        self.workers: List[Optional[Worker]] = [None] * self.workers_wanted
+        self._last_spawn = [0.0] * self.workers_wanted
+        self._stopping = False
+        self.handed_off = 0
+        self.dropped = 0
+
+    # --- Workers ---
+
+    def _spawn(self, index: int):
+        parent_end, child_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self._last_spawn[index] = time.monotonic()
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                self.listener.close()
+                parent_end.close()
+                for worker in self.workers:
+                    if worker is not None:
+                        worker.channel.close()
+                run_worker(index, child_end, self.address, self.family, self.worker_init)
+                status = 0
+            except BaseException as e:
+                log.error("Worker %s failed: %r", index, e)
+            finally:
+                flush_logs()
+                os._exit(status)
+        child_end.close()
+        parent_end.setblocking(False)
+        self.workers[index] = Worker(index, pid, parent_end)
+
+    def _reap(self):
+        """Collects exited workers and restarts them (at most once per SERVE_RESTART_INTERVAL each)."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            for index, worker in enumerate(self.workers):
+                if worker is not None and worker.pid == pid:
+                    worker.channel.close()
+                    self.workers[index] = None
+                    if not self._stopping:
+                        log.warning("Worker %s (pid %s) exited with status %s.", index, pid, status)
+        if self._stopping:
+            return
+        now = time.monotonic()
+        for index, worker in enumerate(self.workers):
+            if worker is None and now - self._last_spawn[index] >= SERVE_RESTART_INTERVAL:
+                self._spawn(index)
+
+    # --- Connections ---
+
+    def _route(self, client_ip: str) -> List[Worker]:
+        """Live workers in the order to try: the client's own worker first (sticky by IP), then the rest."""
+        start = zlib.crc32(client_ip.encode('utf-8')) % self.workers_wanted
+        ordered = self.workers[start:] + self.workers[:start]
+        return [worker for worker in ordered if worker is not None]
+
+    def _hand_off(self, connection: socket.socket, address: Tuple):
+        try:
+            for worker in self._route(address[0]):
+                try:
+                    socket.send_fds(worker.channel, [b'c'], [connection.fileno()])
+                    self.handed_off += 1
+                    return
+                except (BlockingIOError, BrokenPipeError, ConnectionResetError):
+                    continue  # That worker is saturated or exiting; the next one takes the client.
+            self.dropped += 1
+            log.warning("No worker could take a connection from %s; closing it.", address[0])
+        finally:
+            connection.close()  # The worker holds its own duplicate of the descriptor.
+
+    def _accept_ready(self):
+        while True:
+            try:
+                connection, address = self.listener.accept()
+            except BlockingIOError:
+                return
+            except OSError as e:
+                if e.errno in (errno.EMFILE, errno.ENFILE):
+                    log.error("Out of file descriptors; pausing accept.")
+                    time.sleep(0.1)
+                    return
+                raise
+            self._hand_off(connection, address)
+
+    # --- Lifecycle ---
+
+    def _request_stop(self, signum, frame):
+        self._stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        for index in range(self.workers_wanted):
+            self._spawn(index)
+        host, port = self.address[:2]
+        log.info("Serving on %s:%s with %s worker(s).", host, port, self.workers_wanted)
+        selector = selectors.DefaultSelector()
+        selector.register(self.listener, selectors.EVENT_READ)
+        try:
+            while not self._stopping:
+                if selector.select(timeout=1.0):
+                    self._accept_ready()
+                self._reap()
+        finally:
+            selector.close()
+            self.shutdown()
+
+    def shutdown(self):
+        """Stops accepting, lets workers finish their requests, and kills whichever outlive the timeout."""
+        self._stopping = True
+        self.listener.close()
+        for worker in self.workers:
+            if worker is not None:
+                worker.channel.close()  # The worker's accept sees end-of-channel and drains.
+        deadline = time.monotonic() + SERVE_GRACEFUL_TIMEOUT
+        while any(self.workers) and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.05)
+        for worker in self.workers:
+            if worker is not None:
+                log.warning("Worker %s did not stop in %ss; killing it.", worker.index, SERVE_GRACEFUL_TIMEOUT)
+                os.kill(worker.pid, signal.SIGKILL)
+                os.waitpid(worker.pid, 0)
+        log.info("Stopped (%s connection(s) handed off, %s dropped).", self.handed_off, self.dropped)
+
+
+def main(worker_init: Optional[Callable[[int], None]] = None, host: str = SERVE_HOST, port: int = SERVE_PORT,
+         workers: int = SERVE_WORKERS):
+    relay_dir = configure_shared_state()
+    try:
+        Master(host, port, workers, worker_init).run()
+    finally:
+        shutil.rmtree(relay_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    if not hasattr(socket, 'send_fds') or sys.platform == 'win32':
+        raise SystemExit("serve.py needs a POSIX system with Python 3.9+ (socket.send_fds).")
+    main()
@@ -0,0 +1,271 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import pika
+
+from ai_executor import cooperative_sleep
+from instrumentation import get_logger
+from publisher import CONNECTION_ERRORS
+
+log = get_logger('STATUS')
+
+# Fanout exchange carrying order status transitions from consumers to every API process.
+STATUS_EXCHANGE = 'order_status_events'
+
+
+def order_room(order_id: str) -> str:
+    return f"order:{order_id}"
+
+
+def user_room(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+class StatusCoalescer:
+    """
+    Thread-safe buffer of the latest status event per order. Putting a newer
+    event for an order that is still buffered replaces the older one, so a
+    burst of transitions costs one delivery per order.
+    """
+
+    def __init__(self):
+        self._events: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.received = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._events)
+
+    def put(self, event: Dict[str, Any]):
+        with self._lock:
+            self.received += 1
+            if self._events.pop(event['order_id'], None) is not None:
+                self.coalesced += 1
+            self._events[event['order_id']] = event
+
+    def put_back(self, events: List[Dict[str, Any]]):
+        """Re-buffers events that could not be delivered, unless a newer event for the order arrived meanwhile."""
+        with self._lock:
+            for event in events:
+                if event['order_id'] not in self._events:
+                    self._events[event['order_id']] = event
+                    self._events.move_to_end(event['order_id'], last=False)
+
+    def drain(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            events, self._events = list(self._events.values()), OrderedDict()
+        return events
+
+
+def _connect(url: Optional[str]):
+    if not url:
+        raise ConnectionError("RABBITMQ_URL is None or empty; cannot connect to RabbitMQ.")
+    return pika.BlockingConnection(pika.URLParameters(url))
+
+
+class StatusPublisher:
+    """
+    Consumer side: buffers status transitions, coalesced per order, and a
+    background thread publishes them every ``flush_interval`` seconds as one
+    message on the ``order_status_events`` fanout exchange. Events are
+    notifications (the stores stay authoritative), so they are transient and
+    kept for a retry only while the broker is unreachable.
+    """
+
+    def __init__(self, url: Optional[str], exchange: str = STATUS_EXCHANGE, flush_interval: float = 0.1,
+                 connection_factory: Optional[Callable[[], Any]] = None, retry_max: float = 30.0):
+        self.exchange = exchange
+        self.flush_interval = flush_interval
+        self.retry_max = retry_max
+        self._connection_factory = connection_factory or (lambda: _connect(url))
+        self._buffer = StatusCoalescer()
+        self._connection = None
+        self._channel = None
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.published = 0
+
+    def publish(self, order_id: str, status: str, user_id: Optional[str] = None):
+        """Queues a status transition; returns immediately."""
+        self._buffer.put({"order_id": order_id, "status": status, "user_identifier": user_id,
+                          "updated_at": time.time()})
+
+    def _channel_open(self):
+        if self._channel is None or not self._channel.is_open:
+            self.close_connection()
+            self._connection = self._connection_factory()
+            self._channel = self._connection.channel()
+            self._channel.exchange_declare(exchange=self.exchange, exchange_type='fanout')
+        return self._channel
+
+    def flush(self) -> int:
+        """Publishes everything buffered in one message; returns how many events were sent."""
+        events = self._buffer.drain()
+        if not events:
+            return 0
+        try:
+            self._channel_open().basic_publish(exchange=self.exchange, routing_key='',
+                                               body=json.dumps({"events": events}))
+        except CONNECTION_ERRORS as e:
+            log.warning("Could not publish %s status event(s): %s", len(events), e)
+            self.close_connection()
+            self._buffer.put_back(events)
+            raise
+        self.published += len(events)
+        return len(events)
+
+    def _run(self):
+        delay = self.flush_interval
+        while not self._stopped.is_set():
+            self._wake.wait(delay)
+            self._wake.clear()
+            try:
+                self.flush()
+                delay = self.flush_interval
+            except CONNECTION_ERRORS:
+                # Decision: Back off while the broker is down; the buffer holds at most one event per order.
+                delay = min(max(delay, self.flush_interval) * 2, self.retry_max)
+            except Exception as e:
+                log.error("Unexpected error while publishing status events: %s", e)
+
+    def start(self):
+        """Starts the background publishing thread (idempotent)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='status-publisher', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stops the thread and makes a last attempt to publish what is buffered."""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+        try:
+            self.flush()
+        except CONNECTION_ERRORS:
+            pass
+        self.close_connection()
+
+    def close_connection(self):
+        try:
+            if self._connection is not None and self._connection.is_open:
+                self._connection.close()
+        except Exception:
+            pass
+        self._connection = self._channel = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"buffered": len(self._buffer), "published": self.published,
+                "coalesced": self._buffer.coalesced}
+
+
+class StatusRelay:
+    """
+    API side: a background thread consumes the status fanout through its own
+    exclusive queue (so every API process sees every event) into a
+    StatusCoalescer, and ``run_dispatcher`` (a SocketIO background task)
+    drains it every ``dispatch_interval`` seconds and hands each order's
+    latest event to ``on_event`` on the server's own green thread, where it
+    is safe to emit. With ``queue_name`` set, the workers of one server share
+    that queue instead and each event reaches only one of them (their emits
+    are relayed to the others).
+    """
+
+    def __init__(self, url: Optional[str], on_event: Callable[[Dict[str, Any]], None],
+                 exchange: str = STATUS_EXCHANGE, dispatch_interval: float = 0.1,
+                 connection_factory: Optional[Callable[[], Any]] = None, retry_max: float = 30.0,
+                 queue_name: str = ''):
+        self.exchange = exchange
+        self.queue_name = queue_name
+        self.on_event = on_event
+        self.dispatch_interval = dispatch_interval
+        self.retry_max = retry_max
+        self._connection_factory = connection_factory or (lambda: _connect(url))
+        self._buffer = StatusCoalescer()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.dispatched = 0
+
+    def _on_message(self, channel, method, properties, body):
+        try:
+            events = json.loads(body)['events']
+        except (ValueError, KeyError, TypeError):
+            log.warning("Discarding malformed status message.")
+            return
+        try:
+            for event in events:
+                if isinstance(event, dict) and event.get('order_id') and event.get('status'):
+                    self._buffer.put(event)
+        except Exception as e:
+            # One bad message must not take the consuming thread down with it.
+            log.error("Error relaying status message: %s", e)
+
+    def _consume(self):
+        delay = 0.5
+        while not self._stopped.is_set():
+            connection = None
+            try:
+                connection = self._connection_factory()
+                channel = connection.channel()
+                channel.exchange_declare(exchange=self.exchange, exchange_type='fanout')
+                if self.queue_name:
+                    queue = channel.queue_declare(queue=self.queue_name).method.queue
+                else:
+                    queue = channel.queue_declare(queue='', exclusive=True).method.queue
+                channel.queue_bind(exchange=self.exchange, queue=queue)
+                channel.basic_consume(queue=queue, on_message_callback=self._on_message, auto_ack=True)
+                log.info("Relaying order status events from exchange '%s'.", self.exchange)
+                delay = 0.5
+                while not self._stopped.is_set():
+                    connection.process_data_events(time_limit=0.5)
+            except Exception as e:
+                if isinstance(e, CONNECTION_ERRORS):
+                    log.warning("Status relay disconnected (%s); retrying in %.1fs.", e, delay)
+                else:
+                    log.error("Status relay failed (%r); reconnecting in %.1fs.", e, delay)
+                self._stopped.wait(delay)
+                delay = min(delay * 2, self.retry_max)
+            finally:
+                try:
+                    if connection is not None and connection.is_open:
+                        connection.close()
+                except Exception:
+                    pass
+
+    def dispatch_once(self) -> int:
+        events = self._buffer.drain()
+        for event in events:
+            try:
+                self.on_event(event)
+            except Exception as e:
+                log.error("Error dispatching status of order %s: %s", event.get('order_id'), e)
+        self.dispatched += len(events)
+        return len(events)
+
+    def run_dispatcher(self):
+        """Dispatch loop; run it with ``socketio.start_background_task``."""
+        while not self._stopped.is_set():
+            cooperative_sleep(self.dispatch_interval)
+            self.dispatch_once()
+
+    def start(self):
+        """Starts the consuming thread (idempotent); the dispatcher is started by the caller."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._consume, name='status-relay', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"buffered": len(self._buffer), "received": self._buffer.received,
+                "coalesced": self._buffer.coalesced, "dispatched": self.dispatched}
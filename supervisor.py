@@ -0,0 +1,256 @@
+import math
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import pika
+
+import consumer
+from instrumentation import get_logger
+
+log = get_logger('SUPERVISOR')
+
+# --- Supervisor configuration ---
+CONSUMER_MIN_WORKERS = int(os.environ.get('CONSUMER_MIN_WORKERS', '1'))
+CONSUMER_MAX_WORKERS = int(os.environ.get('CONSUMER_MAX_WORKERS', str(os.cpu_count() or 4)))
+SUPERVISOR_POLL_INTERVAL = float(os.environ.get('SUPERVISOR_POLL_INTERVAL', '5'))
+# How quickly the current backlog should be worked off, in seconds.
+SUPERVISOR_TARGET_DRAIN_SECONDS = float(os.environ.get('SUPERVISOR_TARGET_DRAIN_SECONDS', '30'))
+# Per-worker throughput assumed until the workers have reported real numbers.
+SUPERVISOR_INITIAL_WORKER_RATE = float(os.environ.get('SUPERVISOR_INITIAL_WORKER_RATE', '1'))
+
+
+class QueueDepthProbe:
+    """Reads the backlog of a queue with a passive ``queue_declare`` on its own connection."""
+
+    def __init__(self, url: Optional[str], queue_name: str = consumer.ORDER_QUEUE_NAME,
+                 connection_factory: Optional[Callable[[], Any]] = None):
+        self.queue_name = queue_name
+        self._connection_factory = connection_factory or (lambda: pika.BlockingConnection(pika.URLParameters(url)))
+        self._connection = None
+        self._channel = None
+
+    def depth(self) -> Optional[int]:
+        """Returns the number of ready messages, or None if the broker cannot be reached."""
+        try:
+            if self._channel is None or not self._channel.is_open:
+                self._connection = self._connection_factory()
+                self._channel = self._connection.channel()
+            result = self._channel.queue_declare(queue=self.queue_name, passive=True)
+            return result.method.message_count
+        except Exception as e:
+            log.warning("Could not read depth of '%s': %s", self.queue_name, e)
+            self.close()
+            return None
+
+    def close(self):
+        try:
+            if self._connection is not None and self._connection.is_open:
+                self._connection.close()
+        except Exception:
+            pass
+        self._connection = None
+        self._channel = None
+
+
+class ScalingPolicy:
+    """
+    Picks a worker count from the backlog and the measured drain rate:
+    enough workers to keep up with arrivals and clear the backlog within
+    ``target_drain_seconds``. Scales up immediately, and down only after
+    ``scale_down_after`` consecutive polls agree, one worker at a time.
+    """
+
+    def __init__(self, min_workers: int, max_workers: int, target_drain_seconds: float,
+                 initial_worker_rate: float = SUPERVISOR_INITIAL_WORKER_RATE, scale_down_after: int = 3):
+        self.min_workers = max(0, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+        self.target_drain_seconds = max(1.0, target_drain_seconds)
+        self.initial_worker_rate = initial_worker_rate
+        self.scale_down_after = max(1, scale_down_after)
+        self._below_count = 0
+
+    def desired(self, current: int, backlog: int, arrival_rate: float, worker_rate: Optional[float]) -> int:
+        rate = worker_rate if worker_rate and worker_rate > 0 else self.initial_worker_rate
+        required_rate = max(0.0, arrival_rate) + backlog / self.target_drain_seconds
+        target = min(self.max_workers, max(self.min_workers, math.ceil(required_rate / rate)))
+        if target >= current:
+            self._below_count = 0
+            return target
+        self._below_count += 1
+        if self._below_count < self.scale_down_after:
+            return current
+        self._below_count = 0
+        return current - 1
+
+
+class _WorkerHandle:
+    __slots__ = ('worker_id', 'process', 'processed', 'failed', 'last_report', 'rate', 'peak_rate',
+                 'stopping_since')
+
+    def __init__(self, worker_id: int, process):
+        self.worker_id = worker_id
+        self.process = process
+        self.processed = 0
+        self.failed = 0
+        self.last_report = time.time()
+        self.rate = 0.0
+        self.peak_rate = 0.0
+        self.stopping_since = None
+
+
+class ConsumerSupervisor:
+    """
+    Runs N consumer worker processes and resizes the pool between
+    ``min_workers`` and ``max_workers`` based on queue backlog and drain rate.
+    Workers are retired with SIGTERM, which makes them stop consuming, settle
+    in-flight messages and exit; anything still unacked is requeued by the broker.
+    """
+
+    def __init__(self, depth_probe: QueueDepthProbe, policy: ScalingPolicy,
+                 poll_interval: float = SUPERVISOR_POLL_INTERVAL,
+                 worker_target: Callable[..., None] = consumer.run_worker, stop_timeout: float = 40.0):
+        self.depth_probe = depth_probe
+        self.policy = policy
+        self.poll_interval = poll_interval
+        self.worker_target = worker_target
+        self.stop_timeout = stop_timeout
+        self._stats_queue = multiprocessing.Queue()
+        self._workers: Dict[int, _WorkerHandle] = {}
+        self._retiring: List[_WorkerHandle] = []
+        self._next_id = 1
+        self._running = False
+        self._last_backlog = None
+        self._last_poll = None
+
+    @property
+    def active_workers(self) -> List[_WorkerHandle]:
+        return list(self._workers.values())
+
+    def _spawn(self):
+        worker_id = self._next_id
+        self._next_id += 1
+        process = multiprocessing.Process(target=self.worker_target, args=(worker_id, self._stats_queue),
+                                          name=f'order-consumer-{worker_id}', daemon=False)
+        process.start()
+        self._workers[worker_id] = _WorkerHandle(worker_id, process)
+        log.info("Started worker %s (pid %s).", worker_id, process.pid)
+
+    def _retire(self, handle: _WorkerHandle):
+        self._workers.pop(handle.worker_id, None)
+        handle.stopping_since = time.monotonic()
+        if handle.process.is_alive():
+            handle.process.terminate()  # SIGTERM -> graceful drain in the worker
+        self._retiring.append(handle)
+        log.info("Retiring worker %s (pid %s).", handle.worker_id, handle.process.pid)
+
+    def _reap(self):
+        for handle in list(self._retiring):
+            if not handle.process.is_alive():
+                handle.process.join(0)
+                self._retiring.remove(handle)
+            elif time.monotonic() - handle.stopping_since > self.stop_timeout:
+                log.warning("Worker %s did not stop in time; killing it.", handle.worker_id)
+                handle.process.kill()
+        for handle in list(self._workers.values()):
+            if not handle.process.is_alive():
+                log.error("Worker %s exited unexpectedly (exit code %s).", handle.worker_id,
+                          handle.process.exitcode)
+                self._workers.pop(handle.worker_id)
+
+    def _drain_stats(self):
+        while True:
+            try:
+                worker_id, processed, failed, reported_at = self._stats_queue.get_nowait()
+            except queue.Empty:
+                return
+            handle = self._workers.get(worker_id)
+            if handle is None:
+                continue
+            elapsed = reported_at - handle.last_report
+            if elapsed > 0:
+                instant = (processed + failed - handle.processed - handle.failed) / elapsed
+                # Decision: Smooth per-worker rates so one idle interval does not collapse the estimate.
+                handle.rate = instant if handle.rate == 0 else 0.5 * handle.rate + 0.5 * instant
+                handle.peak_rate = max(handle.peak_rate, handle.rate)
+            handle.processed, handle.failed, handle.last_report = processed, failed, reported_at
+
+    def _worker_rate(self) -> Optional[float]:
+        # Decision: Use peak rates as capacity; current rates of idle workers only measure demand.
+        rates = [handle.peak_rate for handle in self._workers.values() if handle.peak_rate > 0]
+        return sum(rates) / len(rates) if rates else None
+
+    def _scale_to(self, desired: int):
+        while len(self._workers) < desired:
+            self._spawn()
+        while len(self._workers) > desired:
+            # Retire the newest worker first; older ones have warmed-up connections.
+            self._retire(self._workers[max(self._workers)])
+
+    def poll_once(self):
+        """One supervision step: collect stats, read backlog, resize the pool and report."""
+        self._reap()
+        self._drain_stats()
+        now = time.monotonic()
+        backlog = self.depth_probe.depth()
+        drain_rate = sum(handle.rate for handle in self._workers.values())
+        current = len(self._workers)
+        if backlog is None:
+            desired = max(current, self.policy.min_workers)
+        else:
+            arrival_rate = drain_rate
+            if self._last_backlog is not None and now > self._last_poll:
+                arrival_rate += (backlog - self._last_backlog) / (now - self._last_poll)
+            self._last_backlog, self._last_poll = backlog, now
+            desired = self.policy.desired(current, backlog, arrival_rate, self._worker_rate())
+        self._scale_to(desired)
+        per_worker = ', '.join(
+            f"w{handle.worker_id}={handle.rate:.2f}/s ({handle.processed} ok, {handle.failed} failed)"
+            for handle in self._workers.values()
+        )
+        log.info("backlog=%s workers=%s drain=%.2f msg/s | %s", backlog, len(self._workers), drain_rate,
+                 per_worker or 'no workers')
+
+    def stop(self, *args):
+        self._running = False
+
+    def shutdown(self):
+        """Retires every worker and waits for them to exit."""
+        for handle in list(self._workers.values()):
+            self._retire(handle)
+        while self._retiring:
+            self._reap()
+            time.sleep(0.2)
+        self.depth_probe.close()
+        log.info("All workers stopped.")
+
+    def run(self):
+        self._running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        log.info("Managing %s-%s consumer worker(s).", self.policy.min_workers, self.policy.max_workers)
+        self._scale_to(self.policy.min_workers)
+        try:
+            while self._running:
+                self.poll_once()
+                deadline = time.monotonic() + self.poll_interval
+                while self._running and time.monotonic() < deadline:
+                    time.sleep(min(0.5, self.poll_interval))
+        finally:
+            self.shutdown()
+
+
+def main():
+    log.info("Starting Consumer Supervisor...")
+    supervisor = ConsumerSupervisor(
+        QueueDepthProbe(consumer.RABBITMQ_URL),
+        ScalingPolicy(CONSUMER_MIN_WORKERS, CONSUMER_MAX_WORKERS, SUPERVISOR_TARGET_DRAIN_SECONDS)
+    )
+    supervisor.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))  # fakes.py: fake broker and model
+
+# The app reads its configuration at import time; keep every file it creates out of the working tree.
+_state_dir = tempfile.mkdtemp(prefix='library-tests-')
+os.environ.update(
+    GEMINI_API_KEY='test',
+    LOG_LEVEL='ERROR',
+    AI_WARMUP='0',
+    INVENTORY_DB_PATH=os.path.join(_state_dir, 'inventory.db'),
+    ORDER_LOG_PATH=os.path.join(_state_dir, 'orders.log'),
+    ORDER_OUTBOX_PATH=os.path.join(_state_dir, 'outbox.db'),
+)
+for name in ('RABBITMQ_URL', 'CATALOG_DB_PATH', 'ORDER_DB_PATH', 'SOCKETIO_RELAY_DIR', 'AI_CACHE_PATH'):
+    os.environ.pop(name, None)
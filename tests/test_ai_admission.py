@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+
+import ai_service
+from admission import AdmissionController
+from ai_cache import ResponseCache
+
+
+@pytest.fixture
+def service(monkeypatch):
+    """ai_service with a one-slot admission controller, a fresh cache and a scripted model call."""
+    calls = []
+    release = threading.Event()
+
+    def ask_llm(requested_title, user_query, is_cancelled=None):
+        calls.append(user_query)
+        release.wait(5)
+        # The first caller's client goes away; anyone after it gets a real (if uncacheable) answer.
+        status = 'cancelled' if len(calls) == 1 else 'timeout'
+        return {"error": status, "status": status, "title_match": requested_title}
+
+    monkeypatch.setattr(ai_service, 'ai_admission', AdmissionController(max_concurrent=1, max_queue=0))
+    monkeypatch.setattr(ai_service, 'response_cache', ResponseCache())
+    monkeypatch.setattr(ai_service, '_model_unavailable', lambda: None)
+    monkeypatch.setattr(ai_service, 'answer_from_catalog', lambda query: None)
+    monkeypatch.setattr(ai_service, 'extract_title', lambda query, titles: 'Stay With Me')
+    monkeypatch.setattr(ai_service, '_ask_llm', ask_llm)
+    return calls, release
+
+
+def ask(results):
+    results.append(ai_service.get_ai_response('Tell me about Stay With Me', ['Stay With Me'], client_id='c'))
+
+
+def test_follower_that_recomputes_goes_through_admission(service):
+    calls, release = service
+    results = []
+    leader = threading.Thread(target=ask, args=(results,))
+    leader.start()
+    while not calls:
+        time.sleep(0.001)
+    follower = threading.Thread(target=ask, args=(results,))
+    follower.start()
+    while not ai_service.response_cache.coalesced:
+        time.sleep(0.001)
+    release.set()
+    leader.join()
+    follower.join()
+    assert sorted(result['status'] for result in results) == ['cancelled', 'timeout']
+    assert len(calls) == 2
+    assert ai_service.ai_admission.stats()['admitted'] == 2
+
+
+def test_cached_answer_is_served_while_every_slot_is_taken(service):
+    calls, _ = service
+    key = ai_service._cache_key('Stay With Me', 'Tell me about Stay With Me')
+    ai_service.response_cache.set(key, {"data": {"response": "cached"}, "status": "success"})
+    ai_service.ai_admission.acquire()
+    results = []
+    ask(results)
+    assert results[0]['data']['response'] == 'cached'
+    ai_service.response_cache.clear()
+    ask(results)
+    assert results[1]['status'] == 'overloaded'
+    assert calls == []
+
+
+def test_cache_stage_excludes_the_requests_own_model_call(service, monkeypatch):
+    stage = ai_service.STAGE_SECONDS.labels('ai', 'cache')
+    before = stage.total
+    monkeypatch.setattr(ai_service, '_admitted_llm_call', lambda *args: time.sleep(0.2) or {"status": "timeout"})
+    ask([])
+    assert stage.total - before < 0.1
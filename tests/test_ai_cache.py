@@ -0,0 +1,114 @@
+import threading
+
+import pytest
+
+from ai_cache import ResponseCache
+
+
+def start_leader(cache, key, compute, **kwargs):
+    """Runs get_or_compute on a thread; returns (thread, results list)."""
+    results = []
+    thread = threading.Thread(target=lambda: results.append(cache.get_or_compute(key, compute, **kwargs)))
+    thread.start()
+    return thread, results
+
+
+def wait_for_inflight(cache, key):
+    while key not in cache._inflight:
+        threading.Event().wait(0.001)
+
+
+def test_followers_share_the_leaders_result():
+    cache = ResponseCache()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return {"data": "answer"}
+
+    leader, leader_results = start_leader(cache, 'k', compute)
+    wait_for_inflight(cache, 'k')
+    follower, follower_results = start_leader(cache, 'k', lambda: pytest.fail("follower must not compute"))
+    while cache.coalesced == 0:
+        threading.Event().wait(0.001)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert leader_results == follower_results == [{"data": "answer"}]
+    assert calls == [1]
+    assert cache.get('k') == {"data": "answer"}
+
+
+def test_unshareable_leader_result_makes_a_follower_recompute():
+    cache = ResponseCache()
+    release = threading.Event()
+    shareable = lambda result: result['status'] != 'cancelled'
+
+    def leader_compute():
+        release.wait(5)
+        return {"status": "cancelled"}
+
+    leader, leader_results = start_leader(cache, 'k', leader_compute, cacheable=lambda r: False, shareable=shareable)
+    wait_for_inflight(cache, 'k')
+    follower, follower_results = start_leader(cache, 'k', lambda: {"status": "success"},
+                                              cacheable=lambda r: False, shareable=shareable)
+    while cache.coalesced == 0:
+        threading.Event().wait(0.001)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert leader_results == [{"status": "cancelled"}]
+    assert follower_results == [{"status": "success"}]
+    assert not cache._inflight
+
+
+def test_leader_failure_reaches_followers_and_is_not_cached():
+    cache = ResponseCache()
+    release = threading.Event()
+
+    def compute():
+        release.wait(5)
+        raise RuntimeError("model down")
+
+    errors = []
+
+    def call(fn):
+        try:
+            cache.get_or_compute('k', fn)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call, args=(compute,))
+    leader.start()
+    wait_for_inflight(cache, 'k')
+    follower = threading.Thread(target=call, args=(lambda: pytest.fail("follower must not compute"),))
+    follower.start()
+    while cache.coalesced == 0:
+        threading.Event().wait(0.001)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert errors == ["model down", "model down"]
+    assert cache.get('k') is None
+    assert cache.get_or_compute('k', lambda: "recovered") == "recovered"
+
+
+def test_uncacheable_results_are_returned_but_not_stored():
+    cache = ResponseCache()
+    assert cache.get_or_compute('k', lambda: {"error": "timeout"}, cacheable=lambda r: 'data' in r) == {"error": "timeout"}
+    assert cache.get('k') is None
+
+
+def test_entries_expire_and_are_evicted_lru(monkeypatch):
+    cache = ResponseCache(max_entries=2, ttl_seconds=10)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)  # Evicts 'b', the least recently used.
+    assert cache.get('b') is None and cache.get('a') == 1
+    import ai_cache
+    now = ai_cache.time.time()
+    monkeypatch.setattr(ai_cache.time, 'time', lambda: now + 11)
+    assert cache.get('a') is None
@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+
+from catalog_responses import EncodedResponse, serve
+
+
+def get(entry, **headers):
+    return serve(entry, SimpleNamespace(headers=headers))
+
+
+def test_each_content_coding_has_its_own_etag():
+    entry = EncodedResponse([{"id": n, "title": "x" * 20} for n in range(50)], last_modified=0)
+    identity = get(entry)
+    gzipped = get(entry, **{'Accept-Encoding': 'gzip'})
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert identity.headers['ETag'] == entry.etag
+    assert gzipped.headers['ETag'] == entry.etag[:-1] + '-gz"'
+    assert identity.headers['Vary'] == gzipped.headers['Vary'] == 'Accept-Encoding'
+
+
+def test_if_none_match_compares_weakly_against_the_selected_variant():
+    entry = EncodedResponse([{"id": n, "title": "x" * 20} for n in range(50)], last_modified=0)
+    gz_etag = entry.etag_for('gzip')
+    revalidated = get(entry, **{'Accept-Encoding': 'gzip', 'If-None-Match': 'W/' + gz_etag})
+    assert revalidated.status_code == 304
+    assert revalidated.headers['ETag'] == gz_etag
+    # A gzip validator does not vouch for the identity body.
+    assert get(entry, **{'If-None-Match': gz_etag}).status_code == 200
+
+
+def test_out_of_range_book_ids_are_unknown():
+    import app as api
+    from catalog_store import encode_cursor
+
+    client = api.app.test_client()
+    huge = 10 ** 20
+    assert client.get(f'/books/{huge}').status_code == 404
+    assert client.get(f'/books?year={huge}').status_code == 400
+    assert client.get(f'/books?cursor={encode_cursor(huge)}').status_code == 400
+    assert api.catalog.get_many([1, huge]).keys() == {1}
@@ -0,0 +1,50 @@
+import sqlite3
+
+import pytest
+
+import consumer
+from consumer import REQUEUE, DeliveryTracker, OrderConsumer
+
+
+@pytest.fixture
+def settled(monkeypatch):
+    """Runs workers inline and records what they hand back and which statuses they publish."""
+    statuses, results = [], []
+    monkeypatch.setattr(consumer, 'notify_status', lambda order_data, status: statuses.append((order_data['order_id'], status)))
+    worker = OrderConsumer(url=None, mode='batch')
+    monkeypatch.setattr(worker, '_hand_back', results.extend)
+    return worker, statuses, results
+
+
+def test_transient_batch_error_requeues_without_a_failure_status(monkeypatch, settled):
+    worker, statuses, results = settled
+
+    def locked(orders):
+        raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(consumer, 'process_order_batch', locked)
+    worker._run_batch([(1, {"order_id": "a"}), (2, {"order_id": "b"})])
+    assert results == [(1, REQUEUE), (2, REQUEUE)]
+    assert statuses == []
+
+
+def test_unexpected_batch_error_reports_each_order_failed(monkeypatch, settled):
+    worker, statuses, results = settled
+
+    def broken(orders):
+        raise KeyError('items')
+
+    monkeypatch.setattr(consumer, 'process_order_batch', broken)
+    worker._run_batch([(1, {"order_id": "a"}), (2, {"order_id": "b"})])
+    assert results == [(1, False), (2, False)]
+    assert statuses == [("a", 'Processing Failed'), ("b", 'Processing Failed')]
+
+
+def test_tracker_requeues_in_delivery_order():
+    tracker = DeliveryTracker()
+    for delivery_tag in (1, 2, 3, 4):
+        tracker.add(delivery_tag)
+    assert tracker.complete([(2, REQUEUE), (4, True)]) == []
+    assert tracker.complete([(1, True), (3, False)]) == [
+        ('ack', 1, True), ('requeue', 2, False), ('nack', 3, False), ('ack', 4, True)]
+    assert len(tracker) == 0
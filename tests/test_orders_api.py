@@ -0,0 +1,116 @@
+import json
+import sqlite3
+
+import pytest
+
+import app as api
+
+
+@pytest.fixture
+def client():
+    api.reservations.restock(1, 10)  # Every test orders a few copies of book 1.
+    return api.app.test_client()
+
+
+def held(client):
+    return client.get('/orders/reservations/stats').get_json()['held']
+
+
+def test_non_string_user_identifier_is_stored_as_string(client):
+    response = client.post('/orders', json={"items": [{"book_id": 1, "quantity": 1}], "user_identifier": 42})
+    assert response.status_code == 201
+    assert response.get_json()['user_identifier'] == '42'
+
+
+def test_invalid_user_identifier_is_rejected_before_reserving(client):
+    before = held(client)
+    response = client.post('/orders', json={"items": [{"book_id": 1, "quantity": 1}], "user_identifier": {"a": 1}})
+    assert response.status_code == 400
+    assert held(client) == before
+
+
+def test_reservation_is_released_when_storing_the_order_fails(client, monkeypatch):
+    before = held(client)
+
+    def fail(record):
+        raise RuntimeError("order store down")
+
+    monkeypatch.setattr(api.orders, 'add', fail)
+    response = client.post('/orders', json={"items": [{"book_id": 1, "quantity": 1}]})
+    assert response.status_code == 500
+    assert held(client) == before
+
+
+def test_bulk_rejects_only_the_order_with_an_invalid_user_identifier(client):
+    before = held(client)
+    response = client.post('/orders/bulk', json={"orders": [
+        {"items": [{"book_id": 1, "quantity": 1}], "user_identifier": 7},
+        {"items": [{"book_id": 1, "quantity": 1}], "user_identifier": [1]},
+    ]})
+    results = response.get_json()['results']
+    assert [result['status'] for result in results] == [201, 400]
+    assert results[0]['order']['user_identifier'] == '7'
+    assert held(client) == before + 1
+
+
+def test_retry_after_a_failed_outbox_write_places_the_order(client, monkeypatch):
+    headers = {'Idempotency-Key': 'retry-after-outbox-failure'}
+    body = {"items": [{"book_id": 1, "quantity": 1}]}
+    monkeypatch.setattr(api, 'send_order_to_queue', lambda message: False)
+    assert client.post('/orders', json=body, headers=headers).status_code == 500
+    monkeypatch.undo()
+
+    retried = client.post('/orders', json=body, headers=headers)
+    assert retried.status_code == 201
+    assert retried.get_json()['status'] == 'Pending'
+    replayed = client.post('/orders', json=body, headers=headers)
+    assert replayed.get_json()['order_id'] == retried.get_json()['order_id']
+
+
+def test_retry_after_a_failed_order_store_write_is_not_stuck(client, monkeypatch):
+    headers = {'Idempotency-Key': 'retry-after-store-failure'}
+    body = {"items": [{"book_id": 1, "quantity": 1}]}
+
+    def fail(record):
+        raise RuntimeError("order store down")
+
+    monkeypatch.setattr(api.orders, 'add', fail)
+    assert client.post('/orders', json=body, headers=headers).status_code == 500
+    monkeypatch.undo()
+    assert client.post('/orders', json=body, headers=headers).status_code == 201
+
+
+def test_bulk_retry_after_a_failed_attempt_places_the_order(client, monkeypatch):
+    order = {"items": [{"book_id": 1, "quantity": 1}], "idempotency_key": "bulk-retry"}
+
+    def fail(messages):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(api.order_outbox, 'append_many', fail)
+    assert client.post('/orders/bulk', json={"orders": [order]}).get_json()['results'][0]['status'] == 500
+    monkeypatch.undo()
+    result = client.post('/orders/bulk', json={"orders": [order]}).get_json()['results'][0]
+    assert result['status'] == 201 and 'replayed' not in result
+
+
+def test_out_of_range_ids_and_quantities_are_client_errors(client):
+    huge = 10 ** 20
+    assert client.post('/orders', json={"items": [{"book_id": huge, "quantity": 1}]}).status_code == 400
+    assert client.post('/orders', json={"items": [{"book_id": 1, "quantity": huge}]}).status_code == 400
+    assert client.post('/orders', json={"items": [{"book_id": 1, "quantity": 2 ** 62},
+                                                  {"book_id": 1, "quantity": 2 ** 62}]}).status_code == 400
+    response = client.post('/orders/bulk', json={"orders": [
+        {"items": [{"book_id": 1, "quantity": 1}]},
+        {"items": [{"book_id": huge, "quantity": 1}]},
+        {"items": [{"book_id": 1, "quantity": huge}]},
+    ]})
+    assert [result['status'] for result in response.get_json()['results']] == [201, 400, 400]
+
+
+def test_ndjson_summary_counts_replays_separately(client):
+    first = {"items": [{"book_id": 1, "quantity": 1}], "idempotency_key": "ndjson-summary"}
+    assert client.post('/orders/bulk', json={"orders": [first]}).get_json()['accepted'] == 1
+    body = '\n'.join(json.dumps(order) for order in (first, {"items": [{"book_id": 1, "quantity": 1}]}))
+    response = client.post('/orders/bulk', data=body, content_type='application/x-ndjson')
+    summary = json.loads(response.get_data(as_text=True).strip().splitlines()[-1])['summary']
+    assert summary == {"accepted": 1, "replayed": 1, "rejected": 0}
@@ -0,0 +1,74 @@
+import pika
+import pytest
+
+from fakes import FakeBroker
+from outbox import OrderOutbox
+from publisher import ORDER_QUEUE_NAME, OrderPublisher, PublishError
+
+
+class ScriptedPublisher:
+    """Stands in for OrderPublisher.publish_batch: each call pops the next scripted outcome."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.batches = []
+
+    def publish_batch(self, messages):
+        self.batches.append([message['n'] for message in messages])
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome(messages) if callable(outcome) else outcome
+
+
+@pytest.fixture
+def outbox_path(tmp_path):
+    return str(tmp_path / 'outbox.db')
+
+
+def test_partial_confirm_deletes_only_the_confirmed_prefix(outbox_path):
+    publisher = ScriptedPublisher(2, 1)
+    outbox = OrderOutbox(outbox_path, publisher, batch_size=10)
+    outbox.append_many([{"n": n} for n in range(3)])
+    assert outbox.flush_once() == (2, False)
+    assert outbox.pending_count() == 1
+    assert outbox.flush_once() == (1, True)
+    assert publisher.batches == [[0, 1, 2], [2]]
+    assert outbox.pending_count() == 0
+
+
+def test_unreachable_broker_keeps_messages_without_counting_attempts(outbox_path):
+    outbox = OrderOutbox(outbox_path, ScriptedPublisher(*[PublishError("down")] * 10), max_attempts=2)
+    outbox.append({"n": 0})
+    for _ in range(10):
+        assert outbox.flush_once() == (0, False)
+    assert outbox.pending_count() == 1
+    assert outbox.dead_letter_count() == 0
+
+
+class RefusingBroker(FakeBroker):
+    """Nacks every message whose body is in ``refused``."""
+
+    def __init__(self, refused):
+        super().__init__()
+        self.refused = refused
+
+    def publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        if body in self.refused:
+            raise pika.exceptions.NackError([])
+        super().publish(exchange, routing_key, body, properties, mandatory)
+
+
+def test_refused_message_is_dead_lettered_and_later_messages_drain(outbox_path):
+    broker = RefusingBroker(refused={'{"n": 1}'})
+    publisher = OrderPublisher('amqp://fake/', connection_factory=broker.connect)
+    outbox = OrderOutbox(outbox_path, publisher, batch_size=10, max_attempts=3)
+    outbox.append_many([{"n": 0}, {"n": 1}, {"n": 2}])
+
+    assert outbox.flush_once() == (1, False)  # n=0 confirmed, n=1 refused (attempt 1).
+    assert outbox.flush_once() == (0, False)  # Attempt 2.
+    assert outbox.flush_once() == (0, False)  # Attempt 3: dead-lettered.
+    assert outbox.dead_letter_count() == 1
+    assert outbox.flush_once() == (1, True)
+    assert outbox.pending_count() == 0
+    assert broker.depth(ORDER_QUEUE_NAME) == 2
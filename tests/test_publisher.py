@@ -0,0 +1,23 @@
+from fakes import FakeBroker
+from publisher import ORDER_QUEUE_NAME, OrderPublisher
+
+
+def test_reconnect_declares_the_queue_again():
+    broker = FakeBroker()
+    publisher = OrderPublisher('amqp://fake/', connection_factory=broker.connect, pool_size=1)
+    assert publisher.publish({"n": 0})
+    # The broker restarts without its data: the queue is gone and the pooled connection is dead.
+    broker.queues.clear()
+    for pooled in publisher._idle:
+        pooled.connection.close()
+    assert publisher.publish({"n": 1})
+    assert broker.depth(ORDER_QUEUE_NAME) == 1
+
+
+def test_queue_deleted_under_a_live_connection_is_declared_again():
+    broker = FakeBroker()
+    publisher = OrderPublisher('amqp://fake/', connection_factory=broker.connect, pool_size=1)
+    assert publisher.publish({"n": 0})
+    del broker.queues[ORDER_QUEUE_NAME]
+    assert publisher.publish_batch([{"n": 1}, {"n": 2}]) == 2
+    assert broker.depth(ORDER_QUEUE_NAME) == 2
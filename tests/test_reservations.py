@@ -0,0 +1,123 @@
+import threading
+
+import pytest
+
+from inventory_store import InventoryStore
+from reservations import IdempotencyConflict, InsufficientStock, ReservationEngine, UnknownReservation
+
+
+@pytest.fixture(params=['striped', 'sqlite'])
+def engine(request, tmp_path):
+    if request.param == 'sqlite':
+        return InventoryStore(str(tmp_path / 'inventory.db'), seed={1: 5, 2: 1})
+    return ReservationEngine({1: 5, 2: 1}, stripes=4)
+
+
+def test_reserve_is_all_or_nothing(engine):
+    reservation, created = engine.reserve([(1, 2), (1, 1)], reference='order-1')
+    assert created and reservation.items == {1: 3}
+    assert engine.available(1) == 2
+    with pytest.raises(InsufficientStock) as raised:
+        engine.reserve([(1, 1), (2, 2)])
+    assert (raised.value.book_id, raised.value.requested, raised.value.available) == (2, 2, 1)
+    assert (engine.available(1), engine.available(2)) == (2, 1)
+
+
+def test_commit_keeps_stock_and_release_returns_it(engine):
+    kept, _ = engine.reserve([(1, 2)])
+    returned, _ = engine.reserve([(1, 3)])
+    engine.commit(kept.reservation_id)
+    engine.release(returned.reservation_id)
+    assert engine.available(1) == 3
+    assert engine.get(kept.reservation_id).status == 'committed'
+    assert engine.get(returned.reservation_id).status == 'released'
+    with pytest.raises(UnknownReservation):
+        engine.release(kept.reservation_id)
+    with pytest.raises(UnknownReservation):
+        engine.commit(returned.reservation_id)
+
+
+def test_expired_reservation_gives_its_stock_back(engine):
+    reservation, _ = engine.reserve([(1, 4)], ttl_seconds=-1)
+    assert engine.available(1) == 1
+    assert engine.expire_due() == 1
+    assert engine.available(1) == 5
+    assert engine.get(reservation.reservation_id).status == 'expired'
+    with pytest.raises(UnknownReservation):
+        engine.commit(reservation.reservation_id)
+
+
+def test_idempotency_key_replays_the_original_reservation(engine):
+    first, created = engine.reserve([(1, 1)], idempotency_key='k')
+    again, created_again = engine.reserve([(1, 1)], idempotency_key='k')
+    assert created and not created_again
+    assert again.reservation_id == first.reservation_id
+    assert engine.available(1) == 4
+    with pytest.raises(IdempotencyConflict):
+        engine.reserve([(1, 2)], idempotency_key='k')
+
+
+def test_commit_orders_settles_held_redelivered_and_released_orders(engine):
+    held, _ = engine.reserve([(1, 1)])
+    released, _ = engine.reserve([(1, 1)])
+    engine.release(released.reservation_id)
+    orders = [{"reservation_id": held.reservation_id, "items": [{"book_id": 1, "quantity": 1}]},
+              {"reservation_id": released.reservation_id, "items": [{"book_id": 1, "quantity": 1}]},
+              {"items": [{"book_id": 2, "quantity": 1}]},
+              {"items": [{"book_id": 2, "quantity": 1}]}]
+    assert engine.commit_orders(orders) == [True, False, True, False]
+    assert engine.commit_orders(orders[:1]) == [True]  # A redelivery does not take stock twice.
+    assert (engine.available(1), engine.available(2)) == (4, 0)
+
+
+def test_concurrent_reservations_never_oversell(engine):
+    engine.restock(3, 50)
+    won = []
+
+    def buyer():
+        for _ in range(25):
+            try:
+                won.append(engine.reserve([(3, 1)])[0])
+            except InsufficientStock:
+                pass
+
+    threads = [threading.Thread(target=buyer) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(won) == 50
+    assert engine.available(3) == 0
+
+
+def test_sqlite_store_is_shared_between_processes(tmp_path):
+    # Two stores on one file stand in for the API and a consumer process.
+    api = InventoryStore(str(tmp_path / 'inventory.db'), seed={1: 5})
+    consumer = InventoryStore(str(tmp_path / 'inventory.db'), seed={1: 100})
+    reservation, _ = api.reserve([(1, 2)])
+    assert consumer.available(1) == 3  # The first seed wins; later ones never overwrite stock.
+    assert consumer.commit_orders([{"reservation_id": reservation.reservation_id,
+                                    "items": [{"book_id": 1, "quantity": 2}]}]) == [True]
+    assert api.get(reservation.reservation_id).status == 'committed'
+    with pytest.raises(UnknownReservation):
+        api.release(reservation.reservation_id)
+    assert api.available(1) == 3
+
+
+def test_forgotten_key_reserves_again_only_after_a_failed_attempt(engine):
+    held, _ = engine.reserve([(1, 1)], idempotency_key='k')
+    assert not engine.forget_key('k', held.reservation_id)
+    engine.release(held.reservation_id)
+    assert engine.forget_key('k', held.reservation_id)
+    again, created = engine.reserve([(1, 1)], idempotency_key='k')
+    assert created and again.reservation_id != held.reservation_id
+    assert engine.reserve([(1, 1)], idempotency_key='k')[0].reservation_id == again.reservation_id
+
+
+def test_sqlite_store_purges_finished_reservations_without_expiries(tmp_path):
+    store = InventoryStore(str(tmp_path / 'inventory.db'), seed={1: 500}, retain_seconds=0, purge_interval=0)
+    for n in range(20):
+        store.commit(store.reserve([(1, 1)], idempotency_key=f'k{n}')[0].reservation_id)
+    store.expire_due()
+    assert store.stats()['committed'] == 0
+    assert store.reserve([(1, 1)], idempotency_key='k0')[1]  # The key went with its reservation.
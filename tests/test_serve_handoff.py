@@ -0,0 +1,103 @@
+import errno
+import os
+import socket
+import sys
+
+import pytest
+
+from serve import HandoffListener, Master, Worker
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'send_fds') or sys.platform == 'win32',
+                                reason="needs SCM_RIGHTS (socket.send_fds)")
+
+
+@pytest.fixture
+def master():
+    master = Master('127.0.0.1', 0, workers=2)
+    yield master
+    master.listener.close()
+    for worker in master.workers:
+        if worker is not None:
+            worker.channel.close()
+
+
+def attach(master, index, pid=0):
+    """Registers a worker slot without forking; returns the worker's end of the hand-off channel."""
+    parent_end, child_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    parent_end.setblocking(False)
+    master.workers[index] = Worker(index, pid, parent_end)
+    return child_end
+
+
+def connect(master):
+    client = socket.create_connection(master.address[:2], timeout=5)
+    master.listener.setblocking(True)
+    try:
+        connection, address = master.listener.accept()
+    finally:
+        master.listener.setblocking(False)
+    master._hand_off(connection, address)
+    return client
+
+
+def test_handed_off_connection_is_served_by_a_forked_worker(master):
+    child_end = attach(master, 0)
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            master.listener.close()
+            master.workers[0].channel.close()
+            listener = HandoffListener(child_end, master.address, master.family)
+            connection, _ = listener.accept()
+            connection.sendall(connection.recv(4).upper())
+            connection.close()
+            try:
+                listener.accept()
+            except OSError as e:
+                status = 0 if e.errno == errno.ESHUTDOWN else 2
+        finally:
+            os._exit(status)
+    child_end.close()
+    master.workers[0].pid = pid
+
+    client = connect(master)
+    client.sendall(b'ping')
+    assert client.recv(4) == b'PING'
+    client.close()
+    master.workers[0].channel.close()  # End of channel: the worker's accept must shut down.
+    master.workers[0] = None
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+    assert (master.handed_off, master.dropped) == (1, 0)
+
+
+def received(end: socket.socket) -> int:
+    """Drains a worker's end of the channel; returns how many connections were handed to it."""
+    end.setblocking(False)
+    count = 0
+    while True:
+        try:
+            _, fds, _, _ = socket.recv_fds(end, 1, 1)
+        except BlockingIOError:
+            return count
+        for fd in fds:
+            os.close(fd)
+        count += len(fds)
+
+
+def test_clients_stick_to_one_worker_and_fail_over(master):
+    ends = [attach(master, 0), attach(master, 1)]
+    sticky = master._route('127.0.0.1')[0].index
+    other = 1 - sticky
+    for _ in range(3):
+        connect(master).close()
+    assert (received(ends[sticky]), received(ends[other])) == (3, 0)
+
+    ends[sticky].close()  # That worker exited; its clients go to the other one.
+    connect(master).close()
+    assert received(ends[other]) == 1
+
+    ends[other].close()
+    connect(master).close()
+    assert (master.handed_off, master.dropped) == (4, 1)
@@ -0,0 +1,36 @@
+import json
+import time
+
+from fakes import FakeBroker
+from status_events import STATUS_EXCHANGE, StatusRelay
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_relay_survives_unexpected_errors_and_bad_messages():
+    broker = FakeBroker()
+    attempts = []
+
+    def connect():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("unexpected")
+        return broker.connect()
+
+    events = []
+    relay = StatusRelay('amqp://fake/', events.append, connection_factory=connect, retry_max=0.05)
+    relay.start()
+    try:
+        wait_until(lambda: broker.exchanges.get(STATUS_EXCHANGE))
+        broker.publish(STATUS_EXCHANGE, '', json.dumps({"events": 5}))
+        broker.publish(STATUS_EXCHANGE, '', json.dumps({"events": [{"order_id": "a", "status": "Processed"}]}))
+        wait_until(lambda: relay.dispatch_once() or events)
+    finally:
+        relay.stop()
+    assert len(attempts) == 2
+    assert events == [{"order_id": "a", "status": "Processed"}]
@@ -0,0 +1,25 @@
+from collections import Counter
+
+import ai_service
+
+
+def test_catalog_titles_are_matched_through_the_index_without_passing_the_list(monkeypatch):
+    books = list(ai_service.books_data.values())
+    title = books[0]['title']
+    assert ai_service.extract_title(f"Tell me about {title}") == title
+
+    authors = Counter(book['author'] for book in books)
+    book = next(book for book in books if authors[book['author']] == 1)
+    scanned = []
+    monkeypatch.setattr(ai_service, '_extract_title_scan', lambda query, titles: scanned.append(titles))
+    # Only the catalog index knows authors; no list is scanned for it.
+    assert ai_service.extract_title(f"What did {book['author']} write?") == book['title']
+    assert scanned == []
+
+
+def test_an_explicit_title_list_is_scanned_even_when_it_equals_the_catalog(monkeypatch):
+    titles = list(ai_service.get_available_book_titles())
+    scanned = []
+    monkeypatch.setattr(ai_service, '_extract_title_scan', lambda query, known: scanned.append(known) or known[0])
+    assert ai_service.extract_title("anything", titles) == titles[0]
+    assert scanned == [titles]
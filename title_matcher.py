@@ -0,0 +1,235 @@
+import unicodedata
+from collections import deque
+from typing import Dict, List, Mapping, Optional, Tuple
+
+
+def normalize_text(text: str) -> str:
+    """
+    Folds text for matching: NFKD-decomposes it, drops combining marks (accents,
+    Yoruba tone marks), casefolds and collapses whitespace. "Ayọ̀bámi" -> "ayobami".
+    """
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return ' '.join(stripped.casefold().split())
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton over normalized patterns. ``longest_match`` returns
+    the longest pattern occurring anywhere in the text (earliest one on ties)
+    in a single pass. Added patterns make the failure links stale until the
+    next search rebuilds them; removed patterns are only tombstoned, so removal
+    never triggers a rebuild.
+    """
+
+    def __init__(self):
+        self._children: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._terminal: List[Optional[str]] = [None]  # pattern ending exactly at this node
+        self._best: List[Optional[str]] = [None]  # longest pattern that is a suffix of this node
+        self._node_of: Dict[str, int] = {}  # every pattern ever added, including tombstoned ones
+        self._removed = set()
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._node_of) - len(self._removed)
+
+    def __contains__(self, pattern: str) -> bool:
+        return pattern in self._node_of and pattern not in self._removed
+
+    @property
+    def tombstones(self) -> int:
+        return len(self._removed)
+
+    def patterns(self) -> List[str]:
+        return [pattern for pattern in self._node_of if pattern not in self._removed]
+
+    def add(self, pattern: str):
+        if not pattern:
+            return
+        if pattern in self._node_of:
+            self._removed.discard(pattern)
+            return
+        node = 0
+        for ch in pattern:
+            child = self._children[node].get(ch)
+            if child is None:
+                child = len(self._children)
+                self._children.append({})
+                self._fail.append(0)
+                self._terminal.append(None)
+                self._best.append(None)
+                self._children[node][ch] = child
+            node = child
+        self._terminal[node] = pattern
+        self._node_of[pattern] = node
+        self._dirty = True
+
+    def discard(self, pattern: str):
+        if pattern in self._node_of:
+            self._removed.add(pattern)
+
+    def _build(self):
+        queue = deque()
+        for child in self._children[0].values():
+            self._fail[child] = 0
+            self._best[child] = self._terminal[child]
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._children[node].items():
+                fallback = self._fail[node]
+                while fallback and ch not in self._children[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._children[fallback].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                # The node's own pattern is always longer than anything reached through its failure link.
+                self._best[child] = self._terminal[child] or self._best[self._fail[child]]
+                queue.append(child)
+        self._dirty = False
+
+    def longest_match(self, text: str) -> Optional[str]:
+        if self._dirty:
+            self._build()
+        children, fail, best, removed = self._children, self._fail, self._best, self._removed
+        node = 0
+        found = None
+        for ch in text:
+            while node and ch not in children[node]:
+                node = fail[node]
+            node = children[node].get(ch, 0)
+            candidate = best[node]
+            while candidate is not None and removed and candidate in removed:
+                # Skip tombstoned patterns by following the output chain to the next shorter one.
+                candidate = best[fail[self._node_of[candidate]]]
+            if candidate is not None and (found is None or len(candidate) > len(found)):
+                found = candidate
+        return found
+
+
+class IncrementalMatcher:
+    """
+    A large automaton plus a small one for recent additions. Additions only
+    rebuild the small automaton; once it (or the tombstone count) grows past
+    ``compact_ratio`` of the large one, everything is folded into a fresh
+    large automaton, so rebuild cost stays amortised as the catalog changes.
+    """
+
+    def __init__(self, compact_ratio: float = 0.05, min_compact: int = 256):
+        self.compact_ratio = compact_ratio
+        self.min_compact = min_compact
+        self._main = AhoCorasick()
+        self._delta = AhoCorasick()
+
+    def __len__(self):
+        return len(self._main) + len(self._delta)
+
+    def add(self, pattern: str):
+        if pattern in self._main:
+            return
+        if pattern in self._main._node_of:
+            self._main.add(pattern)  # revive a tombstoned pattern without touching the trie
+            return
+        self._delta.add(pattern)
+
+    def discard(self, pattern: str):
+        self._main.discard(pattern)
+        self._delta.discard(pattern)
+
+    def _maybe_compact(self):
+        threshold = max(self.min_compact, int(len(self._main) * self.compact_ratio))
+        if len(self._delta) + self._delta.tombstones + self._main.tombstones <= threshold:
+            return
+        merged = AhoCorasick()
+        for pattern in self._main.patterns() + self._delta.patterns():
+            merged.add(pattern)
+        self._main, self._delta = merged, AhoCorasick()
+
+    def longest_match(self, text: str) -> Optional[str]:
+        # Decision: Compact at search time so a bulk load pays for one build, not one per addition.
+        self._maybe_compact()
+        found = self._main.longest_match(text)
+        if len(self._delta):
+            recent = self._delta.longest_match(text)
+            if recent is not None and (found is None or len(recent) > len(found)):
+                found = recent
+        return found
+
+
+class TitleIndex:
+    """
+    Maps free-text queries to catalog titles. Titles are matched first (longest
+    wins); if no title occurs in the query, an author name that identifies
+    exactly one title is used instead. ``sync`` applies only the differences
+    since the last catalog version it saw.
+    """
+
+    def __init__(self):
+        self._titles = IncrementalMatcher()
+        self._authors = IncrementalMatcher()
+        self._title_values: Dict[str, Dict[str, int]] = {}
+        self._author_titles: Dict[str, Dict[str, int]] = {}
+        self._entries: Dict[object, Tuple[str, str]] = {}
+        self.version = None
+
+    @staticmethod
+    def _link(automaton: IncrementalMatcher, table: Dict[str, Dict[str, int]], key: str, value: str):
+        pattern = normalize_text(key)
+        if not pattern:
+            return
+        values = table.setdefault(pattern, {})
+        values[value] = values.get(value, 0) + 1
+        automaton.add(pattern)
+
+    @staticmethod
+    def _unlink(automaton: IncrementalMatcher, table: Dict[str, Dict[str, int]], key: str, value: str):
+        pattern = normalize_text(key)
+        values = table.get(pattern)
+        if not values or value not in values:
+            return
+        values[value] -= 1
+        if values[value] <= 0:
+            del values[value]
+        if not values:
+            del table[pattern]
+            automaton.discard(pattern)
+
+    def _add_entry(self, key, title: str, author: str):
+        self._entries[key] = (title, author)
+        self._link(self._titles, self._title_values, title, title)
+        if author:
+            self._link(self._authors, self._author_titles, author, title)
+
+    def _remove_entry(self, key):
+        title, author = self._entries.pop(key)
+        self._unlink(self._titles, self._title_values, title, title)
+        if author:
+            self._unlink(self._authors, self._author_titles, author, title)
+
+    def sync(self, books: Mapping[object, dict], version=None):
+        """Brings the index in line with ``books`` ({id: {'title', 'author', ...}})."""
+        if version is not None and version == self.version:
+            return
+        current = {}
+        for key, details in books.items():
+            if isinstance(details, dict) and isinstance(details.get('title'), str):
+                author = details.get('author')
+                current[key] = (details['title'], author if isinstance(author, str) else '')
+        for key in [key for key in self._entries if current.get(key) != self._entries[key]]:
+            self._remove_entry(key)
+        for key, (title, author) in current.items():
+            if key not in self._entries:
+                self._add_entry(key, title, author)
+        self.version = version
+
+    def match(self, query: str) -> Optional[str]:
+        normalized = normalize_text(query)
+        pattern = self._titles.longest_match(normalized)
+        if pattern is not None:
+            return next(iter(self._title_values[pattern]))
+        pattern = self._authors.longest_match(normalized)
+        if pattern is not None:
+            titles = self._author_titles[pattern]
+            if len(titles) == 1:
+                return next(iter(titles))
+        return None
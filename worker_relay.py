@@ -0,0 +1,158 @@
+import errno
+import glob
+import json
+import os
+import socket
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from socketio import PubSubManager
+
+from ai_executor import cooperative_sleep
+from instrumentation import get_logger
+
+log = get_logger('API/RELAY')
+
+
+# Datagrams carry a JSON list of messages; larger batches are split (Linux allows ~200KB by default).
+MAX_DATAGRAM_BYTES = 64 * 1024
+
+
+class WorkerRelayManager(PubSubManager):
+    """
+    python-socketio client manager for the API workers of one host (serve.py):
+    every emit, room change and disconnect is handled locally and also sent to
+    the Unix datagram socket of every other worker in ``relay_dir``, so a
+    client receives events whichever worker it is connected to. No broker is
+    involved. Messages published during one pass of the event loop go out as
+    one datagram per peer, since the kernel queues only a few datagrams per
+    socket. Peers are rediscovered every ``refresh_interval`` seconds, so
+    restarted workers join without coordination.
+    """
+
+    name = 'worker-relay'
+
+    def __init__(self, relay_dir: str, refresh_interval: float = 1.0, send_timeout: float = 1.0,
+                 channel: str = 'socketio'):
+        super().__init__(channel=channel)
+        self.relay_dir = relay_dir
+        self.refresh_interval = refresh_interval
+        self.send_timeout = send_timeout
+        self._pid = None
+        self._sender: Optional[socket.socket] = None
+        self._peers: List[str] = []
+        self._peers_at = 0.0
+        self._outgoing: List[Dict[str, Any]] = []
+        self._flushing = False
+        self.sent = 0
+        self.dropped = 0
+
+    @property
+    def address(self) -> str:
+        return os.path.join(self.relay_dir, f"worker-{os.getpid()}.sock")
+
+    def _ensure_process(self):
+        # Decision: The manager is created at import time; ids and sockets belong to the process that uses them.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self.host_id = uuid.uuid4().hex
+            self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._sender.setblocking(False)
+            self._peers_at = 0.0
+            self._outgoing, self._flushing = [], False
+
+    def _peer_addresses(self) -> List[str]:
+        now = time.monotonic()
+        if now - self._peers_at >= self.refresh_interval:
+            own = self.address
+            self._peers = [path for path in glob.glob(os.path.join(self.relay_dir, 'worker-*.sock')) if path != own]
+            self._peers_at = now
+        return self._peers
+
+    def initialize(self):
+        self._ensure_process()
+        super().initialize()
+
+    def emit(self, *args, **kwargs):
+        self._ensure_process()
+        return super().emit(*args, **kwargs)
+
+    def _publish(self, data: Dict[str, Any]):
+        self._ensure_process()
+        self._outgoing.append(data)
+        if not self._flushing:
+            # Decision: Flush once the current green thread yields, so a burst of emits shares one datagram.
+            self._flushing = True
+            self.server.start_background_task(self._flush)
+
+    def _flush(self):
+        try:
+            while self._outgoing:
+                batch, self._outgoing = self._outgoing, []
+                for payload in self._datagrams(batch):
+                    for peer in self._peer_addresses():
+                        self._send(payload, peer)
+        finally:
+            self._flushing = False
+
+    @staticmethod
+    def _datagrams(batch: List[Dict[str, Any]]) -> List[bytes]:
+        encoded = [json.dumps(message, separators=(',', ':')).encode('utf-8') for message in batch]
+        datagrams, current, size = [], [], 2
+        for message in encoded:
+            if current and size + len(message) + 1 > MAX_DATAGRAM_BYTES:
+                datagrams.append(b'[' + b','.join(current) + b']')
+                current, size = [], 2
+            current.append(message)
+            size += len(message) + 1
+        if current:
+            datagrams.append(b'[' + b','.join(current) + b']')
+        return datagrams
+
+    def _send(self, payload: bytes, peer: str):
+        deadline = time.monotonic() + self.send_timeout
+        delay = 0.001
+        while True:
+            try:
+                self._sender.sendto(payload, peer)
+                self.sent += 1
+                return
+            except BlockingIOError:
+                # The peer's receive queue is full; it drains as soon as its event loop runs.
+                if time.monotonic() >= deadline:
+                    break
+                cooperative_sleep(delay)
+                delay = min(delay * 2, 0.05)
+            except (ConnectionRefusedError, FileNotFoundError):
+                self._peers_at = 0.0  # A worker exited; rediscover on the next publish.
+                return
+            except OSError as e:
+                if e.errno != errno.EMSGSIZE:
+                    log.warning("Could not relay to %s: %s", peer, e)
+                    return
+                log.error("Dropping a %s-byte SocketIO relay message (too large).", len(payload))
+                break
+        self.dropped += 1
+        log.warning("Dropped a SocketIO relay message for %s.", peer)
+
+    def _listen(self):
+        """Yields messages from the other workers; runs as a SocketIO background task (green thread)."""
+        from eventlet.green import socket as green_socket
+
+        address = self.address
+        if os.path.exists(address):
+            os.unlink(address)
+        receiver = green_socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        receiver.bind(address)
+        log.info("Relaying SocketIO events through %s.", address)
+        try:
+            while True:
+                yield from json.loads(receiver.recv(1 << 20))
+        finally:
+            receiver.close()
+            if os.path.exists(address):
+                os.unlink(address)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"peers": len(self._peers), "sent": self.sent, "dropped": self.dropped}